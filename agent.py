@@ -1,11 +1,22 @@
 # agent.py - VERSÃO V21 (CORREÇÃO DE TÍTULOS + ESTRUTURA BLINDADA)
 import os
 import json
+import hashlib
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from rag_manager import get_retriever
+import rag_manager
 import database
+import price_index
+import query_filters
+import category_index
+import context_packer
+import lexical_index
+import product_families
+from langchain_core.documents import Document
+from query_cache import SingleFlight, normalize_query
 
 # --- CONFIGURAÇÃO DE LINKS ---
 WHATSAPP_SUPPORT_LINK = "https://api.whatsapp.com/send?phone=555199013851&text=Ol%C3%A1%2C%20vim%20pelo%20site%20e%20preciso%20de%20ajuda"
@@ -39,6 +50,7 @@ Sua missão é encantar, fazer o cliente sorrir e vender os melhores produtos.
 - Use APENAS os dados do CONTEXTO.
 - **Imagens:** Se o link da imagem estiver vazio ou quebrado, NÃO mostre a linha 🖼️.
 - **Links:** Mantenha o link de compra exato.
+- **Variações:** Se o produto tiver "variacoes" (outros tamanhos/cores), cite-as numa linha curta com o preço de cada uma, sem repetir o bloco do produto.
 
 # SUPORTE HUMANO:
 SOMENTE se pedirem "falar com humano" ou "suporte", use este link:
@@ -67,10 +79,21 @@ Usuário: {question}
 Busca Otimizada:
 """
 
+# Versão do prompt na chave do cache de respostas: editar o prompt (ou o modelo) invalida tudo
+CHAT_MODEL = "gpt-4o"
+PROMPT_VERSION = hashlib.sha1(f"{CHAT_MODEL}|{AGENT_PROMPT_TEMPLATE}".encode("utf-8")).hexdigest()[:12]
+REWRITE_VERSION = hashlib.sha1(f"{CHAT_MODEL}|{REWRITE_PROMPT_TEMPLATE}".encode("utf-8")).hexdigest()[:12]
+# Busca especulativa: a pergunta crua é buscada enquanto o LLM reescreve
+SPECULATIVE_WORKERS = int(os.environ.get("SPECULATIVE_WORKERS", "8"))
+REWRITE_SIMILARITY = 0.6 # Reescrita com termos tão parecidos (Jaccard) não justifica segunda busca
+MAX_VARIANTS = 6 # Outras variações (tamanho/cor) listadas junto do produto no contexto
+
 class EverpetzAgent:
     def __init__(self):
         # Temperature 0.6: Equilíbrio perfeito entre criatividade (piadas) e precisão (dados)
-        self.llm = ChatOpenAI(model="gpt-4o", temperature=0.6)
+        # Cliente HTTP compartilhado com os embeddings (keep-alive entre mensagens)
+        self.llm = ChatOpenAI(model=CHAT_MODEL, temperature=0.6, http_client=rag_manager.get_http_client(),
+                              http_async_client=rag_manager.get_async_http_client())
         
         self.main_prompt = PromptTemplate(
             template=AGENT_PROMPT_TEMPLATE,
@@ -82,19 +105,74 @@ class EverpetzAgent:
             input_variables=["chat_history", "question"]
         )
 
+        # Chains montadas uma vez (são thread-safe) e aquecimento da store de leitura
+        self.rewrite_chain = (self.rewrite_prompt | self.llm | StrOutputParser())
+        self.main_chain = (self.main_prompt | self.llm | StrOutputParser())
+        self.answers_in_flight = SingleFlight() # Mesma pergunta em rajada: uma chamada ao LLM só
+        self.retrieval_pool = ThreadPoolExecutor(max_workers=SPECULATIVE_WORKERS, thread_name_prefix="retrieval")
+        try:
+            rag_manager.get_read_store()
+        except Exception as e:
+            print(f"⚠️ Banco vetorial ainda indisponível: {e}")
+
     def format_chat_history(self, history):
         if not history: return ""
         recent_history = history[-4:] 
         return "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in recent_history])
 
+    def format_offer(self, offer):
+        """Preço vivo: promoção vigente aparece com o preço cheio ao lado."""
+        price = price_index.current_price(offer)
+        text = rag_manager.format_price(price, offer["currency"])
+        if price_index.sale_is_active(offer) and offer["price"] and offer["sale_price"] < offer["price"]:
+            text += f" (de {rag_manager.format_price(offer['price'], offer['currency'])})"
+        return text
+
+    def format_variants(self, record, family):
+        """Outras variações em estoque da família do produto: [{nome, preco, link}]."""
+        variants = []
+        for variant in family:
+            if variant["id"] == record["id"]: continue
+            offer = price_index.get_offer(variant["id"], variant["link"]) if price_index.is_loaded() else None
+            if price_index.is_loaded() and (offer is None or not price_index.in_stock(offer)): continue
+            price = self.format_offer(offer) if offer else rag_manager.format_price(variant["price"], variant.get("currency"))
+            variants.append({"nome": variant["title"], "preco": price, "link": (variant["link"] or "").strip()})
+            if len(variants) >= MAX_VARIANTS: break
+        return variants
+
     def format_docs(self, docs):
-        """Formata JSON e prioriza produtos com imagem (Lógica V15 preservada)"""
+        """
+        Contexto em JSON compacto, por relevância, dentro do orçamento de tokens (context_packer).
+        Variações do mesmo produto (tamanho, cor, peso) viram um item só, com a lista em "variacoes".
+        """
         if not docs: return "[]"
+
+        # Dados do produto vêm do catálogo (lookup por id), não do texto indexado
+        catalog = database.get_products_by_ids({d.metadata["product_id"] for d in docs if d.metadata.get("product_id")})
+        families = database.get_family_variants({product_families.record_family(r) for r in catalog.values()})
         
-        json_items = []
+        entries = []
+        seen_families = set()
         for doc in docs:
             meta = doc.metadata
             content = doc.page_content
+            record = catalog.get(meta.get("product_id"))
+            family_id = product_families.record_family(record) if record else None
+            if family_id in seen_families: continue # Já entrou como variação de um item mais relevante
+            if record:
+                meta = {
+                    **meta,
+                    "title": record["title"],
+                    "link": record["link"],
+                    "image": record["image"] or "",
+                }
+
+            # Preço/promoção/estoque do momento (price_index), não o congelado no Chroma
+            if meta.get("type") == "product" and price_index.is_loaded():
+                offer = price_index.get_offer(meta.get("product_id"), meta.get("link"))
+                if offer is None or not price_index.in_stock(offer):
+                    continue # Saiu do catálogo ou esgotou: não oferece ao cliente
+                meta = {**meta, "price": self.format_offer(offer)}
             
             # Limpeza de Imagem (Mantida integralmente da V15)
             raw_image = meta.get('image', '')
@@ -108,48 +186,294 @@ class EverpetzAgent:
                     "nome": meta.get('title', 'Produto'),
                     "preco": meta.get('price', 'Consulte'),
                     "link": meta.get('link', '#').strip(),
-                    "imagem": clean_image,
-                    "descricao": content.strip()[:400]
                 }
-                json_items.append(item)
+                if clean_image: item["imagem"] = clean_image # Vazia: o prompt já manda omitir a linha 🖼️
+                variants = self.format_variants(record, families.get(family_id, [])) if record else []
+                if variants: item["variacoes"] = variants
+                # O texto indexado começa pelo título, que já vai em "nome"
+                indexed_title = doc.metadata.get("title") or ""
+                if indexed_title and content.startswith(indexed_title): content = content[len(indexed_title):]
             else:
-                item = {"tipo": "INFO", "conteudo": content.strip()}
-                json_items.append(item)
-        return json.dumps(json_items, ensure_ascii=False, indent=2)
+                item = {"tipo": "INFO"}
+            if family_id: seen_families.add(family_id)
+            entries.append((item, content.strip(), meta.get("relevance")))
+        return context_packer.pack(entries)
 
-    def get_response(self, user_query, chat_history, session_settings):
-        agent_name = session_settings.get("agent_name", "Bob")
-        formatted_history = self.format_chat_history(chat_history)
+    def browse_docs(self, user_query, has_history):
+        """
+        Pergunta de navegação ("brinquedos para gato"): resumo da categoria + vitrine pré-calculada
+        da árvore de categorias, sem rewrite e sem busca vetorial. None se não for o caso.
+        """
+        request = category_index.browse_request(user_query, has_history)
+        if not request: return None
+        species, kind, constraints = request
+        node = category_index.get_node(species, kind)
+        product_ids = category_index.pick_products(species, kind, constraints)
+        if not node or not product_ids: return None
 
-        print("🔌 Conectando ao Banco Vetorial...")
-        retriever = get_retriever()
-        
-        rewrite_chain = (self.rewrite_prompt | self.llm | StrOutputParser())
-        main_chain = (self.main_prompt | self.llm | StrOutputParser())
+        catalog = database.get_products_by_ids(product_ids)
+        docs = [Document(page_content=category_index.describe_node(node), metadata={"type": "info"})]
+        docs += [rag_manager.product_to_document(catalog[pid]) for pid in product_ids if pid in catalog]
+        print(f"🗂️ Navegação '{node['label']}': {len(docs) - 1} produtos da árvore (sem busca vetorial).")
+        return docs
+
+    def needs_rewrite(self, user_query, chat_history):
+        """
+        Heurística local: com histórico sempre reescreve ("e para gato?"); sem histórico, frase longa
+        já é descritiva e frase que cita o tipo de produto ("ração golden filhote") já tem as palavras-chave.
+        """
+        if chat_history: return True
+        if len(user_query.split()) >= 8: return False
+        return not query_filters.detect_types(user_query)
 
-        # Passo 1: Refinamento de Busca
+    def rewrite_key(self, user_query, formatted_history):
+        return json.dumps([normalize_query(user_query), formatted_history, REWRITE_VERSION], ensure_ascii=False)
+
+    def rewrite_query(self, user_query, formatted_history):
+        """Busca reescrita pelo LLM, com cache (mesma pergunta + mesmo histórico = mesma reescrita)."""
+        key = self.rewrite_key(user_query, formatted_history)
+        cache = rag_manager.get_rewrite_cache()
+        search_query = cache.get(key)
+        if search_query is None:
+            search_query = self.rewrite_chain.invoke({
+                "chat_history": formatted_history,
+                "question": user_query
+            })
+            cache.set(key, search_query)
+        print(f"🔄 Query: '{search_query}'")
+        return search_query
+
+    async def arewrite_query(self, user_query, formatted_history):
+        key = self.rewrite_key(user_query, formatted_history)
+        cache = rag_manager.get_rewrite_cache()
+        search_query = cache.get(key)
+        if search_query is None:
+            search_query = await self.rewrite_chain.ainvoke({
+                "chat_history": formatted_history,
+                "question": user_query
+            })
+            cache.set(key, search_query)
+        print(f"🔄 Query: '{search_query}'")
+        return search_query
+
+    def search_docs(self, user_query, chat_history, formatted_history):
+        """
+        Busca vetorial/híbrida (espécie / tipo de produto / faixa de preço no filtro do Chroma).
+        A pergunta crua é buscada em paralelo com a reescrita; a reescrita só gera segunda busca
+        se mudar de fato os termos ou o filtro, e os dois resultados são fundidos.
+        """
+        raw_constraints = query_filters.parse_constraints(user_query)
+        speculative = self.retrieval_pool.submit(rag_manager.retrieve, user_query, raw_constraints)
+
+        # Passo 1: Refinamento de Busca (enquanto a busca crua roda)
         search_query = user_query
-        # Mantemos a lógica agressiva de busca se a frase for curta ou tiver histórico
-        if chat_history or len(user_query.split()) < 8: 
+        if self.needs_rewrite(user_query, chat_history):
             try:
-                search_query = rewrite_chain.invoke({
-                    "chat_history": formatted_history,
-                    "question": user_query
-                })
-                print(f"🔄 Query: '{search_query}'")
-            except: pass
-
-        # Passo 2: Busca Vetorial
-        docs = retriever.invoke(search_query)
-        context_text = self.format_docs(docs)
+                search_query = self.rewrite_query(user_query, formatted_history)
+            except Exception as e:
+                print(f"⚠️ Reescrita falhou, seguindo com a pergunta original: {e}")
 
-        # Passo 3: Resposta Final
-        response = main_chain.invoke({
+        try:
+            raw_docs = speculative.result()
+        except Exception as e:
+            print(f"⚠️ Busca especulativa falhou: {e}")
+            raw_docs = None
+        return self.finish_search(user_query, raw_constraints, raw_docs, search_query)
+
+    async def asearch_docs(self, user_query, chat_history, formatted_history):
+        """search_docs com a reescrita via ainvoke; as buscas (Chroma é síncrono) vão para threads."""
+        raw_constraints = query_filters.parse_constraints(user_query)
+        speculative = asyncio.ensure_future(asyncio.to_thread(rag_manager.retrieve, user_query, raw_constraints))
+
+        search_query = user_query
+        if self.needs_rewrite(user_query, chat_history):
+            try:
+                search_query = await self.arewrite_query(user_query, formatted_history)
+            except Exception as e:
+                print(f"⚠️ Reescrita falhou, seguindo com a pergunta original: {e}")
+
+        try:
+            raw_docs = await speculative
+        except Exception as e:
+            print(f"⚠️ Busca especulativa falhou: {e}")
+            raw_docs = None
+        return await asyncio.to_thread(self.finish_search, user_query, raw_constraints, raw_docs, search_query)
+
+    def finish_search(self, user_query, raw_constraints, raw_docs, search_query):
+        # Passo 2: segunda busca só se a reescrita trouxe algo novo
+        constraints = query_filters.merge_constraints(raw_constraints, query_filters.parse_constraints(search_query))
+        if raw_docs is not None and constraints == raw_constraints and self.similar_queries(user_query, search_query):
+            return raw_docs
+        rewritten_docs = rag_manager.retrieve(search_query, constraints)
+        if not raw_docs: return rewritten_docs
+        return rag_manager.merge_results(rewritten_docs, raw_docs)
+
+    def similar_queries(self, original, rewritten):
+        """Mesmos termos (sem acento/stopwords), ou quase: a segunda busca daria o mesmo resultado."""
+        a, b = set(lexical_index.tokenize(original)), set(lexical_index.tokenize(rewritten))
+        if not b or b <= a: return True
+        return len(a & b) / len(a | b) >= REWRITE_SIMILARITY
+
+    def shortcut_docs(self, user_query, chat_history):
+        """Documentos dos atalhos (índice lexical, árvore de categorias), ou None."""
+        # Atalho: busca por nome/marca ("simparic", título exato) responde pelo índice BM25.
+        # Vem antes da vitrine: um nome de produto nunca é navegação por categoria
+        docs = None
+        try:
+            docs = rag_manager.lexical_fast_path(user_query, query_filters.parse_constraints(user_query))
+        except Exception as e:
+            print(f"⚠️ Atalho lexical indisponível: {e}")
+
+        # Atalho: navegação por categoria responde direto da árvore pré-calculada
+        if docs is None:
+            docs = self.browse_docs(user_query, bool(chat_history))
+        return docs
+
+    def prepare(self, user_query, chat_history, session_settings):
+        """(entradas da chain principal, chave do cache de respostas ou None)."""
+        formatted_history = self.format_chat_history(chat_history)
+        docs = self.shortcut_docs(user_query, chat_history)
+        if docs is None:
+            docs = self.search_docs(user_query, chat_history, formatted_history)
+        return self.build_inputs(user_query, chat_history, session_settings, formatted_history, docs)
+
+    async def aprepare(self, user_query, chat_history, session_settings):
+        formatted_history = self.format_chat_history(chat_history)
+        docs = await asyncio.to_thread(self.shortcut_docs, user_query, chat_history)
+        if docs is None:
+            docs = await self.asearch_docs(user_query, chat_history, formatted_history)
+        return await asyncio.to_thread(self.build_inputs, user_query, chat_history, session_settings, formatted_history, docs)
+
+    def build_inputs(self, user_query, chat_history, session_settings, formatted_history, docs):
+        agent_name = session_settings.get("agent_name", "Bob")
+        context_text = self.format_docs(docs)
+        inputs = {
             "context": context_text,
             "chat_history": formatted_history,
             "question": user_query,
             "agent_name": agent_name,
             "whatsapp_link": WHATSAPP_SUPPORT_LINK
-        })
+        }
+        # Primeira pergunta (sem histórico): resposta reaproveitável para o mesmo contexto
+        if chat_history or rag_manager.ANSWER_CACHE_TTL <= 0:
+            return inputs, None
+        return inputs, self.answer_key(user_query, context_text, agent_name)
+
+    def get_response(self, user_query, chat_history, session_settings):
+        inputs, key = self.prepare(user_query, chat_history, session_settings)
+
+        # Passo 3: Resposta Final
+        if key is None:
+            return self.main_chain.invoke(inputs)
+        cache = rag_manager.get_answer_cache()
+        response = cache.get(key)
+        if response is not None:
+            print(f"💬 Resposta do cache para '{user_query}'.")
+            return response
+
+        def generate_and_store():
+            response = self.main_chain.invoke(inputs)
+            cache.set(key, response)
+            return response
+        return self.answers_in_flight.do(key, generate_and_store)
+
+    def stream_response(self, user_query, chat_history, session_settings):
+        """
+        Mesma resposta de get_response, entregue em pedaços conforme o LLM gera (chat em streaming).
+        Resposta em cache ou já sendo gerada por outro pedido idêntico sai de uma vez só.
+        """
+        inputs, key = self.prepare(user_query, chat_history, session_settings)
+        if key is None:
+            yield from self.main_chain.stream(inputs)
+            return
+
+        cache = rag_manager.get_answer_cache()
+        response = cache.get(key)
+        if response is not None:
+            print(f"💬 Resposta do cache para '{user_query}'.")
+            yield response
+            return
+
+        call, leader = self.answers_in_flight.begin(key)
+        if not leader:
+            yield self.answers_in_flight.wait(call)
+            return
+        parts = []
+        try:
+            for part in self.main_chain.stream(inputs):
+                parts.append(part)
+                yield part
+        except BaseException as e:
+            # Inclui o cliente fechando a conexão (GeneratorExit): quem esperava não fica preso
+            self.answers_in_flight.finish(key, call, error=e if isinstance(e, Exception) else RuntimeError("Resposta interrompida."))
+            raise
+        response = "".join(parts)
+        cache.set(key, response)
+        self.answers_in_flight.finish(key, call, response)
+
+    # --- VERSÃO ASSÍNCRONA (roda no loop do agent_runtime, cliente HTTP assíncrono compartilhado) ---
+    async def aget_response(self, user_query, chat_history, session_settings):
+        inputs, key = await self.aprepare(user_query, chat_history, session_settings)
+        if key is None:
+            return await self.main_chain.ainvoke(inputs)
+        cache = rag_manager.get_answer_cache()
+        response = cache.get(key)
+        if response is not None:
+            print(f"💬 Resposta do cache para '{user_query}'.")
+            return response
+
+        call, leader = self.answers_in_flight.begin(key)
+        if not leader:
+            return await asyncio.to_thread(self.answers_in_flight.wait, call) # Sem travar o loop
+        try:
+            response = await self.main_chain.ainvoke(inputs)
+        except BaseException as e:
+            self.answers_in_flight.finish(key, call, error=e if isinstance(e, Exception) else RuntimeError("Resposta interrompida."))
+            raise
+        cache.set(key, response)
+        self.answers_in_flight.finish(key, call, response)
+        return response
+
+    async def astream_response(self, user_query, chat_history, session_settings):
+        inputs, key = await self.aprepare(user_query, chat_history, session_settings)
+        if key is None:
+            async for part in self.main_chain.astream(inputs):
+                yield part
+            return
+
+        cache = rag_manager.get_answer_cache()
+        response = cache.get(key)
+        if response is not None:
+            print(f"💬 Resposta do cache para '{user_query}'.")
+            yield response
+            return
+
+        call, leader = self.answers_in_flight.begin(key)
+        if not leader:
+            yield await asyncio.to_thread(self.answers_in_flight.wait, call)
+            return
+        parts = []
+        try:
+            async for part in self.main_chain.astream(inputs):
+                parts.append(part)
+                yield part
+        except BaseException as e:
+            # Inclui o cancelamento quando o cliente fecha a conexão
+            self.answers_in_flight.finish(key, call, error=e if isinstance(e, Exception) else RuntimeError("Resposta interrompida."))
+            raise
+        response = "".join(parts)
+        cache.set(key, response)
+        self.answers_in_flight.finish(key, call, response)
 
-        return response
\ No newline at end of file
+    def answer_key(self, user_query, context_text, agent_name):
+        """
+        Chave do cache de respostas: pergunta normalizada + impressão digital do contexto (preços vivos
+        inclusos) + configurações + geração. Pedidos idênticos simultâneos esperam a mesma chamada.
+        """
+        return json.dumps([
+            normalize_query(user_query),
+            hashlib.sha1(context_text.encode("utf-8")).hexdigest(),
+            agent_name,
+            PROMPT_VERSION,
+            rag_manager.live_generation(),
+        ], ensure_ascii=False)
\ No newline at end of file
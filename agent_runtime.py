@@ -0,0 +1,110 @@
+# agent_runtime.py - LOOP ASYNCIO DEDICADO PARA O AGENTE (CONCORRÊNCIA LIMITADA)
+# Os callbacks do Dash/Flask são síncronos. Em vez de cada chat segurar uma thread fazendo I/O
+# bloqueante com a OpenAI, as conversas rodam como corrotinas num loop único (thread própria),
+# com um cliente HTTP assíncrono compartilhado. No máximo AGENT_MAX_CONCURRENCY conversas ao
+# mesmo tempo; as demais esperam na fila até AGENT_QUEUE_TIMEOUT segundos.
+import os
+import queue
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+AGENT_MAX_CONCURRENCY = int(os.environ.get("AGENT_MAX_CONCURRENCY", "24"))
+AGENT_QUEUE_TIMEOUT = float(os.environ.get("AGENT_QUEUE_TIMEOUT", "30"))
+# Trechos ainda síncronos (Chroma, SQLite, diskcache) rodam neste pool via asyncio.to_thread
+AGENT_BLOCKING_WORKERS = int(os.environ.get("AGENT_BLOCKING_WORKERS", str(AGENT_MAX_CONCURRENCY * 2)))
+
+class AgentBusyError(Exception):
+    """Fila cheia: a conversa esperou AGENT_QUEUE_TIMEOUT sem conseguir vaga."""
+
+_lock = threading.Lock()
+_loop = None
+_slots = None
+_waiting = 0
+_active = 0
+
+def get_loop():
+    """Loop do agente, criado na primeira chamada numa thread daemon."""
+    global _loop, _slots
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=AGENT_BLOCKING_WORKERS, thread_name_prefix="agent-io"))
+            threading.Thread(target=loop.run_forever, name="agent-loop", daemon=True).start()
+            _slots = asyncio.run_coroutine_threadsafe(_make_semaphore(), loop).result()
+            _loop = loop
+        return _loop
+
+async def _make_semaphore():
+    return asyncio.Semaphore(AGENT_MAX_CONCURRENCY) # Criado dentro do loop que vai usá-lo
+
+# Contadores só mudam dentro do loop (uma thread): sem lock
+async def _acquire():
+    global _waiting, _active
+    _waiting += 1
+    try:
+        await asyncio.wait_for(_slots.acquire(), AGENT_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise AgentBusyError(f"Nenhuma vaga em {AGENT_QUEUE_TIMEOUT:.0f}s ({AGENT_MAX_CONCURRENCY} conversas em andamento).")
+    finally:
+        _waiting -= 1
+    _active += 1
+
+def _release():
+    global _active
+    _active -= 1
+    _slots.release()
+
+async def _limited(coro):
+    try:
+        await _acquire()
+    except BaseException:
+        coro.close()
+        raise
+    try:
+        return await coro
+    finally:
+        _release()
+
+def run(coro):
+    """Roda a corrotina no loop do agente (respeitando o limite) e devolve o resultado."""
+    return asyncio.run_coroutine_threadsafe(_limited(coro), get_loop()).result()
+
+def stream(async_iterable):
+    """
+    Consome um async generator no loop do agente e entrega os itens como um generator comum
+    (para o Response do Flask). Se quem consome parar no meio, a tarefa no loop é cancelada.
+    """
+    loop = get_loop()
+    items = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            await _acquire()
+        except BaseException as e:
+            items.put((done, e))
+            return
+        try:
+            async for item in async_iterable:
+                items.put((item, None))
+            items.put((done, None))
+        except BaseException as e:
+            items.put((done, e))
+        finally:
+            _release()
+
+    future = asyncio.run_coroutine_threadsafe(pump(), loop)
+    try:
+        while True:
+            item, error = items.get()
+            if item is done:
+                if error is not None and not isinstance(error, asyncio.CancelledError): raise error
+                return
+            yield item
+    finally:
+        if not future.done(): future.cancel()
+
+def stats():
+    """Conversas ocupando vaga e esperando na fila (painel)."""
+    return {"active": _active, "waiting": _waiting, "limit": AGENT_MAX_CONCURRENCY}
@@ -0,0 +1,120 @@
+// chat_stream.js - RESPOSTA DO AGENTE EM STREAMING (SSE)
+// Chamado pelos callbacks clientside do dashboard quando a última mensagem é "thinking...".
+// Os tokens vão para um <div> próprio dentro da bolha do assistente (o spinner do React só é
+// escondido, nunca removido); no fim, a resposta completa é gravada no store (set_props), o Dash
+// re-renderiza a bolha em Markdown, como antes, e o <div> do streaming sai quando ela chega.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    chat: {
+        stream_reply: function (history, sessionId, settings, containerId, signalId) {
+            const noUpdate = window.dash_clientside.no_update;
+            if (!history || history.length < 2 || history[history.length - 1].content !== "thinking...") {
+                return noUpdate;
+            }
+            const ctx = window.dash_clientside.callback_context;
+            const storeId = ctx.triggered[0].prop_id.split(".")[0];
+
+            // Mesma pergunta disparando o callback duas vezes: um stream só
+            window._chatStreams = window._chatStreams || {};
+            const turnKey = storeId + ":" + history.length;
+            if (window._chatStreams[storeId] === turnKey) return noUpdate;
+            window._chatStreams[storeId] = turnKey;
+
+            streamReply(history, sessionId, settings, containerId)
+                .then(function (answer) { finish(answer); })
+                .catch(function (error) {
+                    console.error("Erro no streaming do chat:", error);
+                    finish("Desculpe, tive um problema técnico ao processar sua solicitação. Tente novamente.");
+                });
+
+            function finish(answer) {
+                const updated = history.slice();
+                updated[updated.length - 1] = {role: "assistant", content: answer};
+                window._chatStreams[storeId] = null;
+                removeStreamWhenRendered(containerId);
+                window.dash_clientside.set_props(storeId, {data: updated});
+                if (signalId) {
+                    window.dash_clientside.set_props(signalId, {data: "conversation_updated_" + Date.now() / 1000});
+                }
+            }
+            return noUpdate;
+        }
+    }
+});
+
+function chatStreamUrl() {
+    // Respeita o prefixo do Dash (requests_pathname_prefix) quando o app não está na raiz
+    let prefix = "/";
+    const config = document.getElementById("_dash-config");
+    if (config) {
+        try { prefix = JSON.parse(config.textContent).requests_pathname_prefix || "/"; } catch (e) { }
+    }
+    return prefix + "chat/stream";
+}
+
+function streamTarget(containerId) {
+    const container = document.getElementById(containerId);
+    if (!container) return null;
+    const bodies = container.querySelectorAll(".card-body");
+    if (!bodies.length) return null;
+    const body = bodies[bodies.length - 1];
+    let target = body.querySelector(".chat-stream-text");
+    if (!target) {
+        for (const child of body.children) child.style.display = "none";
+        target = document.createElement("div");
+        target.className = "chat-stream-text";
+        target.style.whiteSpace = "pre-wrap";
+        body.appendChild(target);
+    }
+    return target;
+}
+
+function removeStreamWhenRendered(containerId) {
+    const container = document.getElementById(containerId);
+    const target = container && container.querySelector(".chat-stream-text");
+    if (!target) return;
+    const body = target.parentNode;
+    const observer = new MutationObserver(function () {
+        // A bolha em Markdown chegou (ou a lista foi refeita): o texto provisório sai
+        observer.disconnect();
+        target.remove();
+    });
+    observer.observe(body, {childList: true});
+    observer.observe(container, {childList: true});
+}
+
+async function streamReply(history, sessionId, settings, containerId) {
+    const response = await fetch(chatStreamUrl(), {
+        method: "POST",
+        headers: {"Content-Type": "application/json", "Accept": "text/event-stream"},
+        body: JSON.stringify({
+            question: history[history.length - 2].content,
+            history: history.slice(0, -2),
+            session_id: sessionId,
+            settings: settings || {},
+        }),
+    });
+    if (!response.ok || !response.body) throw new Error("HTTP " + response.status);
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let text = "";
+    while (true) {
+        const {value, done} = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, {stream: true});
+        let end;
+        while ((end = buffer.indexOf("\n\n")) >= 0) {
+            const event = buffer.slice(0, end);
+            buffer = buffer.slice(end + 2);
+            if (!event.startsWith("data: ")) continue;
+            const data = JSON.parse(event.slice(6));
+            if (data.done) return data.answer;
+            text += data.token;
+            const target = streamTarget(containerId);
+            if (target) target.textContent = text; // Markdown só no fim, quando o Dash re-renderiza
+        }
+    }
+    if (!text) throw new Error("Stream encerrado sem resposta");
+    return text;
+}
@@ -0,0 +1,370 @@
+# bench_ingestion.py - BENCHMARK DA INGESTÃO DE FEEDS (tempo + memória, resultado em JSON)
+# Fixture: google-shopping.xml (810 produtos) e feeds sintéticos gerados a partir dele.
+#   python bench_ingestion.py                                  # 810, 10k, 100k e 1M produtos
+#   python bench_ingestion.py --sizes 810,10000 --tracemalloc   # + pico do heap Python por etapa
+#   python bench_ingestion.py --compare bench_results/antes.json bench_results/depois.json
+# Cada tamanho roda num processo próprio (banco SQLite, Chroma e cache de embeddings temporários),
+# com embeddings determinísticos locais (fake_vector): sem internet, sem custo, sem variação da API.
+# Etapas com Chroma (chunking, gravação, process_product_feed) só até --max-index-size.
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+FIXTURE_FEED = "google-shopping.xml"
+RESULTS_DIR = "bench_results"
+DEFAULT_SIZES = "810,10000,100000,1000000"
+DEFAULT_MAX_INDEX_SIZE = 100000 # Acima disso o Chroma leva horas: mede só parse e catálogo
+DEFAULT_DIM = 256 # Dimensão dos vetores falsos (a OpenAI usa 1536; menor = benchmark mais rápido)
+REPRICE_EVERY = 10 # Feed da "atualização diária": 1 em cada 10 produtos muda de preço
+# Métricas comparadas pelo --compare (maior = pior)
+COMPARED_METRICS = ("seconds", "rss_peak_mb", "py_peak_mb")
+
+ENTRY_RE = re.compile(r"<entry>.*?</entry>|<item>.*?</item>", re.S)
+PRICE_RE = re.compile(r"(<g:(?:sale_)?price>)\s*([\d.,]+)")
+
+# --- FEEDS SINTÉTICOS ---
+
+def read_fixture(path=FIXTURE_FEED):
+    """(cabeçalho, produtos, rodapé) do XML, com cada produto como texto cru."""
+    with open(path, "r", encoding="utf-8") as f:
+        raw = f.read()
+    entries = ENTRY_RE.findall(raw)
+    first = raw.index(entries[0])
+    last = raw.rindex(entries[-1]) + len(entries[-1])
+    return raw[:first], entries, raw[last:]
+
+def _scale_prices(entry, factor):
+    return PRICE_RE.sub(lambda m: f"{m.group(1)}{float(m.group(2).replace(',', '.')) * factor:.2f}", entry)
+
+def synthetic_entry(entry, n, copy, reprice=False):
+    """
+    Cópia `copy` de um produto da fixture: g:id, link e título únicos (texto embedado único,
+    nada vem do cache de embeddings) e preço com variação determinística.
+    A cópia 0 é o produto original; reprice=True simula a atualização de preço do dia seguinte.
+    """
+    if copy:
+        entry = re.sub(r"(<g:id>)(.*?)(</g:id>)", rf"\g<1>\g<2>-s{copy}\g<3>", entry, count=1)
+        entry = re.sub(r"(<g:link>)(.*?)(</g:link>)", rf"\g<1>\g<2>?s={copy}\g<3>", entry, count=1)
+        entry = re.sub(r"(<g:title>)(.*?)(</g:title>)", rf"\g<1>\g<2> - Lote {copy}\g<3>", entry, count=1)
+        entry = _scale_prices(entry, 1 + ((copy * 37) % 21 - 10) / 100)
+    if reprice and n % REPRICE_EVERY == 0:
+        entry = _scale_prices(entry, 1.05)
+    return entry
+
+def write_synthetic_feed(path, size, reprice=False, fixture=FIXTURE_FEED):
+    """Grava (em streaming) um feed com `size` produtos. Retorna o tamanho em bytes."""
+    header, entries, footer = read_fixture(fixture)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(header)
+        for n in range(size):
+            copy, index = divmod(n, len(entries))
+            f.write(synthetic_entry(entries[index], n, copy, reprice))
+        f.write(footer)
+    return os.path.getsize(path)
+
+# --- MEDIÇÃO ---
+
+def current_rss_mb():
+    """Memória residente do processo (Linux: /proc; fora dele, o pico informado pelo SO)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+class RssSampler:
+    """Amostra o RSS numa thread (pega memória nativa do SQLite/Chroma, que o tracemalloc não vê)."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss_mb()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb())
+
+def measure(stages, name, fn, items, use_tracemalloc=False):
+    """Roda fn() medindo tempo, pico de RSS e (opcional) pico do heap Python. fn retorna um dict de detalhes."""
+    print(f"⏱️ {name}...", file=sys.stderr)
+    if use_tracemalloc:
+        tracemalloc.start()
+    with RssSampler() as sampler:
+        started = time.perf_counter()
+        details = fn() or {}
+        seconds = time.perf_counter() - started
+    result = {
+        "seconds": round(seconds, 3),
+        "items": items,
+        "items_per_s": round(items / seconds, 1) if seconds else None,
+        "rss_peak_mb": round(sampler.peak, 1),
+        **details,
+    }
+    if use_tracemalloc:
+        result["py_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+        tracemalloc.stop()
+    stages[name] = result
+    print(f"   {result['seconds']}s, pico {result['rss_peak_mb']} MB", file=sys.stderr)
+    return result
+
+# --- EXECUÇÃO DE UM TAMANHO (processo filho) ---
+
+def serve_directory(directory):
+    """Servidor HTTP local para o process_product_feed baixar o feed sintético."""
+    from functools import partial
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def run_size(feed_path, refresh_path, workdir, index, dim, use_tracemalloc):
+    """Mede as etapas da ingestão para um feed. Precisa de DATABASE_FILE apontando para o workdir."""
+    import category_index
+    import database
+    import embedding_cache
+    import fake_embedding_server
+    import feed_manager
+    import feed_parser
+    import lexical_index
+    import rag_manager
+    import scheduler_service
+    from langchain_core.embeddings import Embeddings
+
+    class FakeEmbeddings(Embeddings):
+        """Mesmos vetores do fake_embedding_server, sem HTTP no meio."""
+
+        def embed_documents(self, texts):
+            return [fake_embedding_server.fake_vector(t, dim) for t in texts]
+
+        def embed_query(self, text):
+            return fake_embedding_server.fake_vector(text, dim)
+
+    chroma_dir = os.path.join(workdir, "chroma")
+    kb_dir = os.path.join(workdir, "knowledge_base")
+    os.makedirs(kb_dir, exist_ok=True)
+    rag_manager.KNOWLEDGE_BASE_DIR = kb_dir
+    rag_manager.STATUS_FILE = os.path.join(kb_dir, "status.json")
+    rag_manager.CHROMA_DB_DIR = chroma_dir
+    rag_manager.GENERATION_FILE = os.path.join(chroma_dir, "generation.json")
+    rag_manager.EMBEDDING_CACHE_DIR = os.path.join(chroma_dir, "embedding_cache")
+    rag_manager.FILE_CACHE_DIR = os.path.join(chroma_dir, "file_cache")
+    rag_manager.QUERY_CACHE_DIR = os.path.join(chroma_dir, "query_cache")
+    rag_manager.LEXICAL_INDEX_FILE = os.path.join(chroma_dir, "lexical_index.pkl")
+    rag_manager._embeddings = embedding_cache.CachedEmbeddings(
+        FakeEmbeddings(), model_name=f"fake-{dim}", cache_dir=rag_manager.EMBEDDING_CACHE_DIR,
+        size_limit=rag_manager.EMBEDDING_CACHE_SIZE_LIMIT,
+    )
+    scheduler_service.KNOWLEDGE_BASE_DIR = kb_dir
+    category_index.CATEGORY_INDEX_FILE = os.path.join(kb_dir, "category_index.json")
+    database.init_db()
+
+    stages = {}
+    count = sum(1 for _ in feed_parser.iter_product_nodes(feed_path))
+
+    # 1. XML -> registros (o antigo convert_xml_to_clean_txt virou o parser em streaming)
+    measure(stages, "parse", lambda: {"products": sum(1 for _ in feed_parser.iter_products(feed_path))}, count, use_tracemalloc)
+    measure(stages, "digest", lambda: {"products": feed_parser.feed_digest(feed_path)[1]}, count, use_tracemalloc)
+
+    # 2. XML -> tabela products
+    def catalog_import():
+        success, msg = scheduler_service.import_feed_to_catalog(feed_path)
+        return {"success": success, "products": database.count_products()}
+    measure(stages, "catalog_import", catalog_import, count, use_tracemalloc)
+
+    if not index:
+        return stages
+
+    # 3. Catálogo -> Documents -> chunks (a parte de texto do process_knowledge_base)
+    prepared = {}
+    def documents_chunking():
+        chunks = rag_manager.split_documents(rag_manager.catalog_documents())
+        prepared["ids"] = rag_manager.assign_document_ids(chunks)
+        prepared["chunks"] = chunks
+        return {"chunks": len(chunks)}
+    measure(stages, "documents_chunking", documents_chunking, count, use_tracemalloc)
+
+    # 4. Gravação no Chroma (embeddings falsos + upsert), depois a mesma carga sem mudanças
+    collection = f"{rag_manager.COLLECTION_PREFIX}1"
+    vector_store = rag_manager.get_vector_store(collection)
+    def chroma_write():
+        upserted, repriced, removed = rag_manager.sync_vector_store(vector_store, prepared["chunks"], prepared["ids"])
+        rag_manager.set_active_generation(collection, 1)
+        return {"upserted": upserted}
+    measure(stages, "chroma_write", chroma_write, len(prepared["ids"]), use_tracemalloc)
+
+    def chroma_resync_noop():
+        upserted, repriced, removed = rag_manager.sync_vector_store(vector_store, prepared["chunks"], prepared["ids"])
+        return {"upserted": upserted, "repriced": repriced, "removed": removed}
+    measure(stages, "chroma_resync_noop", chroma_resync_noop, len(prepared["ids"]), use_tracemalloc)
+
+    def lexical_build():
+        lexical = lexical_index.build(prepared["chunks"], prepared["ids"], collection, 1)
+        lexical_index.save(lexical, rag_manager.LEXICAL_INDEX_FILE)
+        return {"terms": len(lexical["postings"])}
+    measure(stages, "lexical_build", lexical_build, len(prepared["ids"]), use_tracemalloc)
+    prepared.clear()
+
+    # 5. Ponta a ponta: botão "Atualizar Feed Agora" com o feed do dia seguinte (preços mudados)
+    server = serve_directory(os.path.dirname(refresh_path))
+    url = f"http://127.0.0.1:{server.server_port}/{os.path.basename(refresh_path)}"
+    database.add_feed("Benchmark", url, primary=True) # Mesmos g:id do catálogo já importado
+    database.set_setting("product_feed_url", url)
+    def process_product_feed():
+        success, msg = feed_manager.process_product_feed()
+        return {"success": success, "message": msg}
+    try:
+        measure(stages, "process_product_feed", process_product_feed, count, use_tracemalloc)
+    finally:
+        server.shutdown()
+    return stages
+
+def worker(args):
+    """Processo filho: saída dos módulos vai para stderr, o resultado para --out."""
+    sys.stdout = sys.stderr
+    stages = run_size(args.feed, args.refresh_feed, args.workdir, args.index, args.dim, args.tracemalloc)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(stages, f)
+
+# --- ORQUESTRAÇÃO ---
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def bench_size(size, args):
+    workdir = tempfile.mkdtemp(prefix=f"bench_{size}_")
+    try:
+        feed_path = os.path.join(workdir, "feed.xml")
+        refresh_path = os.path.join(workdir, "feed_refresh.xml")
+        index = size <= args.max_index_size
+
+        started = time.perf_counter()
+        feed_bytes = write_synthetic_feed(feed_path, size, fixture=args.fixture)
+        if index: write_synthetic_feed(refresh_path, size, reprice=True, fixture=args.fixture)
+        generate_seconds = round(time.perf_counter() - started, 3)
+        print(f"📦 {size} produtos: feed de {feed_bytes / (1024 * 1024):.1f} MB.", file=sys.stderr)
+
+        out = os.path.join(workdir, "result.json")
+        command = [
+            sys.executable, os.path.abspath(__file__), "--worker",
+            "--feed", feed_path, "--refresh-feed", refresh_path, "--workdir", workdir,
+            "--out", out, "--dim", str(args.dim),
+        ]
+        if index: command.append("--index")
+        if args.tracemalloc: command.append("--tracemalloc")
+        env = {**os.environ, "DATABASE_FILE": os.path.join(workdir, "bench.sqlite")}
+        subprocess.run(command, env=env, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+        with open(out, encoding="utf-8") as f:
+            stages = json.load(f)
+        return {"size": size, "feed_mb": round(feed_bytes / (1024 * 1024), 1), "generate_seconds": generate_seconds, "indexed": index, "stages": stages}
+    finally:
+        if not args.keep: shutil.rmtree(workdir, ignore_errors=True)
+
+def run_benchmarks(args):
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "cpu_count": os.cpu_count(),
+        "embedding_dim": args.dim,
+        "tracemalloc": args.tracemalloc,
+        "results": [],
+    }
+    for size in sizes:
+        report["results"].append(bench_size(size, args))
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{report['git_revision']}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"✅ Resultado em {output}")
+
+    for result in report["results"]:
+        for name, stage in result["stages"].items():
+            print(f"  {result['size']:>8} | {name:<22} {stage['seconds']:>9.3f}s {stage['items_per_s'] or 0:>10.1f}/s {stage['rss_peak_mb']:>8.1f} MB")
+    return output
+
+def compare(old_path, new_path, threshold):
+    """Compara dois resultados etapa a etapa. Retorna quantas regressões passaram do limite."""
+    with open(old_path, encoding="utf-8") as f:
+        old = {r["size"]: r["stages"] for r in json.load(f)["results"]}
+    with open(new_path, encoding="utf-8") as f:
+        new = {r["size"]: r["stages"] for r in json.load(f)["results"]}
+
+    regressions = 0
+    for size in sorted(set(old) & set(new)):
+        for name in sorted(set(old[size]) & set(new[size])):
+            for metric in COMPARED_METRICS:
+                before, after = old[size][name].get(metric), new[size][name].get(metric)
+                if not before or after is None: continue
+                change = (after - before) / before
+                flag = ""
+                # Etapas muito curtas oscilam demais para acusar regressão de tempo
+                if change > threshold and not (metric == "seconds" and after < 0.05):
+                    flag = " ❌ REGRESSÃO"
+                    regressions += 1
+                print(f"  {size:>8} | {name:<22} {metric:<12} {before:>10} -> {after:<10} ({change:+.1%}){flag}")
+    print(f"{'❌' if regressions else '✅'} {regressions} regressão(ões) acima de {threshold:.0%}.")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark da ingestão de feeds (parse, catálogo, chunking, Chroma).")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Tamanhos de feed separados por vírgula.")
+    parser.add_argument("--max-index-size", type=int, default=DEFAULT_MAX_INDEX_SIZE, help="Maior feed que passa pelas etapas com Chroma.")
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM, help="Dimensão dos embeddings falsos.")
+    parser.add_argument("--tracemalloc", action="store_true", help="Mede também o pico do heap Python (deixa tudo mais lento).")
+    parser.add_argument("--fixture", default=FIXTURE_FEED)
+    parser.add_argument("--output", help=f"Arquivo JSON de saída (padrão: {RESULTS_DIR}/<data>-<commit>.json).")
+    parser.add_argument("--keep", action="store_true", help="Não apaga os diretórios temporários.")
+    parser.add_argument("--compare", nargs=2, metavar=("ANTES", "DEPOIS"), help="Compara dois resultados JSON.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Piora relativa tolerada no --compare (0.2 = 20%%).")
+    # Uso interno (processo filho de cada tamanho)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--feed", help=argparse.SUPPRESS)
+    parser.add_argument("--refresh-feed", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    parser.add_argument("--index", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+    elif args.worker:
+        worker(args)
+    else:
+        run_benchmarks(args)
@@ -0,0 +1,198 @@
+# category_index.py - ÁRVORE DE CATEGORIAS PRÉ-CALCULADA (espécie > tipo de produto)
+# Montada na ingestão a partir do google_product_category (+ título quando a categoria é genérica).
+# Cada nó guarda contagem, faixa de preço e a lista de produtos já ordenada: perguntas de
+# navegação ("brinquedos para gato", "o que vocês têm para aves?") saem daqui sem rewrite,
+# sem embedding e sem busca vetorial.
+import os
+import re
+import json
+import threading
+from datetime import datetime
+
+import database
+import price_index
+import query_filters
+
+CATEGORY_INDEX_FILE = os.path.join("knowledge_base", "category_index.json")
+ROOT = "*"
+BROWSE_LIMIT = 6 # Produtos entregues ao LLM numa resposta de navegação
+SPECIES_LABELS = {
+    "cachorro": "Cachorros", "gato": "Gatos", "peixe": "Peixes", "passaro": "Pássaros",
+    "roedor": "Roedores", query_filters.ALL_PETS: "Todos os pets",
+}
+# Palavras que não mudam o sentido de uma pergunta de navegação ("o que vocês têm de ...")
+BROWSE_WORDS = {
+    "o", "a", "os", "as", "um", "uma", "uns", "umas", "de", "do", "da", "dos", "das", "e", "ou", "em", "no", "na",
+    "para", "pra", "pro", "pros", "pras", "meu", "minha", "meus", "minhas", "seu", "sua", "que", "quais", "qual",
+    "voces", "vcs", "vc", "tem", "teem", "tens", "ha", "vende", "vendem", "vendas", "quero", "queria", "gostaria",
+    "ver", "mostra", "mostre", "mostrar", "me", "opcoes", "opcao", "tipos", "tipo", "produtos", "produto", "coisas",
+    "coisa", "algo", "algum", "alguma", "alguns", "algumas", "loja", "ai", "aqui", "mais", "barato", "baratos",
+    "ate", "entre", "acima", "abaixo", "menos", "partir", "reais", "real", "rs", "r", "oi", "ola", "bom", "boa",
+    "dia", "tarde", "noite", "por", "favor", "pet", "pets", "animal", "animais", "estimacao",
+}
+
+_lock = threading.Lock()
+_index = None
+_loaded_mtime = None
+
+def node_key(species=None, kind=None):
+    """'*', 'gato', 'gato/brinquedo' ou '*/brinquedo' (tipo em todas as espécies)."""
+    if kind: return f"{species or ROOT}/{kind}"
+    return species or ROOT
+
+def _node_label(species, kind):
+    parts = [SPECIES_LABELS.get(species, species) if species else "Catálogo"]
+    if kind: parts.append(query_filters.PRODUCT_TYPES.get(kind, ("Outros",))[0])
+    return " > ".join(parts)
+
+def _rank(item):
+    """Ordem de vitrine: em estoque, em promoção, com imagem, mais barato."""
+    return (not item["in_stock"], not item["on_sale"], not item["has_image"], item["price"] if item["price"] is not None else float("inf"), item["title"])
+
+def build(records):
+    """Árvore a partir dos registros do catálogo: {"built_at", "products", "nodes": {chave: nó}}."""
+    nodes = {}
+
+    def touch(species, kind):
+        key = node_key(species, kind)
+        if key not in nodes:
+            nodes[key] = {
+                "key": key, "label": _node_label(species, kind), "species": species, "type": kind,
+                "count": 0, "in_stock": 0, "min_price": None, "max_price": None,
+                "categories": {}, "items": [],
+            }
+        return nodes[key]
+
+    total = 0
+    for record in records:
+        total += 1
+        species = query_filters.product_species(record)
+        kind = query_filters.product_type(record)
+        price = price_index.current_price(record)
+        item = {
+            "id": record["id"],
+            "title": record["title"] or "",
+            "price": price,
+            "in_stock": price_index.in_stock(record),
+            "on_sale": price_index.sale_is_active(record),
+            "has_image": bool(record["image"]),
+        }
+        for key_species, key_kind in ((None, None), (species, None), (species, kind), (None, kind)):
+            node = touch(key_species, key_kind)
+            node["count"] += 1
+            node["items"].append(item)
+            if item["in_stock"]: node["in_stock"] += 1
+            if price is not None:
+                node["min_price"] = price if node["min_price"] is None else min(node["min_price"], price)
+                node["max_price"] = price if node["max_price"] is None else max(node["max_price"], price)
+            if record["category"]:
+                node["categories"][record["category"]] = node["categories"].get(record["category"], 0) + 1
+
+    # Filhos (espécie -> tipos) e lista final de ids já na ordem de vitrine
+    for node in nodes.values():
+        node["items"].sort(key=_rank)
+        node["product_ids"] = [item["id"] for item in node.pop("items")]
+        node["children"] = []
+    for key, node in nodes.items():
+        if node["type"] and node["species"]:
+            nodes[node_key(node["species"])]["children"].append(key)
+        elif node["species"]:
+            nodes[ROOT]["children"].append(key)
+    for node in nodes.values():
+        node["children"].sort(key=lambda child: -nodes[child]["count"])
+
+    return {"built_at": datetime.now().isoformat(), "products": total, "nodes": nodes}
+
+def rebuild():
+    """Reconstrói a árvore a partir do catálogo e grava em disco (troca atômica). Retorna nº de nós."""
+    global _index, _loaded_mtime
+    index = build(database.iter_products())
+    os.makedirs(os.path.dirname(CATEGORY_INDEX_FILE) or ".", exist_ok=True)
+    tmp_file = f"{CATEGORY_INDEX_FILE}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_file, CATEGORY_INDEX_FILE)
+    with _lock:
+        _index, _loaded_mtime = index, os.path.getmtime(CATEGORY_INDEX_FILE)
+    print(f"🗂️ Árvore de categorias: {len(index['nodes'])} nós, {index['products']} produtos.")
+    return len(index["nodes"])
+
+def get_index():
+    """Árvore em memória; recarrega se outro processo regravou o arquivo. Sem arquivo, monta do catálogo."""
+    global _index, _loaded_mtime
+    try:
+        mtime = os.path.getmtime(CATEGORY_INDEX_FILE)
+    except OSError:
+        mtime = None
+    if _index is not None and mtime == _loaded_mtime:
+        return _index
+    try:
+        if mtime is None:
+            rebuild()
+        else:
+            with open(CATEGORY_INDEX_FILE, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            with _lock:
+                _index, _loaded_mtime = index, mtime
+    except Exception as e:
+        print(f"⚠️ Árvore de categorias indisponível: {e}")
+    return _index
+
+def get_node(species=None, kind=None):
+    index = get_index()
+    if not index: return None
+    return index["nodes"].get(node_key(species, kind))
+
+def browse_request(text, has_history=False):
+    """
+    (espécie, tipo, restrições) se a pergunta é só navegação ("brinquedos para gato"), senão None.
+    Qualquer palavra além de espécie, tipo, preço e conectivos ("golden", "filhote", "15kg")
+    pede busca de verdade. Com histórico, a espécie tem que estar na pergunta: "e para gatos?" e
+    "e brinquedos?" dependem do contexto (o rewrite com histórico sabe de que pet se falava).
+    """
+    constraints = query_filters.parse_constraints(text)
+    species = constraints.get("species") or set()
+    types = constraints.get("types") or set()
+    if len(species) > 1 or len(types) > 1 or not (species or types): return None
+    if has_history and not (species and types): return None
+
+    vocabulary = set(BROWSE_WORDS)
+    for words in query_filters.PET_SPECIES.values(): vocabulary.update(word for word in words if " " not in word)
+    for label, words in query_filters.PRODUCT_TYPES.values(): vocabulary.update(words)
+    tokens = re.findall(r"[a-z]+", query_filters.fold(text))
+    if any(token not in vocabulary for token in tokens): return None
+
+    return next(iter(species), None), next(iter(types), None), constraints
+
+def pick_products(species, kind, constraints=None, limit=BROWSE_LIMIT):
+    """
+    Primeiros produtos do nó (ordem pré-calculada) que ainda estão em estoque e dentro da faixa
+    de preço pedida, com preço/estoque do price_index. Espécie + tipo: completa com os genéricos do tipo.
+    """
+    constraints = constraints or {}
+    nodes = [get_node(species, kind)]
+    if species and kind: nodes.append(get_node(query_filters.ALL_PETS, kind))
+    live = price_index.is_loaded()
+    picked = []
+    for node in filter(None, nodes):
+        for product_id in node["product_ids"]:
+            offer = price_index.get_offer(product_id)
+            if live and (offer is None or not price_index.in_stock(offer)): continue
+            price = price_index.current_price(offer)
+            if constraints.get("min_price") is not None and (price is None or price < constraints["min_price"]): continue
+            if constraints.get("max_price") is not None and (price is None or price > constraints["max_price"]): continue
+            if product_id not in picked: picked.append(product_id)
+            if len(picked) >= limit: return picked
+    return picked
+
+def describe_node(node):
+    """Resumo do nó para o contexto do LLM (quantidade, faixa de preço, subcategorias)."""
+    text = f"Categoria {node['label']}: {node['in_stock']} produtos em estoque"
+    if node["min_price"] is not None:
+        text += f", de R$ {node['min_price']:.2f} a R$ {node['max_price']:.2f}"
+    text += "."
+    nodes = get_index()["nodes"]
+    children = [nodes[child] for child in node["children"] if nodes[child]["in_stock"]]
+    if children:
+        text += " Subcategorias: " + ", ".join(f"{child['label'].split(' > ')[-1]} ({child['in_stock']})" for child in children) + "."
+    return text
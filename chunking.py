@@ -0,0 +1,88 @@
+# chunking.py - CHUNKING POR ESTRUTURA (FAQ por pergunta, demais textos por parágrafo)
+# Antes tudo passava pelo RecursiveCharacterTextSplitter(2000): a FAQ era cortada no meio das
+# respostas e uma pergunta caía em dois vetores. Aqui cada par pergunta/resposta vira um vetor.
+# Produtos não passam por aqui: product_to_document já gera um documento compacto por produto.
+import re
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+INFO_CHUNK_SIZE = 1200 # Resposta maior que isso é dividida (com a pergunta repetida em cada parte)
+INFO_CHUNK_OVERLAP = 100
+QUESTION_MAX_LINES = 3 # Pergunta longa quebra em até 3 linhas no PDF
+MIN_FAQ_QUESTIONS = 2 # Menos perguntas que isso: não é FAQ, vai por parágrafo
+
+_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=INFO_CHUNK_SIZE, chunk_overlap=INFO_CHUNK_OVERLAP,
+    separators=["\n\n", "\n", ". ", " ", ""],
+)
+
+def clean_pdf_text(text):
+    """Artefatos do PyPDF: 'e -commerce' -> 'e-commerce', espaços repetidos."""
+    text = re.sub(r"(\w) -(\w)", r"\1-\2", text)
+    return re.sub(r"[ \t]+", " ", text)
+
+def _lines(pages):
+    """[(página, linha)] de todas as páginas de um arquivo, em ordem."""
+    return [
+        (page, line.strip())
+        for page, text in pages
+        for line in clean_pdf_text(text).splitlines()
+    ]
+
+def _question_end(lines, i):
+    """Índice da linha que fecha a pergunta que começa em i (termina com '?'), ou None."""
+    first = lines[i][1]
+    if not first or not first[0].isupper(): return None
+    if i > 0 and lines[i - 1][1] and not lines[i - 1][1].endswith((".", "!", "?", ":")): return None
+    for j in range(i, min(i + QUESTION_MAX_LINES, len(lines))):
+        line = lines[j][1]
+        if not line or line.endswith((".", "!", ":")): return None # Frase terminada: é resposta
+        if line.endswith("?"): return j
+    return None
+
+def split_faq(pages):
+    """
+    [(pergunta, resposta, página)] das páginas [(página, texto)] de um arquivo.
+    Texto antes da primeira pergunta (título) é descartado. Lista vazia se não parecer FAQ.
+    """
+    lines = _lines(pages)
+    sections = []
+    i = 0
+    while i < len(lines):
+        end = _question_end(lines, i)
+        if end is None:
+            if sections and lines[i][1]: sections[-1][1].append(lines[i][1])
+            i += 1
+            continue
+        question = " ".join(line for _, line in lines[i:end + 1])
+        sections.append((question, [], lines[i][0]))
+        i = end + 1
+
+    if len(sections) < MIN_FAQ_QUESTIONS: return []
+    return [(question, " ".join(answer), page) for question, answer, page in sections if answer]
+
+def chunk_info_documents(documents):
+    """
+    Documentos de texto (PDF/DOCX/TXT) -> chunks. Páginas do mesmo arquivo são tratadas juntas
+    (pergunta numa página, resposta na outra). FAQ: um chunk por pergunta; resto: por parágrafo.
+    """
+    by_source = {}
+    for doc in documents:
+        by_source.setdefault(doc.metadata.get("source", ""), []).append(doc)
+
+    chunks = []
+    for source, docs in by_source.items():
+        base_meta = {k: v for k, v in docs[0].metadata.items() if k != "page"}
+        pages = [(doc.metadata.get("page", 0), doc.page_content) for doc in docs]
+        faq = split_faq(pages)
+        if not faq:
+            for doc in docs:
+                doc.page_content = clean_pdf_text(doc.page_content)
+            chunks.extend(_splitter.split_documents(docs))
+            continue
+
+        for question, answer, page in faq:
+            meta = {**base_meta, "page": page, "title": question}
+            for part in _splitter.split_text(answer):
+                chunks.append(Document(page_content=f"Pergunta: {question}\nResposta: {part}", metadata=dict(meta)))
+    return chunks
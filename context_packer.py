@@ -0,0 +1,99 @@
+# context_packer.py - CONTEXTO DO PROMPT DENTRO DE UM ORÇAMENTO DE TOKENS
+# O format_docs mandava os 10 documentos em JSON com indent=2, descrição de 400 caracteres
+# por produto e trechos da FAQ inteiros: milhares de tokens por mensagem, quase todos ignorados.
+# Aqui os itens entram por relevância até o orçamento (contado com tiktoken), resultados fracos
+# e quase repetidos saem, e o JSON vai compacto (mesmas chaves que o prompt já conhece).
+import os
+import json
+
+import tiktoken
+
+import lexical_index
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1500"))
+MIN_RELEVANCE = float(os.environ.get("CONTEXT_MIN_RELEVANCE", "0.2")) # Similaridade de cosseno com a pergunta
+PRODUCT_DESCRIPTION_TOKENS = 60 # Descrição do produto: o suficiente para o "Por que é legal"
+INFO_TOKENS = 350 # Trecho de FAQ/manual (uma pergunta + resposta cabe folgado)
+NEAR_DUPLICATE = 0.85 # Jaccard dos termos: acima disso é o mesmo texto (variação de tamanho, trecho sobreposto)
+ENCODING_MODEL = "gpt-4o"
+CHARS_PER_TOKEN = 4 # Estimativa se o tiktoken não conseguir baixar o vocabulário (sem internet)
+
+_encoding = None
+
+def get_encoding():
+    """Encoder do tiktoken, ou False se indisponível (conta por estimativa)."""
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.encoding_for_model(ENCODING_MODEL)
+        except Exception as e:
+            print(f"⚠️ tiktoken indisponível, contando tokens por estimativa: {e}")
+            _encoding = False
+    return _encoding
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if not encoding: return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text))
+
+def truncate_tokens(text, max_tokens):
+    """Corta o texto em max_tokens (com '…' se cortou)."""
+    encoding = get_encoding()
+    if not encoding:
+        max_chars = max_tokens * CHARS_PER_TOKEN
+        return text if len(text) <= max_chars else text[:max_chars].rstrip() + "…"
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens: return text
+    return encoding.decode(tokens[:max_tokens]).rstrip() + "…"
+
+def serialize(items):
+    return json.dumps(items, ensure_ascii=False, separators=(",", ":"))
+
+def _similar(a, b):
+    if not a or not b: return False
+    return len(a & b) / len(a | b) >= NEAR_DUPLICATE
+
+def pack(entries, budget=None):
+    """
+    entries: [(item, texto, relevância ou None)] na ordem do ranking, item já no formato do prompt
+    (texto = descrição/conteúdo, que entra truncado no item). Devolve o JSON compacto.
+    - relevância abaixo de MIN_RELEVANCE sai (o melhor item fica sempre, para não responder no vazio);
+      None (atalhos, BM25) não é filtrado;
+    - texto quase igual a um já incluído: produto entra sem descrição (é outra variação,
+      preço/link servem), INFO sai;
+    - itens entram enquanto couberem no orçamento.
+    """
+    budget = budget or CONTEXT_TOKEN_BUDGET
+    scored = [relevance for item, text, relevance in entries if relevance is not None]
+    best = max(scored) if scored else None
+
+    packed, seen_texts = [], []
+    used = 2 # "[" e "]"
+    dropped_low = dropped_dup = dropped_budget = 0
+    for item, text, relevance in entries:
+        if relevance is not None and relevance < MIN_RELEVANCE and relevance != best:
+            dropped_low += 1
+            continue
+
+        terms = set(lexical_index.tokenize(text)) if text else set()
+        is_product = item.get("tipo") == "PRODUTO"
+        if terms and any(_similar(terms, seen) for seen in seen_texts):
+            if not is_product:
+                dropped_dup += 1
+                continue
+            item = {key: value for key, value in item.items() if key != "descricao"}
+        elif text:
+            key = "descricao" if is_product else "conteudo"
+            item = {**item, key: truncate_tokens(text, PRODUCT_DESCRIPTION_TOKENS if is_product else INFO_TOKENS)}
+            seen_texts.append(terms)
+
+        cost = count_tokens(serialize(item)) + 1 # + vírgula
+        if used + cost > budget:
+            dropped_budget += 1
+            continue
+        packed.append(item)
+        used += cost
+
+    if dropped_low or dropped_dup or dropped_budget:
+        print(f"📦 Contexto: {len(packed)} itens, ~{used} tokens ({dropped_low} pouco relevantes, {dropped_dup} repetidos, {dropped_budget} fora do orçamento).")
+    return serialize(packed)
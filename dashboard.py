@@ -4,11 +4,13 @@ from apscheduler.schedulers.background import BackgroundScheduler
 import feed_manager
 import dash
 import dash_bootstrap_components as dbc
-from dash import html, dcc, Input, Output, State, ALL, callback_context, no_update
+from dash import html, dcc, Input, Output, State, ALL, callback_context, no_update, ClientsideFunction
 import plotly.graph_objects as go
 import os
 import json
 import rag_manager
+import job_tracker
+import agent_runtime
 import base64
 import datetime
 import time
@@ -16,6 +18,7 @@ import uuid
 import pandas as pd
 import diskcache
 from dash import DiskcacheManager
+from flask import Response, request, stream_with_context
 from dotenv import load_dotenv
 from scheduler_service import start_scheduler
 
@@ -35,6 +38,21 @@ def get_v16_status():
 
 # --- CONFIGURAÇÃO ---
 cache = diskcache.Cache("./callback_cache")
+# Chat em streaming: a resposta aparece na bolha token a token (SSE em /chat/stream + assets/chat_stream.js)
+CHAT_STREAMING = os.environ.get("CHAT_STREAMING", "1") != "0"
+AGENT_ERROR_MESSAGE = "Desculpe, tive um problema técnico ao processar sua solicitação. Tente novamente."
+AGENT_BUSY_MESSAGE = "Estou atendendo muita gente agora 🐾 Pode repetir sua pergunta em alguns instantes?"
+
+def agent_reply(user_query, chat_history, session_settings):
+    """Resposta do agente pelo loop assíncrono (concorrência limitada), já com as mensagens de erro."""
+    try:
+        return agent_runtime.run(agent.aget_response(user_query, chat_history, session_settings))
+    except agent_runtime.AgentBusyError as e:
+        print(f"⏳ Agente ocupado: {e}")
+        return AGENT_BUSY_MESSAGE
+    except Exception as e:
+        print(f"Erro no Agente: {e}")
+        return AGENT_ERROR_MESSAGE
 background_callback_manager = DiskcacheManager(cache)
 load_dotenv()
 from agent import EverpetzAgent
@@ -401,7 +419,7 @@ base_conhecimento_layout = html.Div([
         dbc.Col(dbc.Card([dbc.CardHeader("Documentos Carregados"), dbc.CardBody(dbc.ListGroup(id="document-list-group", flush=True))], className="shadow-sm"), width=8),
         dbc.Col([
             dbc.Card([dbc.CardHeader("Estatísticas"), dbc.CardBody(dbc.ListGroup(id="stats-list-group", flush=True))], className="shadow-sm mb-4"),
-            dbc.Card([dbc.CardHeader("Ações"), dbc.CardBody([dbc.Button("Processar Base de Conhecimento", id="process-kb-btn", color="primary", className="w-100"), html.P("Clique para que o Bob estude os documentos e atualize sua memória.", className="text-muted small mt-2")])], className="shadow-sm mb-4"),
+            dbc.Card([dbc.CardHeader("Ações"), dbc.CardBody([dbc.Button("Processar Base de Conhecimento", id="process-kb-btn", color="primary", className="w-100"), html.Div(id="kb-job-feedback", className="mt-2"), html.P("Clique para que o Bob estude os documentos e atualize sua memória.", className="text-muted small mt-2")])], className="shadow-sm mb-4"),
             dbc.Card([dbc.CardHeader("Formatos Suportados"), dbc.CardBody([dbc.ListGroup([dbc.ListGroupItem("PDF"), dbc.ListGroupItem("TXT"), dbc.ListGroupItem("DOCX")], flush=True), html.P("Tamanho máximo: 10MB por arquivo", className="text-muted small mt-3")])], className="shadow-sm"),
         ], width=4),
     ]),
@@ -637,6 +655,8 @@ def serve_layout():
         
         # --- [NOVO] O Relógio que atualiza o status a cada 3 segundos ---
         dcc.Interval(id='interval-component', interval=3000, n_intervals=0),
+        # Estado do job em andamento (só muda quando o job avança; as listas reagem a ele)
+        dcc.Store(id='job-state-store'),
         # ----------------------------------------------------------------
         
         dcc.Loading(id="loading-feedback", type="default", children=html.Div(id="upload-feedback-div", style={'position': 'fixed', 'top': '10px', 'right': '10px', 'zIndex': 1050})),
@@ -771,15 +791,10 @@ def handle_chat_submission(submit_clicks, enter_submissions, user_input, history
     history.append({"role": "assistant", "content": "thinking..."})
     return history, ""
 
-@app.callback([Output("modal-chat-history-store", "data", allow_duplicate=True), Output("signal-store", "data", allow_duplicate=True)], Input("modal-chat-history-store", "data"), [State("chat-session-id-store", "data"), State("chat-session-settings-store", "data")], prevent_initial_call=True)
 def run_agent_query(history, session_id, session_settings):
     if history and history[-1].get("content") == "thinking...":
         user_query = history[-2].get("content")
-        try:
-            agent_response_text = agent.get_response(user_query=user_query, chat_history=history[:-2], session_settings=session_settings)
-        except Exception as e:
-            print(f"Erro no Agente: {e}")
-            agent_response_text = "Desculpe, tive um problema técnico ao processar sua solicitação. Tente novamente."
+        agent_response_text = agent_reply(user_query, history[:-2], session_settings)
         if session_id:
             database.log_conversation_turn(session_id=session_id, role='user', content=user_query)
             database.log_conversation_turn(session_id=session_id, role='assistant', content=agent_response_text)
@@ -787,6 +802,54 @@ def run_agent_query(history, session_id, session_settings):
         return history, f"conversation_updated_{time.time()}"
     return no_update, no_update
 
+def sse_event(data):
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@server.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    Resposta do agente em Server-Sent Events: {"token": ...} a cada pedaço e, no fim,
+    {"done": true, "answer": texto completo}. O turno é gravado uma vez só, no fim.
+    """
+    payload = request.get_json(force=True, silent=True) or {}
+    user_query = payload.get("question") or ""
+    history = payload.get("history") or []
+    session_settings = payload.get("settings") or {}
+    session_id = payload.get("session_id")
+
+    def events():
+        parts = []
+        try:
+            for part in agent_runtime.stream(agent.astream_response(user_query, history, session_settings)):
+                parts.append(part)
+                yield sse_event({"token": part})
+            answer = "".join(parts)
+        except agent_runtime.AgentBusyError as e:
+            print(f"⏳ Agente ocupado: {e}")
+            answer = AGENT_BUSY_MESSAGE
+        except Exception as e:
+            print(f"Erro no Agente: {e}")
+            answer = AGENT_ERROR_MESSAGE
+        if session_id:
+            database.log_conversation_turn(session_id=session_id, role='user', content=user_query)
+            database.log_conversation_turn(session_id=session_id, role='assistant', content=answer)
+        yield sse_event({"done": True, "answer": answer})
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+if CHAT_STREAMING:
+    # O JS abre o stream e, no fim, grava a resposta no store (que re-renderiza a bolha em Markdown)
+    app.clientside_callback(
+        ClientsideFunction(namespace="chat", function_name="stream_reply"),
+        Output("modal-chat-history-store", "data", allow_duplicate=True),
+        Input("modal-chat-history-store", "data"),
+        [State("chat-session-id-store", "data"), State("chat-session-settings-store", "data"), State("modal-chat-history-div", "id"), State("signal-store", "id")],
+        prevent_initial_call=True,
+    )
+else:
+    app.callback([Output("modal-chat-history-store", "data", allow_duplicate=True), Output("signal-store", "data", allow_duplicate=True)], Input("modal-chat-history-store", "data"), [State("chat-session-id-store", "data"), State("chat-session-settings-store", "data")], prevent_initial_call=True)(run_agent_query)
+
 @app.callback(Output("modal-chat-history-div", "children"), Input("modal-chat-history-store", "data"))
 def render_chat_from_store(history):
     history = history or []
@@ -893,33 +956,43 @@ def delete_file(n):
     try: os.remove(os.path.join(rag_manager.KNOWLEDGE_BASE_DIR, fname)); return dbc.Alert(f"Arquivo '{fname}' deletado!", color="success", duration=4000)
     except Exception as e: return dbc.Alert(f"Erro: {e}", color="danger")
 
+# Roda em background (DiskcacheManager): o worker do servidor fica livre e o progresso vem do job_tracker
 @app.callback(
-    Output("upload-feedback-div", "children", allow_duplicate=True), 
+    Output("kb-job-feedback", "children"), 
     Input("process-kb-btn", "n_clicks"), 
+    background=True,
+    running=[(Output("process-kb-btn", "disabled"), True, False)],
     prevent_initial_call=True
 )
 def process_kb(n): 
     if not n: return dash.no_update
     
     try:
-        # Tenta processar
-        success = rag_manager.process_knowledge_base()
+        success, msg, job_id = job_tracker.run_job("kb", "Processamento da base", rag_manager.process_knowledge_base)
         
         if success:
-            return dbc.Alert("✅ Processamento iniciado com sucesso!", color="success", duration=5000, is_open=True, dismissable=True)
+            return dbc.Alert(f"✅ Processamento concluído (job {job_id}).", color="success", duration=5000, is_open=True, dismissable=True)
         else:
-            return dbc.Alert("⚠️ O processador rodou, mas não encontrou novos arquivos.", color="warning", duration=5000, is_open=True, dismissable=True)
+            return dbc.Alert(f"⚠️ {msg or 'O processador rodou, mas não encontrou novos arquivos.'}", color="warning", duration=5000, is_open=True, dismissable=True)
             
     except Exception as e:
         # Se der erro (ex: falta de import), ele vai te contar agora!
         return dbc.Alert(f"Erro Crítico no Botão: {str(e)}", color="danger", duration=10000, is_open=True, dismissable=True)
 
+# 0. POLLING DO JOB: lê o job_tracker (diskcache) e só publica quando o job avançou
+@app.callback(Output("job-state-store", "data"), Input("interval-component", "n_intervals"), State("job-state-store", "data"))
+def poll_job_state(n, current):
+    job = job_tracker.get_current_job()
+    if not job or (current and current.get("updated_at") == job["updated_at"]):
+        return no_update
+    return job
+
 # ==============================================================================
 # [MODIFICAÇÃO V10 + V16] Sincronia Real de Status
 # ==============================================================================
 # 1. ATUALIZA A LISTA DE DOCUMENTOS (CENTRAL)
-@app.callback(Output("document-list-group", "children"), [Input("url", "pathname"), Input("upload-feedback-div", "children"), Input("interval-component", "n_intervals")])
-def update_docs(p, f, n):
+@app.callback(Output("document-list-group", "children"), [Input("url", "pathname"), Input("upload-feedback-div", "children"), Input("job-state-store", "data")])
+def update_docs(p, f, job):
     if p == "/base-de-conhecimento":
         # Lê o JSON usando a função do passo 1
         status_data = get_v16_status()
@@ -932,43 +1005,58 @@ def update_docs(p, f, n):
         files = [f for f in os.listdir(rag_manager.KNOWLEDGE_BASE_DIR) if f.endswith((".pdf", ".docx", ".txt"))]
         
         items = []
-        for file in files:
-            if file == "feed_produtos_everpetz.txt":
-                # Pega dados do JSON ou usa padrão se não achar
-                feed_data = docs_map.get("Feed de Produtos (Automático)", {})
-                st = feed_data.get("status", "system")
-                info = feed_data.get("info", "Arquivo detectado.")
-                updated = feed_data.get("updated_at", "-")
-
-                # Define a cor do Badge
-                if st == "active":
-                    badge = dbc.Badge("Ativo ✅", color="success", className="p-2")
-                elif st == "processing":
-                    badge = dbc.Badge("Processando ⏳", color="warning", className="p-2")
-                elif st == "error":
-                    badge = dbc.Badge("Erro ❌", color="danger", className="p-2")
-                else:
-                    badge = dbc.Badge("Sistema", color="info")
-
-                items.append(dbc.ListGroupItem([
-                    dbc.Row([
-                        dbc.Col(html.Div([
-                            html.I(className="bi bi-globe2 text-primary me-2"), 
-                            html.Span("Feed de Produtos (Automático)", className="fw-bold"),
-                            html.Div(html.Small(f"{info} • {updated}", className="text-muted"), className="mt-1")
-                        ]), width=8),
-                        dbc.Col(badge, width="auto"),
-                    ], align="center")
-                ]))
+
+        # Feed de produtos: vive no catálogo (tabela products), não mais num TXT
+        if database.count_products() > 0 or "Feed de Produtos (Automático)" in docs_map:
+            # Pega dados do JSON ou usa padrão se não achar
+            feed_data = docs_map.get("Feed de Produtos (Automático)", {})
+            st = feed_data.get("status", "system")
+            info = feed_data.get("info", "Catálogo carregado.")
+            updated = feed_data.get("updated_at", "-")
+
+            # Define a cor do Badge
+            if st == "active":
+                badge = dbc.Badge("Ativo ✅", color="success", className="p-2")
+            elif st == "processing":
+                badge = dbc.Badge("Processando ⏳", color="warning", className="p-2")
+            elif st == "error":
+                badge = dbc.Badge("Erro ❌", color="danger", className="p-2")
             else:
-                # Arquivos normais
-                items.append(dbc.ListGroupItem([
-                    dbc.Row([
-                        dbc.Col(html.Div([html.I(className="bi bi-file-earmark-text-fill text-secondary me-2"), file]), width=8),
-                        dbc.Col(dbc.Badge("Arquivo Local", color="light", text_color="dark"), width="auto"),
-                        dbc.Col(dbc.Button("🗑️", id={'type': 'delete-btn', 'index': file}, color="light", size="sm"), width="auto")
-                    ], align="center")
-                ]))
+                badge = dbc.Badge("Sistema", color="info")
+
+            # Um resumo por feed do registro (loja, sellers, marketplaces)
+            feed_icons = {"active": "✅", "processing": "⏳", "error": "❌"}
+            feed_lines = [
+                html.Div(html.Small(
+                    f"{feed_icons.get(fd['last_status'], '•')} {fd['name']}: {fd['last_message'] or 'Aguardando primeira execução.'}"
+                    + (f" • a cada {fd['interval_minutes']} min" if fd["enabled"] else " • desativado"),
+                    className="text-muted"))
+                for fd in database.get_feeds()
+            ]
+
+            items.append(dbc.ListGroupItem([
+                dbc.Row([
+                    dbc.Col(html.Div([
+                        html.I(className="bi bi-globe2 text-primary me-2"), 
+                        html.Span("Feed de Produtos (Automático)", className="fw-bold"),
+                        html.Div(html.Small(f"{info} • {updated}", className="text-muted"), className="mt-1"),
+                        html.Div(feed_lines, className="mt-1 ps-4")
+                    ]), width=8),
+                    dbc.Col(badge, width="auto"),
+                ], align="center")
+            ]))
+
+        for file in files:
+            if file == rag_manager.LEGACY_FEED_FILE:
+                continue
+            # Arquivos normais
+            items.append(dbc.ListGroupItem([
+                dbc.Row([
+                    dbc.Col(html.Div([html.I(className="bi bi-file-earmark-text-fill text-secondary me-2"), file]), width=8),
+                    dbc.Col(dbc.Badge("Arquivo Local", color="light", text_color="dark"), width="auto"),
+                    dbc.Col(dbc.Button("🗑️", id={'type': 'delete-btn', 'index': file}, color="light", size="sm"), width="auto")
+                ], align="center")
+            ]))
         return items or dbc.ListGroupItem("Nenhum documento.")
     return []
 
@@ -981,8 +1069,8 @@ def clear_alerts(pathname):
     return []
 
 # 2. ATUALIZA AS ESTATÍSTICAS (PAINEL DIREITO)
-@app.callback(Output("stats-list-group", "children"), [Input("url", "pathname"), Input("upload-feedback-div", "children"), Input("interval-component", "n_intervals")])
-def update_stats(p, f, n):
+@app.callback(Output("stats-list-group", "children"), [Input("url", "pathname"), Input("upload-feedback-div", "children"), Input("job-state-store", "data")])
+def update_stats(p, f, job):
     if p == "/base-de-conhecimento":
         # Lê o JSON
         data = get_v16_status()
@@ -993,17 +1081,35 @@ def update_stats(p, f, n):
         except:
             files_count = 0
         
-        # Lê status geral do JSON
-        is_processing = data.get("processing", False)
+        # Status do robô vem do job (store); o JSON só dá a data da última ação
+        is_processing = bool(job and job.get("status") == "running" and time.time() - job["updated_at"] < job_tracker.JOB_STALE_SECONDS)
         last_update = data.get("last_update", "Nunca")
         
         status_badge = dbc.Badge("Processando...", color="warning") if is_processing else dbc.Badge("Ocioso", color="secondary")
         
-        return [
+        items = [
             dbc.ListGroupItem(["Total de Arquivos", dbc.Badge(str(files_count), color="primary", className="ms-1")], className="d-flex justify-content-between align-items-center"),
             dbc.ListGroupItem(["Status do Robô", status_badge], className="d-flex justify-content-between align-items-center"),
             dbc.ListGroupItem(["Última Ação", dbc.Badge(last_update, color="info", className="ms-1")], className="d-flex justify-content-between align-items-center")
         ]
+        try:
+            cache_stats = rag_manager.query_cache_stats()
+            hit_rates = [f"{label} {stats['hit_rate']:.0%}" for label, stats in (("Vetores", cache_stats["embeddings"]), ("Buscas", cache_stats["retrieval"]), ("Respostas", cache_stats["answers"])) if stats]
+            items.append(dbc.ListGroupItem(["Cache de Consultas", dbc.Badge(" • ".join(hit_rates), color="success", className="ms-1")], className="d-flex justify-content-between align-items-center"))
+        except Exception as e:
+            print(f"Erro ao ler cache de consultas: {e}")
+        load = agent_runtime.stats()
+        items.append(dbc.ListGroupItem(["Conversas em Andamento", dbc.Badge(f"{load['active']}/{load['limit']}" + (f" • {load['waiting']} na fila" if load["waiting"] else ""), color="warning" if load["waiting"] else "secondary", className="ms-1")], className="d-flex justify-content-between align-items-center"))
+        if is_processing:
+            counter = f"{job['done']}/{job['total']}" if job["total"] else str(job["done"] or "")
+            items.append(dbc.ListGroupItem([
+                html.Div([html.Small(f"{job['label']} • {job['stage']}", className="fw-bold"), html.Small(f"job {job['job_id']}", className="text-muted")], className="d-flex justify-content-between"),
+                dbc.Progress(value=job["percent"], label=f"{job['percent']}%" if job["total"] else "", striped=True, animated=True, className="my-1"),
+                html.Small(f"{counter} • {job['throughput']} itens/s • ETA {job_tracker.format_eta(job['eta_seconds'])}", className="text-muted"),
+            ]))
+        elif job and job.get("status") == "error":
+            items.append(dbc.ListGroupItem(html.Small(f"❌ Último job ({job['label']}): {job['message']}", className="text-danger")))
+        return items
     return []
 
 @app.callback([Output("setting-agent-name", "value"), Output("setting-welcome-message", "value"), Output("setting-chat-color", "value"), Output("setting-feed-url", "value"), Output("setting-auto-response", "value"), Output("setting-auto-escalation", "value"), Output("setting-log-conversation", "value")], Input("url", "pathname"))
@@ -1034,11 +1140,16 @@ def export_csv(n):
         return dcc.send_data_frame(pd.DataFrame(data).to_csv, "historico.csv", index=False)
     return no_update
 
-@app.callback(Output("feed-update-status", "children"), Input("force-update-feed-btn", "n_clicks"), prevent_initial_call=True)
+@app.callback(
+    Output("feed-update-status", "children"), Input("force-update-feed-btn", "n_clicks"),
+    background=True,
+    running=[(Output("force-update-feed-btn", "disabled"), True, False)],
+    prevent_initial_call=True
+)
 def force_feed(n):
     if n:
-        s, m = feed_manager.process_product_feed()
-        return html.Span(m, className="text-success" if s else "text-danger")
+        s, m, job_id = job_tracker.run_job("feed", "Atualização manual do feed", feed_manager.process_product_feed)
+        return html.Span(f"{m} (job {job_id})", className="text-success" if s else "text-danger")
     return ""
 
 # ==============================================================================
@@ -1063,16 +1174,26 @@ def public_user_msg(n, ns, val, hist):
     hist.append({"role": "assistant", "content": "thinking..."})
     return hist, ""
 
-@app.callback([Output("public_history_store", "data", allow_duplicate=True)], Input("public_history_store", "data"), [State("public_session_id", "data"), State("public_settings_store", "data")], prevent_initial_call=True)
 def public_agent_reply(hist, sid, st):
     if hist and hist[-1]["content"] == "thinking...":
         q = hist[-2]["content"]
-        resp = agent.get_response(q, hist[:-2], st)
+        resp = agent_reply(q, hist[:-2], st)
         if sid: database.log_conversation_turn(sid, 'user', q); database.log_conversation_turn(sid, 'assistant', resp)
         hist[-1]["content"] = resp
         return [hist]
     return no_update
 
+if CHAT_STREAMING:
+    app.clientside_callback(
+        ClientsideFunction(namespace="chat", function_name="stream_reply"),
+        Output("public_history_store", "data", allow_duplicate=True),
+        Input("public_history_store", "data"),
+        [State("public_session_id", "data"), State("public_settings_store", "data"), State("public_chat_div", "id")],
+        prevent_initial_call=True,
+    )
+else:
+    app.callback([Output("public_history_store", "data", allow_duplicate=True)], Input("public_history_store", "data"), [State("public_session_id", "data"), State("public_settings_store", "data")], prevent_initial_call=True)(public_agent_reply)
+
 @app.callback(Output("public_chat_div", "children", allow_duplicate=True), Input("public_history_store", "data"), prevent_initial_call=True)
 def render_public_chat(hist): return [create_chat_bubble(m['role'], m['content'], m['content']=='thinking...') for m in hist or []]
 
@@ -3,12 +3,14 @@ import os
 from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, MetaData, Boolean, Float
 from sqlalchemy.orm import declarative_base, sessionmaker
 from datetime import datetime
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, inspect, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from zoneinfo import ZoneInfo
 from werkzeug.security import generate_password_hash, check_password_hash
+import product_families
 
 # --- Configuração do Banco de Dados ---
-DATABASE_FILE = "bob_database.sqlite"
+DATABASE_FILE = os.environ.get("DATABASE_FILE", "bob_database.sqlite") # Benchmarks usam um arquivo temporário
 DATABASE_URL = f"sqlite:///{DATABASE_FILE}"
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -44,6 +46,55 @@ class ChatSession(Base):
     is_resolved = Column(Boolean, default=None, nullable=True)
     satisfaction_score = Column(Integer, default=None, nullable=True)
 
+class Product(Base):
+    """Catálogo estruturado: gravado direto pelos parsers de feed, lido pela indexação e pelo agente."""
+    __tablename__ = "products"
+    id = Column(String, primary_key=True, index=True)  # g:id do feed
+    title = Column(String)
+    price = Column(Float, nullable=True)
+    currency = Column(String, default="BRL")
+    sale_price = Column(Float, nullable=True)
+    sale_price_effective_date = Column(String, default="")
+    availability = Column(String, default="")
+    category = Column(String, default="")
+    image = Column(String, default="")
+    link = Column(String, index=True)
+    description = Column(Text, default="")
+    dimensions = Column(String, default="")
+    seller = Column(String, default="")
+    feed_id = Column(Integer, index=True, nullable=True)  # Feed de origem (tabela feeds)
+    family_id = Column(String, index=True, default="")  # Variações do mesmo produto (product_families)
+    synced_at = Column(DateTime, default=datetime.utcnow)
+
+PRODUCT_FIELDS = ["id", "title", "price", "currency", "sale_price", "sale_price_effective_date", "availability", "category", "image", "link", "description", "dimensions", "seller", "feed_id", "family_id"]
+
+class Feed(Base):
+    """Registro de feeds (loja própria, sellers, marketplaces): cada um com agenda e estado HTTP próprios."""
+    __tablename__ = "feeds"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String)
+    url = Column(String, unique=True, nullable=False)
+    interval_minutes = Column(Integer, default=1440)
+    parser_profile = Column(String, default="google_shopping")
+    enabled = Column(Boolean, default=True)
+    id_prefix = Column(String, default="")  # "" no feed principal (g:id puro); "f<id>-" nos demais, evita colisão de g:id
+    etag = Column(String, default="")
+    last_modified = Column(String, default="")
+    digest = Column(String, default="")
+    content_hash = Column(String, default="")  # sha256 dos bytes baixados (calculado durante o download)
+    summary = Column(String, default="")
+    last_run_at = Column(DateTime, nullable=True)
+    last_status = Column(String, default="pending")
+    last_message = Column(String, default="")
+
+FEED_FIELDS = ["id", "name", "url", "interval_minutes", "parser_profile", "enabled", "id_prefix", "etag", "last_modified", "digest", "content_hash", "summary", "last_run_at", "last_status", "last_message"]
+
+# Colunas adicionadas depois da criação das tabelas (create_all não altera tabela existente)
+ADDED_COLUMNS = {
+    "products": {"feed_id": "INTEGER", "family_id": "VARCHAR DEFAULT ''"},
+    "feeds": {"content_hash": "VARCHAR DEFAULT ''"},
+}
+
 # --- Funções de Utilitário ---
 
 def init_db():
@@ -51,6 +102,19 @@ def init_db():
     if db_dir and not os.path.exists(db_dir):
         os.makedirs(db_dir)
     Base.metadata.create_all(bind=engine)
+    migrate_columns()
+
+def migrate_columns():
+    """ALTER TABLE ADD COLUMN para as colunas de ADDED_COLUMNS que faltam num banco antigo."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {col["name"] for col in inspector.get_columns(table)}
+            for name, ddl in columns.items():
+                if name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+                    conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_{name} ON {table} ({name})"))
+                    print(f"🛠️ Migração: coluna {table}.{name} criada.")
 
 # --- Funções de Conversa e Sessão ---
 
@@ -205,6 +269,212 @@ def get_top_questions(limit=5):
     finally:
         db.close()
 
+# --- Catálogo de Produtos ---
+
+def product_to_dict(product):
+    return {field: getattr(product, field) for field in PRODUCT_FIELDS}
+
+def save_catalog(records, batch_size=250, on_batch=None, feed_id=None):
+    """
+    Grava os registros vindos do parser (iterável, consumido em lotes) com upsert por id.
+    Produtos que não vieram nesta carga são removidos (só os do mesmo feed, se feed_id for dado).
+    Retorna o total gravado. on_batch(gravados) é chamado após cada lote.
+    """
+    db = SessionLocal()
+    sync_started = datetime.utcnow()
+    total = 0
+    try:
+        batch = []
+        for record in records:
+            batch.append({
+                **{f: record.get(f) for f in PRODUCT_FIELDS},
+                "feed_id": feed_id, "family_id": product_families.family_id(record), "synced_at": sync_started,
+            })
+            if len(batch) >= batch_size:
+                _upsert_products(db, batch)
+                total += len(batch)
+                batch = []
+                if on_batch: on_batch(total)
+        if batch:
+            _upsert_products(db, batch)
+            total += len(batch)
+            if on_batch: on_batch(total)
+
+        if total:
+            stale = db.query(Product).filter(Product.synced_at < sync_started)
+            if feed_id is not None:
+                stale = stale.filter(Product.feed_id == feed_id)
+            stale.delete(synchronize_session=False)
+        db.commit()
+        return total
+    finally:
+        db.close()
+
+def _upsert_products(db, rows):
+    stmt = sqlite_insert(Product).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Product.id],
+        set_={col: stmt.excluded[col] for col in rows[0] if col != "id"}
+    )
+    db.execute(stmt)
+
+def get_product(product_id: str):
+    db = SessionLocal()
+    try:
+        product = db.get(Product, product_id)
+        return product_to_dict(product) if product else None
+    finally:
+        db.close()
+
+def get_product_by_link(link: str):
+    db = SessionLocal()
+    try:
+        product = db.query(Product).filter(Product.link == link).first()
+        return product_to_dict(product) if product else None
+    finally:
+        db.close()
+
+def get_products_by_ids(product_ids):
+    """{id: registro} para vários ids numa única consulta."""
+    if not product_ids: return {}
+    db = SessionLocal()
+    try:
+        products = db.query(Product).filter(Product.id.in_(list(product_ids))).all()
+        return {p.id: product_to_dict(p) for p in products}
+    finally:
+        db.close()
+
+def get_family_variants(family_ids):
+    """{family_id: [registros]} de todas as variações das famílias pedidas."""
+    family_ids = [f for f in family_ids if f]
+    if not family_ids: return {}
+    db = SessionLocal()
+    try:
+        variants = {}
+        for product in db.query(Product).filter(Product.family_id.in_(family_ids)).order_by(Product.price).all():
+            variants.setdefault(product.family_id, []).append(product_to_dict(product))
+        return variants
+    finally:
+        db.close()
+
+def iter_products(batch_size=500):
+    """Percorre o catálogo inteiro em lotes, sem carregar tudo de uma vez."""
+    db = SessionLocal()
+    try:
+        for product in db.query(Product).order_by(Product.id).yield_per(batch_size):
+            yield product_to_dict(product)
+    finally:
+        db.close()
+
+def iter_offers():
+    """Só as colunas de oferta (preço, promoção, estoque) de todo o catálogo, para o price_index."""
+    db = SessionLocal()
+    try:
+        columns = (Product.id, Product.link, Product.price, Product.currency, Product.sale_price, Product.sale_price_effective_date, Product.availability)
+        for row in db.query(*columns).yield_per(1000):
+            yield row._asdict()
+    finally:
+        db.close()
+
+def count_products(feed_id=None):
+    db = SessionLocal()
+    try:
+        query = db.query(func.count(Product.id))
+        if feed_id is not None:
+            query = query.filter(Product.feed_id == feed_id)
+        return query.scalar() or 0
+    finally:
+        db.close()
+
+# --- Registro de Feeds ---
+
+def feed_to_dict(feed):
+    return {field: getattr(feed, field) for field in FEED_FIELDS}
+
+def add_feed(name: str, url: str, interval_minutes: int = 1440, parser_profile: str = "google_shopping", enabled: bool = True, primary: bool = False):
+    """Cadastra um feed (ou devolve o já cadastrado com a mesma URL)."""
+    db = SessionLocal()
+    try:
+        feed = db.query(Feed).filter(Feed.url == url).first()
+        if not feed:
+            feed = Feed(name=name, url=url, interval_minutes=interval_minutes, parser_profile=parser_profile, enabled=enabled)
+            db.add(feed)
+            db.flush()
+            feed.id_prefix = "" if primary else f"f{feed.id}-"
+            db.commit()
+        return feed_to_dict(feed)
+    finally:
+        db.close()
+
+def get_feeds(enabled_only: bool = False):
+    db = SessionLocal()
+    try:
+        query = db.query(Feed)
+        if enabled_only:
+            query = query.filter(Feed.enabled == True)
+        return [feed_to_dict(f) for f in query.order_by(Feed.id).all()]
+    finally:
+        db.close()
+
+def get_feed(feed_id: int):
+    db = SessionLocal()
+    try:
+        feed = db.get(Feed, feed_id)
+        return feed_to_dict(feed) if feed else None
+    finally:
+        db.close()
+
+def get_feed_by_url(url: str):
+    db = SessionLocal()
+    try:
+        feed = db.query(Feed).filter(Feed.url == url).first()
+        return feed_to_dict(feed) if feed else None
+    finally:
+        db.close()
+
+def update_feed_record(feed_id: int, **fields):
+    """Atualiza estado/configuração de um feed (etag, digest, last_status, interval_minutes...)."""
+    db = SessionLocal()
+    try:
+        feed = db.get(Feed, feed_id)
+        if not feed: return False
+        for key, value in fields.items():
+            if key in FEED_FIELDS and key != "id":
+                setattr(feed, key, value)
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+def delete_feed(feed_id: int):
+    """Remove o feed e os produtos que vieram dele."""
+    db = SessionLocal()
+    try:
+        db.query(Product).filter(Product.feed_id == feed_id).delete(synchronize_session=False)
+        deleted = db.query(Feed).filter(Feed.id == feed_id).delete(synchronize_session=False)
+        db.commit()
+        return bool(deleted)
+    finally:
+        db.close()
+
+def get_due_feeds(now=None):
+    """Feeds habilitados cujo intervalo já venceu (ou que nunca rodaram)."""
+    now = now or datetime.utcnow()
+    return [
+        f for f in get_feeds(enabled_only=True)
+        if f["last_run_at"] is None or (now - f["last_run_at"]).total_seconds() >= f["interval_minutes"] * 60
+    ]
+
+def assign_orphan_products(feed_id: int):
+    """Produtos gravados antes do registro de feeds (feed_id nulo) passam a pertencer a feed_id."""
+    db = SessionLocal()
+    try:
+        updated = db.query(Product).filter(Product.feed_id == None).update({Product.feed_id: feed_id}, synchronize_session=False)
+        db.commit()
+        return updated
+    finally:
+        db.close()
+
 # --- Configurações e Usuários ---
 
 def get_setting(key: str, default: str = None):
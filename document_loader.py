@@ -0,0 +1,134 @@
+# document_loader.py - LEITURA DE PDF/DOCX EM PARALELO, COM CACHE DO TEXTO EXTRAÍDO
+# Manuais e FAQs quase nunca mudam, mas eram re-lidos a cada atualização de feed.
+# O texto extraído fica em disco (diskcache) indexado por nome + tamanho + mtime; se só o mtime
+# mudou (arquivo re-enviado igual), o sha256 do conteúdo confirma e o cache continua valendo.
+# Arquivos novos/alterados são lidos num pool de processos (o parse de PDF é CPU puro).
+import os
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import diskcache
+
+FILE_LOAD_WORKERS = int(os.environ.get("FILE_LOAD_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def extract_pages(file_path):
+    """Roda no processo filho: [(texto, metadados)] do PDF (uma por página) ou DOCX."""
+    # Import aqui: o processo filho (spawn) só carrega o loader que vai usar
+    if file_path.lower().endswith('.pdf'):
+        from langchain_community.document_loaders import PyPDFLoader
+        docs = PyPDFLoader(file_path).load()
+    else:
+        from langchain_community.document_loaders import Docx2txtLoader
+        docs = Docx2txtLoader(file_path).load()
+    return [(d.page_content, d.metadata) for d in docs]
+
+def _fingerprint(file_path):
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+def load_files(file_paths, cache_dir, on_file=None):
+    """
+    {caminho: [(texto, metadados)]} para os PDF/DOCX pedidos. Só os arquivos novos ou
+    alterados são lidos de fato. on_file(feitos, total) recebe o andamento.
+    Arquivo que falhou fica de fora do resultado (erro impresso, como antes).
+    """
+    cache = diskcache.Cache(cache_dir)
+    results, to_read = {}, {}
+    cached = 0
+    try:
+        for file_path in file_paths:
+            name = os.path.basename(file_path)
+            fingerprint = _fingerprint(file_path)
+            entry = cache.get(f"file:{name}")
+            if entry and entry["size"] == fingerprint["size"] and entry["mtime"] == fingerprint["mtime"]:
+                pages = cache.get(f"text:{entry['sha256']}")
+                if pages is not None:
+                    results[file_path] = pages
+                    cached += 1
+                    continue
+
+            sha256 = file_sha256(file_path)
+            pages = cache.get(f"text:{sha256}")
+            if pages is not None:
+                # Mesmo conteúdo (re-upload ou renomeado): só atualiza a impressão digital
+                cache.set(f"file:{name}", {**fingerprint, "sha256": sha256})
+                results[file_path] = pages
+                cached += 1
+            else:
+                to_read[file_path] = {**fingerprint, "sha256": sha256}
+
+        done = cached
+        if on_file: on_file(done, len(file_paths))
+        for file_path, pages in _extract_all(list(to_read)):
+            done += 1
+            if on_file: on_file(done, len(file_paths))
+            if pages is None: continue
+            entry = to_read[file_path]
+            cache.set(f"text:{entry['sha256']}", pages)
+            cache.set(f"file:{os.path.basename(file_path)}", entry)
+            results[file_path] = pages
+
+        _prune(cache, {os.path.basename(p) for p in file_paths})
+    finally:
+        cache.close()
+
+    print(f"📄 Arquivos: {cached} do cache, {len(to_read)} lidos.")
+    # Metadado 'source' aponta para o caminho atual (o texto pode ter vindo de um arquivo renomeado)
+    return {
+        path: [(text, {**meta, "source": path}) for text, meta in pages]
+        for path, pages in results.items()
+    }
+
+def _extract_all(file_paths):
+    """(caminho, páginas ou None) de cada arquivo; pool de processos só quando vale a pena."""
+    if not file_paths: return
+    if len(file_paths) == 1 or FILE_LOAD_WORKERS <= 1:
+        for file_path in file_paths:
+            yield file_path, _safe_extract(file_path)
+        return
+
+    # spawn: o processo do painel tem threads (scheduler, dash); fork com threads pode travar
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(FILE_LOAD_WORKERS, len(file_paths)), mp_context=context) as pool:
+        futures = {pool.submit(extract_pages, file_path): file_path for file_path in file_paths}
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                pages = future.result()
+                print(f" > {os.path.basename(file_path)}: {len(pages)} páginas.")
+                yield file_path, pages
+            except Exception as e:
+                print(f"Erro ao ler {os.path.basename(file_path)}: {e}")
+                yield file_path, None
+
+def _safe_extract(file_path):
+    try:
+        pages = extract_pages(file_path)
+        print(f" > {os.path.basename(file_path)}: {len(pages)} páginas.")
+        return pages
+    except Exception as e:
+        print(f"Erro ao ler {os.path.basename(file_path)}: {e}")
+        return None
+
+def _prune(cache, current_names):
+    """Esquece arquivos que saíram da pasta e textos que nenhum arquivo usa mais."""
+    in_use = set()
+    for key in list(cache.iterkeys()):
+        if not key.startswith("file:"): continue
+        if key[len("file:"):] not in current_names:
+            cache.delete(key)
+        else:
+            entry = cache.get(key)
+            if entry: in_use.add(entry["sha256"])
+    for key in list(cache.iterkeys()):
+        if key.startswith("text:") and key[len("text:"):] not in in_use:
+            cache.delete(key)
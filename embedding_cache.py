@@ -0,0 +1,78 @@
+# embedding_cache.py - CACHE PERSISTENTE DE EMBEDDINGS (modelo + hash do texto -> vetor)
+# Fica no mesmo volume Docker do ChromaDB: perder a coleção não obriga a pagar a API de novo.
+import hashlib
+import threading
+from array import array
+
+import diskcache
+from langchain_core.embeddings import Embeddings
+
+from query_cache import normalize_query
+
+class CachedEmbeddings(Embeddings):
+    """
+    Envolve um Embeddings do LangChain. embed_documents só chama a API para os textos
+    que nunca foram vistos com este modelo; o resto vem do disco.
+    Despejo LRU quando o cache passa de size_limit bytes.
+    """
+
+    def __init__(self, embeddings, model_name, cache_dir, size_limit, query_embeddings=None, query_cache=None):
+        self.embeddings = embeddings
+        self.query_embeddings = query_embeddings or embeddings
+        self.query_cache = query_cache # QueryCache (memória + disco) para as perguntas do chat
+        self.model_name = model_name
+        self.cache = diskcache.Cache(cache_dir, size_limit=size_limit, eviction_policy="least-recently-used")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed_documents(self, texts):
+        keys = [self._key(t) for t in texts]
+        vectors = []
+        for key in keys:
+            raw = self.cache.get(key)
+            vectors.append(array("f", raw).tolist() if raw is not None else None)
+
+        missing = [i for i, vec in enumerate(vectors) if vec is None]
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            fresh = self.embeddings.embed_documents([texts[i] for i in missing])
+            for i, vec in zip(missing, fresh):
+                vectors[i] = vec
+                # float32 compacto (o Chroma também guarda em float32)
+                self.cache.set(keys[i], array("f", vec).tobytes())
+        return vectors
+
+    def embed_query(self, text):
+        """Pergunta repetida (normalizada) não chama a API: o vetor vem do query_cache."""
+        if self.query_cache is None:
+            return self.query_embeddings.embed_query(text)
+        key = self._key(normalize_query(text))
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = self.query_embeddings.embed_query(text)
+            self.query_cache.set(key, vector)
+        return vector
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "entries": len(self.cache),
+            "size_mb": round(self.cache.volume() / (1024 * 1024), 1),
+            "size_limit_mb": round(self.cache.size_limit / (1024 * 1024), 1),
+        }
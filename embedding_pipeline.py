@@ -0,0 +1,103 @@
+# embedding_pipeline.py - EMBEDDING EM LOTES CONCORRENTES (com recuo adaptativo em 429)
+# Os chunks vão para a API em lotes paralelos; cada lote é gravado no Chroma assim que termina.
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import openai
+
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "128"))
+EMBED_MAX_IN_FLIGHT = int(os.environ.get("EMBED_MAX_IN_FLIGHT", "4"))
+EMBED_MAX_RETRIES = int(os.environ.get("EMBED_MAX_RETRIES", "6"))
+
+class AdaptiveLimiter:
+    """
+    Limita quantos lotes ficam em voo ao mesmo tempo.
+    Cada 429 corta o limite pela metade; cada sucesso devolve um pouco (AIMD).
+    """
+
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max(1, max_in_flight)
+        self.limit = float(self.max_in_flight)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(float(self.max_in_flight), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+# Erros que valem nova tentativa; só o 429 reduz a concorrência
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+def is_rate_limited(error):
+    if isinstance(error, openai.RateLimitError):
+        return True
+    return getattr(error, "status_code", None) == 429
+
+def retry_after_seconds(error, attempt):
+    """Respeita o Retry-After do servidor; senão, backoff exponencial com jitter."""
+    response = getattr(error, "response", None)
+    header = response.headers.get("retry-after") if response is not None else None
+    try:
+        if header: return float(header)
+    except ValueError:
+        pass
+    return min(60.0, 2 ** attempt) + random.uniform(0, 1)
+
+def embed_batch(embeddings, texts, limiter):
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        limiter.acquire()
+        try:
+            vectors = embeddings.embed_documents(texts)
+        except Exception as e:
+            limiter.release(throttled=is_rate_limited(e))
+            if not (isinstance(e, RETRYABLE_ERRORS) or is_rate_limited(e)) or attempt == EMBED_MAX_RETRIES:
+                raise
+            wait = retry_after_seconds(e, attempt)
+            print(f"⏳ Erro temporário na API de embeddings ({type(e).__name__}), limite atual {int(limiter.limit)} lotes. Aguardando {wait:.1f}s...")
+            time.sleep(wait)
+            continue
+        limiter.release()
+        return vectors
+
+def embed_and_store(vector_store, docs, ids, embeddings, batch_size=None, max_in_flight=None, on_batch=None):
+    """
+    Embeda docs em lotes concorrentes e faz upsert de cada lote no Chroma ao terminar.
+    on_batch(gravados, total) é chamado após cada lote. Retorna o total gravado.
+    """
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    max_in_flight = max_in_flight or EMBED_MAX_IN_FLIGHT
+    limiter = AdaptiveLimiter(max_in_flight)
+    batches = [(start, start + batch_size) for start in range(0, len(docs), batch_size)]
+
+    written = 0
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        futures = {
+            pool.submit(embed_batch, embeddings, [d.page_content for d in docs[a:b]], limiter): (a, b)
+            for a, b in batches
+        }
+        # Gravação fica na thread principal: um único escritor no Chroma
+        for future in as_completed(futures):
+            a, b = futures[future]
+            vector_store._collection.upsert(
+                ids=ids[a:b],
+                embeddings=future.result(),
+                documents=[d.page_content for d in docs[a:b]],
+                metadatas=[d.metadata for d in docs[a:b]],
+            )
+            written += b - a
+            if on_batch: on_batch(written, len(docs))
+    return written
@@ -0,0 +1,96 @@
+# fake_embedding_server.py - SERVIDOR LOCAL QUE IMITA O /v1/embeddings DA OPENAI
+# Para testar a indexação sem internet e sem custo:
+#   python fake_embedding_server.py --port 8765 --max-rps 20
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake EMBEDDING_CHECK_CTX_LENGTH=0 \
+#       python -c "import rag_manager; rag_manager.process_knowledge_base()"
+# Vetores determinísticos (mesmo texto -> mesmo vetor). --max-rps devolve 429 + Retry-After acima da taxa.
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def fake_vector(item, dim):
+    """Vetor unitário derivado do hash do texto (ou da lista de tokens)."""
+    seed = hashlib.sha256(json.dumps(item, ensure_ascii=False).encode("utf-8")).digest()
+    rng = random.Random(seed)
+    values = [rng.random() - 0.5 for _ in range(dim)]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [round(v / norm, 6) for v in values]
+
+class TokenBucket:
+    """Limite de requisições por segundo, como o rate limit da API real."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+def make_handler(dim, max_rps, latency):
+    bucket = TokenBucket(max_rps) if max_rps else None
+
+    class EmbeddingHandler(BaseHTTPRequestHandler):
+        def _send(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/embeddings"):
+                return self._send(404, {"error": {"message": "not found"}})
+
+            if bucket and not bucket.take():
+                return self._send(429, {"error": {"message": "Rate limit reached (fake)", "type": "requests", "code": "rate_limit_exceeded"}}, {"Retry-After": "1"})
+
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            inputs = request.get("input", [])
+            # Aceita texto único, lista de textos, lista de tokens ou lista de listas de tokens
+            if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                inputs = [inputs]
+
+            if latency: time.sleep(latency)
+            self._send(200, {
+                "object": "list",
+                "data": [{"object": "embedding", "index": i, "embedding": fake_vector(item, dim)} for i, item in enumerate(inputs)],
+                "model": request.get("model", "fake-embedding"),
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return EmbeddingHandler
+
+def serve(port=8765, dim=1536, max_rps=0.0, latency=0.0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(dim, max_rps, latency))
+    print(f"🧪 Servidor de embeddings falso em http://127.0.0.1:{server.server_port}/v1 (dim={dim})")
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in local do endpoint de embeddings da OpenAI.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--max-rps", type=float, default=0.0, help="Requisições por segundo antes de responder 429 (0 = sem limite).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Atraso artificial por requisição, em segundos.")
+    args = parser.parse_args()
+    serve(args.port, args.dim, args.max_rps, args.latency).serve_forever()
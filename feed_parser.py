@@ -0,0 +1,127 @@
+# feed_parser.py - LEITURA EM STREAMING (ATOM <entry> / RSS <item>)
+# Usado pelo scheduler_service e pelo feed_manager: um produto por vez, memória constante.
+import hashlib
+import html
+import json
+import re
+import xml.etree.ElementTree as ET
+
+PRODUCT_TAGS = ('item', 'entry')
+
+def clean_tag_name(tag):
+    """Remove o namespace chato (ex: {http://...}title -> title)"""
+    if '}' in tag:
+        return tag.split('}', 1)[1]
+    return tag
+
+def iter_product_nodes(source):
+    """
+    Percorre o feed (caminho ou arquivo binário) entregando um <entry>/<item> por vez.
+    O nó é liberado assim que o consumidor pede o próximo, então a memória
+    não cresce com o tamanho do feed.
+    """
+    parents = []
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            parents.append(elem)
+            continue
+
+        parents.pop()
+        if clean_tag_name(elem.tag).lower() not in PRODUCT_TAGS:
+            continue
+
+        yield elem
+
+        # Libera o nó consumido: filhos e a referência guardada pelo pai
+        elem.clear()
+        if parents:
+            parents[-1].remove(elem)
+
+# --- NORMALIZAÇÃO (registro tipado do catálogo) ---
+
+def clean_html(raw_html):
+    """Remove tags/entidades e espaços duplicados da descrição."""
+    if not raw_html: return ""
+    text = html.unescape(re.sub(r'<[^>]+>', ' ', raw_html))
+    return re.sub(r'\s+', ' ', text).strip()
+
+def parse_price(raw):
+    """'11.20 BRL' -> (11.2, 'BRL'). Aceita também '1.234,56'. Sem número -> (None, '')."""
+    if not raw: return None, ""
+    match = re.search(r'\d[\d.,]*', raw)
+    if not match: return None, ""
+    number = match.group(0)
+    if ',' in number:
+        number = number.replace('.', '').replace(',', '.')
+    currency = re.sub(r'[\d.,\s]', '', raw).upper()
+    try:
+        return float(number), currency
+    except ValueError:
+        return None, currency
+
+def parse_product(node):
+    """
+    Converte um <entry>/<item> em registro do catálogo.
+    Retorna None se o item não tiver link válido (mesma regra do V22).
+    """
+    fields = {}
+    link = ""
+    for child in node:
+        tag = clean_tag_name(child.tag).lower()
+        text = child.text.strip() if child.text else ""
+        if tag == 'link':
+            # Link pode ser texto (<g:link>...) ou atributo (<link href=...>)
+            link = link or text or child.attrib.get('href', '')
+        elif text and tag not in fields:
+            fields[tag] = text
+
+    if not link or "http" not in link:
+        return None
+
+    price, currency = parse_price(fields.get('price'))
+    sale_price, _ = parse_price(fields.get('sale_price'))
+    size = " x ".join(fields[k] for k in ('product_length', 'product_width', 'product_height') if k in fields)
+    dimensions = ", ".join(part for part in (size, fields.get('product_weight', '')) if part)
+
+    return {
+        "id": fields.get('id') or hashlib.sha1(link.encode('utf-8')).hexdigest()[:16],
+        "title": fields.get('title', 'Produto'),
+        "price": price,
+        "currency": currency,
+        "sale_price": sale_price,
+        "sale_price_effective_date": fields.get('sale_price_effective_date', ''),
+        "availability": fields.get('availability', ''),
+        "category": fields.get('google_product_category') or fields.get('product_type', ''),
+        "image": fields.get('image_link', ''),
+        "link": link,
+        "description": clean_html(fields.get('description') or fields.get('summary'))[:600],
+        "dimensions": dimensions,
+        "seller": fields.get('custom_label_0', ''),
+    }
+
+# Perfis de parser por feed (coluna feeds.parser_profile): nome -> função <entry>/<item> -> registro
+PARSER_PROFILES = {
+    "google_shopping": parse_product,  # Google Merchant (Atom/RSS com g:*), usado pela loja e pelos sellers
+}
+
+def get_parser(profile):
+    if profile not in PARSER_PROFILES:
+        raise ValueError(f"Perfil de parser desconhecido: {profile}")
+    return PARSER_PROFILES[profile]
+
+def iter_products(source, profile="google_shopping"):
+    """Registros normalizados, um por vez, direto do XML."""
+    parse = get_parser(profile)
+    for node in iter_product_nodes(source):
+        record = parse(node)
+        if record:
+            yield record
+
+def feed_digest(source, profile="google_shopping"):
+    """Digest dos produtos normalizados (detecta mudança real, ignorando formatação do XML)."""
+    digest = hashlib.sha256()
+    count = 0
+    for record in iter_products(source, profile):
+        digest.update(json.dumps(record, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+        count += 1
+    return digest.hexdigest(), count
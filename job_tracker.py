@@ -0,0 +1,130 @@
+# job_tracker.py - ESTADO DOS JOBS DE INDEXAÇÃO (etapa, %, vazão, ETA)
+# Fica num diskcache: os callbacks em background do Dash rodam em outro processo,
+# e o polling do dashboard lê daqui em vez de reler arquivos.
+import os
+import time
+import uuid
+
+import diskcache
+
+JOB_CACHE_DIR = os.environ.get("JOB_CACHE_DIR", "./job_cache")
+JOB_STALE_SECONDS = 30 * 60 # Job "rodando" sem atualização há mais que isso é considerado morto
+CURRENT_KEY = "job:current"
+
+_cache = None
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = diskcache.Cache(JOB_CACHE_DIR)
+    return _cache
+
+def start_job(kind, label):
+    """Registra um job novo e o torna o job atual. Retorna o job_id."""
+    job_id = uuid.uuid4().hex[:8]
+    now = time.time()
+    job = {
+        "job_id": job_id,
+        "kind": kind,
+        "label": label,
+        "status": "running",
+        "stage": "Iniciando...",
+        "done": 0,
+        "total": 0,
+        "percent": 0,
+        "throughput": 0.0,
+        "eta_seconds": None,
+        "message": "",
+        "started_at": now,
+        "stage_started_at": now,
+        "updated_at": now,
+    }
+    cache = get_cache()
+    with cache.transact():
+        cache.set(f"job:{job_id}", job, expire=7 * 24 * 3600)
+        cache.set(CURRENT_KEY, job_id)
+    return job_id
+
+def update_job(job_id, stage=None, done=None, total=None, message=None):
+    """Atualiza etapa/progresso; percentual, vazão (itens/s) e ETA são calculados aqui."""
+    cache = get_cache()
+    with cache.transact():
+        job = cache.get(f"job:{job_id}")
+        if not job: return
+        now = time.time()
+        if stage and stage != job["stage"]:
+            job.update(stage=stage, stage_started_at=now, done=0, total=0)
+        if done is not None: job["done"] = done
+        if total is not None: job["total"] = total
+        if message is not None: job["message"] = message
+
+        elapsed = max(now - job["stage_started_at"], 1e-6)
+        job["throughput"] = round(job["done"] / elapsed, 1)
+        if job["total"]:
+            job["percent"] = min(100, int(job["done"] * 100 / job["total"]))
+            remaining = job["total"] - job["done"]
+            job["eta_seconds"] = int(remaining / job["throughput"]) if job["throughput"] else None
+        else:
+            job["percent"] = 0
+            job["eta_seconds"] = None
+        job["updated_at"] = now
+        cache.set(f"job:{job_id}", job, expire=7 * 24 * 3600)
+
+def finish_job(job_id, success, message=""):
+    cache = get_cache()
+    with cache.transact():
+        job = cache.get(f"job:{job_id}")
+        if not job: return
+        job.update(status="done" if success else "error", message=message, percent=100 if success else job["percent"], eta_seconds=None, updated_at=time.time())
+        cache.set(f"job:{job_id}", job, expire=7 * 24 * 3600)
+
+def get_job(job_id):
+    return get_cache().get(f"job:{job_id}")
+
+def get_current_job():
+    job_id = get_cache().get(CURRENT_KEY)
+    return get_job(job_id) if job_id else None
+
+def is_busy():
+    """Há um job rodando (e vivo)?"""
+    job = get_current_job()
+    return bool(job and job["status"] == "running" and time.time() - job["updated_at"] < JOB_STALE_SECONDS)
+
+def claim_job(kind, label):
+    """
+    Verifica e ocupa a vaga numa transação só (SQLite do diskcache, vale entre processos):
+    dois cliques, ou um clique junto com o scheduler, não passam ambos pelo is_busy().
+    Retorna (job_id, None) ou (None, job que já está rodando).
+    """
+    cache = get_cache()
+    with cache.transact():
+        if is_busy(): return None, get_current_job()
+        return start_job(kind, label), None
+
+def make_reporter(job_id):
+    """Callback progress(stage, done=None, total=None) que as etapas do pipeline chamam."""
+    def progress(stage, done=None, total=None):
+        update_job(job_id, stage=stage, done=done, total=total)
+    return progress
+
+def run_job(kind, label, fn, *args, **kwargs):
+    """
+    Executa fn(*args, progress=..., **kwargs) como job rastreado.
+    fn pode devolver bool ou (bool, mensagem). Retorna (sucesso, mensagem, job_id).
+    """
+    job_id, running = claim_job(kind, label)
+    if job_id is None:
+        return False, f"Já existe um job em andamento ({running['label']}, {running['percent']}%).", running["job_id"]
+
+    try:
+        result = fn(*args, progress=make_reporter(job_id), **kwargs)
+        success, message = result if isinstance(result, tuple) else (bool(result), "")
+    except Exception as e:
+        success, message = False, f"Erro: {e}"
+    finish_job(job_id, success, message)
+    return success, message, job_id
+
+def format_eta(seconds):
+    if seconds is None: return "--"
+    minutes, secs = divmod(int(seconds), 60)
+    return f"{minutes}m{secs:02d}s" if minutes else f"{secs}s"
@@ -0,0 +1,139 @@
+# lexical_index.py - ÍNDICE INVERTIDO BM25 (catálogo + FAQ), SEM ACENTO
+# Montado na indexação com os mesmos ids do Chroma. Serve para duas coisas:
+#  1. Busca híbrida: o ranking BM25 entra na fusão (RRF) com o ranking vetorial.
+#  2. Atalho lexical: "simparic", "bravecto 10-20kg" ou o nome exato de um produto são
+#     respondidos só pelo índice, sem rewrite e sem embedding.
+import os
+import re
+import math
+import pickle
+import threading
+from collections import Counter
+
+import query_filters
+from category_index import BROWSE_WORDS
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_BOOST = 2 # Termos do título contam em dobro
+RARE_TERM_MAX_DF = int(os.environ.get("LEXICAL_RARE_DF", "25")) # Termo em até N documentos = marca/modelo
+MAX_LOOKUP_TERMS = 6 # Acima disso é uma pergunta, não uma busca por nome
+STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "uns", "umas", "de", "da", "do", "das", "dos", "e", "ou", "em", "no", "na",
+    "nos", "nas", "para", "pra", "pro", "com", "sem", "por", "que", "se", "ao", "aos", "the", "and", "of",
+}
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+_lock = threading.Lock()
+_loaded = {"path": None, "mtime": None, "index": None}
+
+def tokenize(text):
+    """'Bravecto 10-20kg p/ Cães' -> ['bravecto', '10', '20kg', 'caes']"""
+    return [t for t in _TOKEN.findall(query_filters.fold(text)) if t not in STOPWORDS and (len(t) > 1 or t.isdigit())]
+
+def _generic_terms():
+    """
+    Palavras que não identificam produto: conectivos, espécies e tipos ('simparic para gato' -> simparic;
+    'antipulgas para cachorro' é navegação, não busca por nome). Marcas não estão no vocabulário de tipos.
+    """
+    terms = set(BROWSE_WORDS)
+    for words in query_filters.PET_SPECIES.values():
+        for word in words: terms.update(tokenize(word))
+    for label, words in query_filters.PRODUCT_TYPES.values():
+        for word in words: terms.update(tokenize(word))
+    return terms
+
+GENERIC_TERMS = _generic_terms()
+
+def build(chunks, ids, collection, generation):
+    """Índice BM25 dos chunks (mesma ordem/ids do Chroma)."""
+    postings, title_postings, titles = {}, {}, {}
+    lengths = []
+    for position, chunk in enumerate(chunks):
+        title = tokenize(chunk.metadata.get("title") or "")
+        tokens = tokenize(chunk.page_content) + title * (TITLE_BOOST - 1)
+        for term, tf in Counter(tokens).items():
+            postings.setdefault(term, []).append((position, tf))
+        for term in set(title):
+            title_postings.setdefault(term, []).append(position)
+        lengths.append(len(tokens))
+        if title: titles.setdefault(" ".join(title), []).append(position)
+    return {
+        "collection": collection,
+        "generation": generation,
+        "ids": list(ids),
+        "lengths": lengths,
+        "avg_length": (sum(lengths) / len(lengths)) if lengths else 0.0,
+        "titles": titles, # título sem acento/stopwords -> posições (acerto exato)
+        "postings": postings,
+        "title_postings": title_postings, # termo -> posições cujo título tem o termo (atalho)
+    }
+
+def save(index, path):
+    """Gravação atômica (os.replace), como o ponteiro de geração."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, 'wb') as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, path)
+
+def load(path):
+    """Índice em memória; recarrega quando o arquivo muda (indexação em outro processo). None se não existe."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if _loaded["path"] == path and _loaded["mtime"] == mtime:
+        return _loaded["index"]
+    with _lock:
+        if _loaded["path"] != path or _loaded["mtime"] != mtime:
+            with open(path, 'rb') as f:
+                index = pickle.load(f)
+            _loaded.update(path=path, mtime=mtime, index=index)
+            print(f"🔤 Índice lexical carregado: {len(index['ids'])} documentos, {len(index['postings'])} termos.")
+        return _loaded["index"]
+
+def _scores(index, terms):
+    total = len(index["ids"])
+    scores = {}
+    for term in set(terms):
+        postings = index["postings"].get(term)
+        if not postings: continue
+        idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+        for position, tf in postings:
+            norm = 1 - BM25_B + BM25_B * index["lengths"][position] / (index["avg_length"] or 1)
+            scores[position] = scores.get(position, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+    return scores
+
+def search(index, query, k=20):
+    """[(id, score)] dos k melhores pelo BM25."""
+    scores = _scores(index, tokenize(query))
+    best = sorted(scores.items(), key=lambda item: -item[1])[:k]
+    return [(index["ids"][position], score) for position, score in best]
+
+def confident_hits(index, query, k=10):
+    """
+    Ids de um acerto lexical confiante, ou None:
+    - título exato do produto/pergunta; ou
+    - busca curta por nome em que todos os termos específicos aparecem no TÍTULO
+      e pelo menos um termo com letras é raro entre os títulos (marca, modelo).
+    Preço ('até R$50') e números soltos não identificam produto: "50" casaria com "50 G" de
+    qualquer título e pularia a busca semântica e o filtro de preço.
+    """
+    terms = tokenize(query)
+    if not terms: return None
+    title_hits = index["titles"].get(" ".join(terms))
+    if title_hits: return [index["ids"][position] for position in title_hits[:k]]
+
+    specific = [t for t in dict.fromkeys(tokenize(query_filters.strip_price(query))) if t not in GENERIC_TERMS and not t.isdigit()]
+    if not specific or len(specific) > MAX_LOOKUP_TERMS: return None
+    postings = [index["title_postings"].get(term) for term in specific]
+    if not all(postings): return None # Algum termo não está em título nenhum: deixa a busca semântica resolver
+    if not any(term.isalpha() and len(p) <= RARE_TERM_MAX_DF for term, p in zip(specific, postings)): return None
+
+    # Documentos com TODOS os termos específicos no título, ordenados pelo BM25 da pergunta inteira
+    matching = set.intersection(*(set(p) for p in postings))
+    if not matching: return None
+    scores = _scores(index, terms)
+    best = sorted(matching, key=lambda position: -scores.get(position, 0.0))[:k]
+    return [index["ids"][position] for position in best]
@@ -0,0 +1,84 @@
+# price_index.py - ÍNDICE VIVO DE PREÇO / PROMOÇÃO / ESTOQUE (em memória)
+# O texto indexado no Chroma não traz preço: o valor mostrado ao cliente vem daqui,
+# recarregado do catálogo (tabela products) a cada PRICE_INDEX_TTL segundos.
+import os
+import re
+import time
+import threading
+from datetime import datetime, timezone
+
+import database
+
+PRICE_INDEX_TTL = int(os.environ.get("PRICE_INDEX_TTL", "60"))
+OUT_OF_STOCK = ("out_of_stock", "out of stock", "esgotado", "indisponivel", "indisponível")
+OFFER_FIELDS = ("price", "currency", "sale_price", "sale_price_effective_date", "availability")
+
+_lock = threading.Lock()
+_by_id = {}
+_by_link = {}
+_loaded_at = 0.0
+
+def refresh():
+    """Recarrega o índice do catálogo (só as colunas de oferta). Retorna quantos produtos."""
+    global _by_id, _by_link, _loaded_at
+    by_id, by_link = {}, {}
+    for record in database.iter_offers():
+        offer = {field: record[field] for field in OFFER_FIELDS}
+        by_id[record["id"]] = offer
+        if record["link"]: by_link[record["link"]] = offer
+    with _lock:
+        _by_id, _by_link, _loaded_at = by_id, by_link, time.time()
+    return len(by_id)
+
+def invalidate():
+    """Força recarga na próxima consulta (ex: logo após gravar o catálogo)."""
+    global _loaded_at
+    _loaded_at = 0.0
+
+def _ensure_fresh():
+    if time.time() - _loaded_at > PRICE_INDEX_TTL:
+        try:
+            refresh()
+        except Exception as e:
+            print(f"⚠️ Índice de preços não recarregado: {e}")
+
+def get_offer(product_id=None, link=None):
+    """Oferta atual do produto (por id ou link), ou None se ele não está mais no catálogo."""
+    _ensure_fresh()
+    offer = _by_id.get(product_id) if product_id else None
+    if offer is None and link:
+        offer = _by_link.get(link.strip())
+    return offer
+
+def is_loaded():
+    """Índice disponível? (catálogo vazio ou banco fora do ar: quem chama não filtra nada)"""
+    _ensure_fresh()
+    return bool(_by_id)
+
+def parse_feed_datetime(raw):
+    """'2025-08-25T00:00Z' / '2024-01-01T00:00-0300' -> datetime com fuso."""
+    raw = raw.strip().replace("Z", "+00:00")
+    raw = re.sub(r"([+-]\d{2})(\d{2})$", r"\1:\2", raw)
+    parsed = datetime.fromisoformat(raw)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def sale_is_active(offer, now=None):
+    """Promoção vale agora? Sem data de vigência, vale sempre que houver sale_price."""
+    if not offer or offer.get("sale_price") is None: return False
+    period = offer.get("sale_price_effective_date") or ""
+    if "/" not in period: return True
+    now = now or datetime.now(timezone.utc)
+    try:
+        start, end = (parse_feed_datetime(part) for part in period.split("/", 1))
+    except ValueError:
+        return False
+    return start <= now <= end
+
+def current_price(offer, now=None):
+    """Preço que o cliente paga agora (promoção vigente ou preço cheio)."""
+    if not offer: return None
+    return offer["sale_price"] if sale_is_active(offer, now) else offer["price"]
+
+def in_stock(offer):
+    availability = (offer or {}).get("availability") or ""
+    return availability.strip().lower() not in OUT_OF_STOCK
@@ -0,0 +1,40 @@
+# product_families.py - FAMÍLIAS DE VARIAÇÕES (MESMO PRODUTO EM OUTRO TAMANHO/COR/PESO)
+# "Ração X 1kg", "Ração X 3kg" e "Ração X 10kg" do mesmo seller viram uma família só.
+# A chave é o título sem medidas, quantidades e cores + o seller (custom_label_0): gravada no
+# catálogo na importação e nos metadados do Chroma. A busca usa para não devolver 6 variações
+# do mesmo item (uma por família) e o contexto do prompt lista as variações num item só.
+import re
+import hashlib
+
+import query_filters
+
+COLORS = {
+    "azul", "vermelho", "vermelha", "verde", "amarelo", "amarela", "rosa", "pink", "preto", "preta", "branco",
+    "branca", "cinza", "roxo", "roxa", "lilas", "laranja", "marrom", "bege", "caramelo", "dourado", "dourada",
+    "prata", "colorido", "colorida", "sortido", "sortida", "sortidas", "sortidos", "cores", "cor", "avela",
+}
+SIZES = {"pp", "p", "m", "g", "gg", "xg", "xgg", "xs", "s", "l", "xl", "xxl", "mini", "pequeno", "pequena", "medio", "media", "grande", "gigante", "tamanho", "tam"}
+UNIT_WORDS = {"unidade", "unidades", "un", "und", "unid", "pcs", "pecas", "peca", "pack", "c", "cx", "caixa", "com"}
+# Medidas e quantidades: 10kg, 2,6 a 5kg, 500mg, 15 x 10 cm, 1 pipeta(s) de 0,9ml...
+_MEASURE = re.compile(
+    r"\b\d+(?:[.,]\d+)?\s*(?:a|-|ate|/)?\s*\d*(?:[.,]\d+)?\s*"
+    r"(?:kg|g|gr|mg|mcg|ml|l|lt|litros?|cm|mm|m|un|unid|unidades?|pcs|comprimidos?|pipetas?|tabletes?|doses?|x)?\b"
+)
+_WORD = re.compile(r"[a-z]+")
+
+def title_stem(title):
+    """'Simparic 10mg 2,6 a 5kg 1 unidade' -> 'simparic'; 'Bola Azul G' -> 'bola'."""
+    text = _MEASURE.sub(" ", query_filters.fold(title))
+    words = [w for w in _WORD.findall(text) if w not in COLORS and w not in SIZES and w not in UNIT_WORDS and len(w) > 1]
+    return " ".join(words)
+
+def family_id(record):
+    """Id estável da família (seller + título sem variação). Sem título: o próprio produto é a família."""
+    stem = title_stem(record.get("title") or "")
+    if not stem: return f"p:{record.get('id')}"
+    seller = query_filters.fold(record.get("seller") or "").strip()
+    return hashlib.sha1(f"{seller}|{stem}".encode("utf-8")).hexdigest()[:16]
+
+def record_family(record):
+    """family_id gravado no catálogo; produto importado antes da coluna existir calcula na hora."""
+    return record.get("family_id") or family_id(record)
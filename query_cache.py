@@ -0,0 +1,123 @@
+# query_cache.py - CACHE DE CONSULTAS EM DOIS NÍVEIS (memória LRU + TTL -> diskcache)
+# Clientes repetem as mesmas perguntas curtas o tempo todo: o vetor da pergunta e o resultado
+# da busca (ids dos documentos) ficam guardados. A memória responde em microssegundos; o disco
+# sobrevive a restart e é compartilhado entre processos (painel e workers).
+# SingleFlight junta chamadas idênticas simultâneas numa só (a mesma pergunta chegando em rajada).
+import re
+import time
+import threading
+from collections import OrderedDict
+
+import diskcache
+
+def normalize_query(text):
+    """'  Ração  p/ Gato?? ' -> 'ração p/ gato': mesma pergunta, mesma chave."""
+    text = re.sub(r"\s+", " ", (text or "").strip().casefold())
+    return text.strip(" ?!.,;")
+
+class QueryCache:
+    """
+    LRU em memória com TTL na frente de um diskcache (com o mesmo TTL).
+    get() devolve None quando não há valor válido; os acertos de cada nível são contados.
+    """
+
+    def __init__(self, cache_dir, max_items=2048, ttl=3600, size_limit=256 * 1024 * 1024):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.disk = diskcache.Cache(cache_dir, size_limit=size_limit)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+        value = self.disk.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, value, now)
+        return value
+
+    def set(self, key, value):
+        self.disk.set(key, value, expire=self.ttl)
+        with self._lock:
+            self._remember(key, value, time.time())
+
+    def _remember(self, key, value, now):
+        self._memory[key] = (now + self.ttl, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / total, 3) if total else 0.0,
+                "items_in_memory": len(self._memory),
+            }
+
+class SingleFlight:
+    """
+    do(chave, fn): se já há uma chamada com a mesma chave em andamento, espera por ela e
+    devolve o mesmo resultado (ou a mesma exceção) em vez de chamar fn de novo.
+    begin/wait/finish fazem o mesmo em partes, para quem produz o resultado aos poucos (streaming).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def begin(self, key):
+        """(chamada, True se quem chamou deve produzir o resultado)."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call, False
+            call = self._calls[key] = {"done": threading.Event(), "value": None, "error": None}
+            return call, True
+
+    def wait(self, call):
+        call["done"].wait()
+        if call["error"] is not None: raise call["error"]
+        return call["value"]
+
+    def finish(self, key, call, value=None, error=None):
+        call["value"], call["error"] = value, error
+        with self._lock:
+            self._calls.pop(key, None)
+        call["done"].set()
+
+    def do(self, key, fn):
+        call, leader = self.begin(key)
+        if not leader: return self.wait(call)
+        try:
+            value = fn()
+        except Exception as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, value)
+        return value
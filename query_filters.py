@@ -0,0 +1,161 @@
+# query_filters.py - RESTRIÇÕES DA PERGUNTA -> FILTRO "where" DO CHROMA
+# "ração para gato até R$50" vira {pet: gato, preço <= 50}: a busca vetorial roda só
+# entre os candidatos que servem, em vez de trazer cachorro e item caro para o LLM filtrar.
+import re
+import unicodedata
+
+# Espécie -> palavras (já sem acento) que a identificam em títulos, categorias e perguntas
+PET_SPECIES = {
+    "cachorro": ("cachorro", "cachorros", "cachorrinho", "cao", "caes", "canino", "caninos", "dog", "dogs", "filhote de cachorro"),
+    "gato": ("gato", "gatos", "gatinho", "gatinhos", "felino", "felinos", "cat", "cats"),
+    "peixe": ("peixe", "peixes", "aquario", "aquarios", "betta", "aquatico"),
+    "passaro": ("passaro", "passaros", "ave", "aves", "calopsita", "periquito", "canario"),
+    "roedor": ("roedor", "roedores", "hamster", "coelho", "porquinho da india", "chinchila"),
+}
+ALL_PETS = "todos" # Produto sem espécie definida (tapete, cama, acessório genérico)
+
+# Tipo de produto -> (rótulo, palavras sem acento). A ordem importa: o primeiro que casar vence
+# ("tapete higiênico" é higiene antes de ser cama). Completa o google_product_category, que é raso.
+# Só palavras de tipo, nunca marcas: "simparic" sozinho é busca por nome (índice lexical, que vem
+# do catálogo), não navegação na vitrine de Saúde.
+PRODUCT_TYPES = {
+    "racao": ("Ração e alimentação", ("racao", "racoes", "alimentacao", "alimento", "alimentos", "papinha", "molho", "sache", "saches", "umida")),
+    "petisco": ("Petiscos", ("petisco", "petiscos", "bifinho", "bifinhos", "snack", "snacks", "sticks", "mastigavel", "osso", "ossinho")),
+    "saude": ("Saúde e antipulgas", ("antipulgas", "pulgas", "carrapato", "carrapatos", "carrapaticida", "vermifugo", "pipeta", "pipetas", "comprimidos", "remedio", "remedios")),
+    "higiene": ("Higiene e banho", ("higienico", "higienicos", "higiene", "shampoo", "condicionador", "banho", "areia", "granulado", "colonia", "perfume", "toalha", "removedor")),
+    "brinquedo": ("Brinquedos", ("brinquedo", "brinquedos", "bolinha", "bolinhas", "mordedor", "mordedores", "pelucia", "corda", "arranhador", "arranhadores", "varinha")),
+    "cama": ("Camas e conforto", ("cama", "camas", "caminha", "colchonete", "almofada", "manta", "cobertor", "iglu", "toca", "sofa", "tapete", "tapetes", "capa")),
+    "passeio": ("Passeio e transporte", ("coleira", "coleiras", "guia", "guias", "peitoral", "bolsa", "transporte", "assento", "cinto")),
+    "acessorio": ("Comedouros e roupinhas", ("comedouro", "comedouros", "bebedouro", "bebedouros", "alimentador", "roupa", "roupinha", "roupinhas", "sueter", "bandana")),
+    "aquario": ("Aquarismo", ("aquario", "aquarios", "filtro", "bomba", "midias", "luminaria", "termostato", "aquecedor", "cascalho")),
+}
+OTHER_TYPE = "outros"
+_TYPE_PATTERNS = {
+    kind: re.compile(r"\b(?:" + "|".join(re.escape(word) for word in words) + r")\b")
+    for kind, (label, words) in PRODUCT_TYPES.items()
+}
+
+_THOUSANDS = r"\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?" # 1.000 / 1.234,56
+_NUMBER = r"(" + _THOUSANDS + r"|\d+(?:[.,]\d{1,2})?)"
+_MONEY = r"(?:r\$\s*)?" + _NUMBER + r"\s*(?:reais|real|rs)?"
+# Palavras-chave com \b: "ate" não pode casar dentro de "patê", "tomate", "chocolate"
+PRICE_PATTERNS = (
+    ("range", re.compile(r"\bentre\s+" + _MONEY + r"\s+e\s+" + _MONEY)),
+    ("range", re.compile(r"\bde\s+r\$\s*" + _NUMBER + r"\s+a(?:te)?\s+" + _MONEY)),
+    # "de 100 a 200 reais" / "de 100 a R$200": sem r$ no primeiro valor, a moeda tem que aparecer no segundo
+    ("range", re.compile(r"\bde\s+" + _NUMBER + r"\s+a(?:te)?\s+(?:r\$\s*" + _NUMBER + r"|" + _NUMBER + r"\s*(?:reais|real))")),
+    ("max", re.compile(r"(?:\b(?:ate|no maximo|menos de|abaixo de|inferior a|max(?:imo)?|por no maximo)|<=?)\s*" + _MONEY)),
+    ("min", re.compile(r"(?:\b(?:a partir de|acima de|mais de|no minimo|minimo de)|>=?)\s*r\$\s*" + _NUMBER)),
+    ("min", re.compile(r"\b(?:a partir de|acima de|no minimo|minimo de)\s*" + _MONEY)),
+)
+# Número seguido de unidade não é preço ("até 15kg", "acima de 3 meses")
+UNIT_AFTER = re.compile(r"\s*(?:kg|g|gr|mg|ml|l|litros?|cm|mm|m|metros?|mes|meses|anos?|dias?|semanas?|unidades?|un|pcs|pecas?|%|x)\b")
+
+def fold(text):
+    """Minúsculas e sem acento ('Ração' -> 'racao'), para casar palavras sem depender de digitação."""
+    normalized = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in normalized if not unicodedata.combining(c)).lower()
+
+def _to_float(raw):
+    """'50' / '49,90' / '1.000' / '1.234,56' -> float (milhar com ponto, como no feed_parser.parse_price)."""
+    if re.fullmatch(_THOUSANDS, raw): raw = raw.replace(".", "")
+    return float(raw.replace(",", "."))
+
+def detect_species(text):
+    """Conjunto de espécies citadas no texto."""
+    folded = fold(text)
+    return {
+        species for species, words in PET_SPECIES.items()
+        if any(re.search(rf"\b{re.escape(word)}\b", folded) for word in words)
+    }
+
+def product_species(record):
+    """Espécie do produto pela categoria do feed; se ela não disser, pelo título. Ambíguo -> 'todos'."""
+    species = detect_species(record.get("category") or "")
+    if not species:
+        species = detect_species(record.get("title") or "")
+    return species.pop() if len(species) == 1 else ALL_PETS
+
+def detect_types(text):
+    """Conjunto de tipos de produto citados no texto."""
+    folded = fold(text)
+    return {kind for kind, pattern in _TYPE_PATTERNS.items() if pattern.search(folded)}
+
+def product_type(record):
+    """Tipo do produto pelo último nível da categoria; se ela não disser, pelo título (primeiro que casar)."""
+    for text in (category_leaf(record.get("category")), record.get("title") or ""):
+        folded = fold(text)
+        for kind, pattern in _TYPE_PATTERNS.items():
+            if pattern.search(folded):
+                return kind
+    return OTHER_TYPE
+
+def category_leaf(category):
+    """Último nível do caminho do google_product_category ('A > B > Ração para cães' -> 'Ração para cães')."""
+    return (category or "").split(">")[-1].strip()
+
+def _is_money(match, text):
+    explicit = "r$" in match.group(0) or "rea" in match.group(0)
+    return explicit or not UNIT_AFTER.match(text, match.end())
+
+def _price_match(folded):
+    """(tipo, match) do primeiro padrão de preço que casar no texto já sem acento, ou (None, None)."""
+    for kind, pattern in PRICE_PATTERNS:
+        match = next((m for m in pattern.finditer(folded) if _is_money(m, folded)), None)
+        if match: return kind, match
+    return None, None
+
+def strip_price(text):
+    """Texto sem acento e sem o trecho de preço ('racao ate r$50' -> 'racao '): o resto é o que buscar."""
+    folded = fold(text)
+    kind, match = _price_match(folded)
+    return folded[:match.start()] + " " + folded[match.end():] if match else folded
+
+def parse_price_range(text):
+    """(mínimo, máximo) pedidos na pergunta; None onde não houver."""
+    kind, match = _price_match(fold(text))
+    if not match: return None, None
+    if kind == "range":
+        low, high = sorted(_to_float(value) for value in match.groups() if value)
+        return low, high
+    if kind == "max":
+        return None, _to_float(match.group(1))
+    return _to_float(match.group(1)), None
+
+def parse_constraints(text):
+    """Restrições que a pergunta impõe: {"species": {...}, "types": {...}, "min_price": x, "max_price": y}."""
+    min_price, max_price = parse_price_range(text)
+    constraints = {}
+    species = detect_species(text)
+    if species: constraints["species"] = species
+    types = detect_types(text)
+    if types: constraints["types"] = types
+    if min_price is not None: constraints["min_price"] = min_price
+    if max_price is not None: constraints["max_price"] = max_price
+    return constraints
+
+def merge_constraints(primary, secondary):
+    """
+    Junta as restrições da pergunta original com as da busca reescrita.
+    Da reescrita só vêm espécie e tipo (ela resolve "e para o meu felino?" pelo histórico
+    e "remédio pra carrapato" -> antipulgas); preço só vale se o cliente escreveu.
+    """
+    merged = dict(primary)
+    for key in ("species", "types"):
+        if key not in merged and secondary.get(key):
+            merged[key] = secondary[key]
+    return merged
+
+def build_where(constraints):
+    """Filtro 'where' do Chroma só com produtos em estoque que atendem às restrições (None = sem filtro)."""
+    if not constraints: return None
+    clauses = [{"type": "product"}, {"in_stock": True}]
+    if constraints.get("species"):
+        clauses.append({"pet": {"$in": sorted(constraints["species"]) + [ALL_PETS]}})
+    if constraints.get("types"):
+        clauses.append({"product_type": {"$in": sorted(constraints["types"])}})
+    if constraints.get("min_price") is not None:
+        clauses.append({"price_value": {"$gte": constraints["min_price"]}})
+    if constraints.get("max_price") is not None:
+        clauses.append({"price_value": {"$lte": constraints["max_price"]}})
+    return {"$and": clauses}
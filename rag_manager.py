@@ -3,36 +3,430 @@
 
 import os
 import json
+import hashlib
 import logging
+import threading
 import traceback
 from datetime import datetime
 
+import httpx
+import numpy as np
+
 # Bibliotecas do LangChain
 from langchain_chroma import Chroma 
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
 from langchain_core.documents import Document 
 from langchain_openai import OpenAIEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter 
+
+from embedding_cache import CachedEmbeddings
+from query_cache import QueryCache, normalize_query
+from embedding_pipeline import embed_and_store
+import document_loader
+import chunking
+import database
+import price_index
+import query_filters
+import lexical_index
+import product_families
 
 # --- Configurações ---
 KNOWLEDGE_BASE_DIR = "knowledge_base"
 CHROMA_DB_DIR = "/app/banco_vetorial_seguro" # Caminho do Volume Docker
 STATUS_FILE = os.path.join(KNOWLEDGE_BASE_DIR, "status.json")
+LEGACY_FEED_FILE = "feed_produtos_everpetz.txt" # Formato antigo (texto); o feed agora vive na tabela products
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Blue/green: cada reconstrução vai para uma coleção nova; o ponteiro diz qual está no ar
+GENERATION_FILE = os.path.join(CHROMA_DB_DIR, "generation.json")
+COLLECTION_PREFIX = "bob_kb_g"
+LEGACY_COLLECTION = "langchain" # Coleção padrão do LangChain usada até a V26
+EMBEDDING_CACHE_DIR = os.path.join(CHROMA_DB_DIR, "embedding_cache") # Mesmo volume do Chroma
+FILE_CACHE_DIR = os.path.join(CHROMA_DB_DIR, "file_cache") # Texto extraído dos PDF/DOCX (document_loader)
+LEXICAL_INDEX_FILE = os.path.join(CHROMA_DB_DIR, "lexical_index.pkl") # BM25 da geração no ar (lexical_index)
+LEXICAL_CANDIDATES = 20 # Quantos do BM25 entram na fusão com a busca vetorial
+LEXICAL_TRUSTED = 3 # Os primeiros do BM25 não passam pelo corte de similaridade do context_packer
+RRF_K = 60 # Constante do reciprocal rank fusion
+# "mmr": resultados diversos (uma variação por família, MMR entre os candidatos); "similarity": top-k puro
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "mmr")
+MMR_LAMBDA = float(os.environ.get("MMR_LAMBDA", "0.7")) # 1 = só relevância, 0 = só diversidade
+MMR_FETCH_FACTOR = 3 # Candidatos buscados para escolher os k mais diversos
+QUERY_CACHE_DIR = os.path.join(CHROMA_DB_DIR, "query_cache") # Vetor da pergunta / ids da busca (query_cache)
+QUERY_CACHE_MAX_ITEMS = int(os.environ.get("QUERY_CACHE_MAX_ITEMS", "2048")) # Por nível de memória
+QUERY_EMBEDDING_TTL = int(os.environ.get("QUERY_EMBEDDING_TTL", str(7 * 24 * 3600))) # Vetor só muda se trocar o modelo
+RETRIEVAL_CACHE_TTL = int(os.environ.get("RETRIEVAL_CACHE_TTL", "3600")) # A geração na chave já invalida na reindexação
+REWRITE_CACHE_TTL = int(os.environ.get("REWRITE_CACHE_TTL", str(24 * 3600))) # Reescrita não depende do catálogo
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", "1800")) # Resposta pronta da 1ª pergunta (0 desliga)
+EMBEDDING_CACHE_SIZE_LIMIT = int(os.environ.get("EMBEDDING_CACHE_SIZE_MB", "1024")) * 1024 * 1024
+# "0" manda o texto cru, sem tiktoken (uma requisição por texto): só para testes offline com o fake_embedding_server
+EMBEDDING_CHECK_CTX_LENGTH = os.environ.get("EMBEDDING_CHECK_CTX_LENGTH", "1") != "0"
+PRODUCT_DESCRIPTION_CHARS = 1200 # Descrição no texto embedado (um produto = um vetor, sem chunking)
+# Metadados que mudam todo dia (preço/estoque): ficam fora do content_hash e, se só eles mudarem,
+# o vetor não é refeito, só os metadados (o valor exibido ao cliente vem do price_index)
+VOLATILE_METADATA = ("price", "availability", "price_value", "in_stock")
+MIN_FILTERED_RESULTS = 3 # Menos que isso com filtro: completa com a busca sem filtro
+# Pool HTTP único para OpenAI (embeddings + chat): conexões keep-alive reaproveitadas entre mensagens
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "50"))
+OPENAI_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
 
 # Configuração de Logs
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def get_vector_store():
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-    # A inicialização aqui conecta e prepara o terreno
-    return Chroma(persist_directory=CHROMA_DB_DIR, embedding_function=embeddings)
+_embeddings = None
+_http_client = None
+_async_http_client = None
+_read_store = None
+_read_store_key = None
+_retrieval_cache = None
+_answer_cache = None
+_rewrite_cache = None
+_clients_lock = threading.RLock() # Reentrante: get_read_store -> get_embeddings -> get_http_client
 
-def get_retriever():
-    if not os.path.exists(CHROMA_DB_DIR):
-        return get_vector_store().as_retriever()
-    
-    vector_store = get_vector_store()
+def get_http_client():
+    """httpx.Client compartilhado (thread-safe) por todos os clientes OpenAI do processo."""
+    global _http_client
+    with _clients_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS),
+                timeout=OPENAI_TIMEOUT,
+            )
+        return _http_client
+
+def get_async_http_client():
+    """httpx.AsyncClient compartilhado pelo agente assíncrono (usado só no loop do agent_runtime)."""
+    global _async_http_client
+    with _clients_lock:
+        if _async_http_client is None:
+            _async_http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_CONNECTIONS),
+                timeout=OPENAI_TIMEOUT,
+            )
+        return _async_http_client
+
+def get_embeddings():
+    """Embeddings da OpenAI com cache persistente em disco (um por processo)."""
+    global _embeddings
+    if _embeddings is not None:
+        return _embeddings
+    http_client = get_http_client()
+    with _clients_lock:
+        if _embeddings is None:
+            _embeddings = CachedEmbeddings(
+                # max_retries=0: 429 e falhas temporárias sobem para o embedding_pipeline, que recua de forma adaptativa
+                OpenAIEmbeddings(model=EMBEDDING_MODEL, check_embedding_ctx_length=EMBEDDING_CHECK_CTX_LENGTH, max_retries=0, http_client=http_client),
+                model_name=EMBEDDING_MODEL,
+                cache_dir=EMBEDDING_CACHE_DIR,
+                size_limit=EMBEDDING_CACHE_SIZE_LIMIT,
+                # Consultas do chat mantêm os retries padrão do cliente
+                query_embeddings=OpenAIEmbeddings(model=EMBEDDING_MODEL, check_embedding_ctx_length=EMBEDDING_CHECK_CTX_LENGTH, http_client=http_client),
+                query_cache=QueryCache(os.path.join(QUERY_CACHE_DIR, "embeddings"), QUERY_CACHE_MAX_ITEMS, QUERY_EMBEDDING_TTL),
+            )
+        return _embeddings
+
+def get_retrieval_cache():
+    """(pergunta normalizada, k, filtro, geração) -> ids dos documentos encontrados."""
+    global _retrieval_cache
+    with _clients_lock:
+        if _retrieval_cache is None:
+            _retrieval_cache = QueryCache(os.path.join(QUERY_CACHE_DIR, "retrieval"), QUERY_CACHE_MAX_ITEMS, RETRIEVAL_CACHE_TTL)
+        return _retrieval_cache
+
+def get_rewrite_cache():
+    """(pergunta normalizada, histórico, versão do prompt) -> busca reescrita pelo LLM."""
+    global _rewrite_cache
+    with _clients_lock:
+        if _rewrite_cache is None:
+            _rewrite_cache = QueryCache(os.path.join(QUERY_CACHE_DIR, "rewrites"), QUERY_CACHE_MAX_ITEMS, REWRITE_CACHE_TTL)
+        return _rewrite_cache
+
+def get_answer_cache():
+    """(pergunta normalizada, contexto, configurações, geração) -> resposta final do agente."""
+    global _answer_cache
+    with _clients_lock:
+        if _answer_cache is None:
+            _answer_cache = QueryCache(os.path.join(QUERY_CACHE_DIR, "answers"), QUERY_CACHE_MAX_ITEMS, ANSWER_CACHE_TTL)
+        return _answer_cache
+
+def query_cache_stats():
+    """Taxas de acerto dos caches de consulta deste processo (painel)."""
+    embeddings = get_embeddings()
+    return {
+        "embeddings": embeddings.query_cache.stats() if getattr(embeddings, "query_cache", None) else None,
+        "retrieval": get_retrieval_cache().stats(),
+        "rewrites": get_rewrite_cache().stats(),
+        "answers": get_answer_cache().stats() if ANSWER_CACHE_TTL > 0 else None,
+    }
+
+# --- GERAÇÕES DO ÍNDICE (BLUE/GREEN) ---
+
+def get_active_generation():
+    """Ponteiro da geração no ar: {"generation": N, "collection": nome}."""
+    if os.path.exists(GENERATION_FILE):
+        try:
+            with open(GENERATION_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Erro ao ler ponteiro de geração: {e}")
+    return {"generation": 0, "collection": LEGACY_COLLECTION}
+
+def set_active_generation(collection, generation):
+    """Troca atômica do ponteiro (os.replace): quem lê vê a geração antiga ou a nova, nunca meio termo."""
+    os.makedirs(CHROMA_DB_DIR, exist_ok=True)
+    pointer = {"generation": generation, "collection": collection, "updated_at": datetime.now().isoformat()}
+    tmp_file = GENERATION_FILE + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(pointer, f)
+    os.replace(tmp_file, GENERATION_FILE)
+    print(f"🔀 Geração {generation} no ar (coleção '{collection}').")
+
+def garbage_collect_generations(client, keep):
+    """Apaga coleções de gerações antigas, preservando as de `keep`."""
+    for collection in client.list_collections():
+        name = collection.name
+        if (name.startswith(COLLECTION_PREFIX) or name == LEGACY_COLLECTION) and name not in keep:
+            print(f"🧹 Removendo geração antiga '{name}'...")
+            client.delete_collection(name)
+
+def get_vector_store(collection_name=None):
+    embeddings = get_embeddings()
+    # A inicialização aqui conecta e prepara o terreno (sem nome: a geração no ar)
+    collection_name = collection_name or get_active_generation()["collection"]
+    return Chroma(collection_name=collection_name, persist_directory=CHROMA_DB_DIR, embedding_function=embeddings)
+
+def _generation_stamp():
+    try:
+        return os.path.getmtime(GENERATION_FILE)
+    except OSError:
+        return None
+
+def get_read_store():
+    """
+    Store de leitura da geração no ar, aberta uma vez e compartilhada por todas as mensagens.
+    Quando o ponteiro de geração muda (indexação aqui ou em outro processo), reabre na próxima chamada.
+    """
+    return _live_store()[0]
+
+def live_generation():
+    """Número da geração no ar (entra na chave dos caches de consulta e de resposta)."""
+    return _live_store()[1]
+
+def _live_store():
+    """(store de leitura, número da geração no ar)."""
+    global _read_store, _read_store_key
+    stamp = _generation_stamp()
+    store, key = _read_store, _read_store_key
+    if store is not None and key and key[0] == stamp:
+        return store, key[2]
+
+    with _clients_lock:
+        if _read_store is None or _read_store_key[0] != stamp:
+            active = get_active_generation()
+            if _read_store is None or _read_store_key[1] != active["collection"]:
+                print(f"🔌 Abrindo a geração {active['generation']} ('{active['collection']}') para as consultas...")
+                _read_store = get_vector_store(active["collection"])
+            if _read_store_key and _read_store_key[2] != active["generation"]:
+                get_retrieval_cache().clear_memory() # Resultados da geração anterior não servem mais
+                get_answer_cache().clear_memory()
+            _read_store_key = (stamp, active["collection"], active["generation"])
+        return _read_store, _read_store_key[2]
+
+def _relevance(distance, space):
+    """Distância do Chroma -> similaridade de cosseno (embeddings da OpenAI são unitários: l2² = 2 - 2cos)."""
+    if space == "l2": return round(1 - distance / 2, 4)
+    return round(1 - distance, 4) # cosine / ip
+
+def _search(vector_store, embedding, k, where=None, vectors=None):
+    """
+    Consulta direto na coleção (precisa dos ids para o cache). Retorna [(id, Document)], com a
+    similaridade com a pergunta em metadata["relevance"] (usada pelo context_packer).
+    Com `vectors` (dict), os embeddings dos resultados também vêm e são guardados nele (MMR).
+    """
+    include = ["documents", "metadatas", "distances"] + (["embeddings"] if vectors is not None else [])
+    result = vector_store._collection.query(query_embeddings=[embedding], n_results=k, where=where, include=include)
+    if vectors is not None:
+        vectors.update(zip(result["ids"][0], result["embeddings"][0]))
+    space = (vector_store._collection.metadata or {}).get("hnsw:space", "l2")
+    return [
+        (doc_id, Document(page_content=text, metadata={**(meta or {}), "relevance": _relevance(distance, space)}))
+        for doc_id, text, meta, distance in zip(result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0])
+    ]
+
+def _mmr(results, vectors, embedding, k):
+    """
+    Maximal marginal relevance entre os candidatos [(id, Document)], com no máximo uma variação
+    por família; se não houver famílias suficientes, completa com as variações mais relevantes.
+    """
+    if len(results) <= 1: return results
+    matrix = np.array([vectors[doc_id] for doc_id, doc in results], dtype=float)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+    query = np.asarray(embedding, dtype=float)
+    relevance = matrix @ (query / (np.linalg.norm(query) + 1e-12))
+    redundancy = np.zeros(len(results))
+
+    selected, families = [], set()
+    remaining = list(range(len(results)))
+    while remaining and len(selected) < k:
+        allowed = [i for i in remaining if results[i][1].metadata.get("family_id") not in families]
+        if not allowed: break
+        best = max(allowed, key=lambda i: MMR_LAMBDA * relevance[i] - (1 - MMR_LAMBDA) * redundancy[i])
+        selected.append(best)
+        remaining.remove(best)
+        family = results[best][1].metadata.get("family_id")
+        if family: families.add(family)
+        redundancy = np.maximum(redundancy, matrix @ matrix[best])
+    selected += sorted(remaining, key=lambda i: -relevance[i])[:k - len(selected)]
+    return [results[i] for i in selected]
+
+def _one_per_family(ranked, docs_by_id, k):
+    """Ranking final com famílias distintas primeiro; repetidas só completam se faltar resultado."""
+    first, repeated, families = [], [], set()
+    for doc_id in ranked:
+        family = docs_by_id[doc_id].metadata.get("family_id")
+        if family and family in families:
+            repeated.append(doc_id)
+            continue
+        if family: families.add(family)
+        first.append(doc_id)
+    return (first + repeated)[:k]
+
+def _get_documents(vector_store, ids, where=None):
+    """{id: Document} dos ids que existem na coleção (e passam no filtro, se houver)."""
+    if not ids: return {}
+    result = vector_store._collection.get(ids=list(ids), where=where, include=["documents", "metadatas"])
+    return {
+        doc_id: Document(page_content=text, metadata=meta or {})
+        for doc_id, text, meta in zip(result["ids"], result["documents"], result["metadatas"])
+    }
+
+def _documents_by_ids(vector_store, ids):
+    """Documentos dos ids, na ordem pedida; None se algum sumiu da coleção."""
+    found = _get_documents(vector_store, ids)
+    if len(found) != len(ids): return None
+    return [found[doc_id] for doc_id in ids]
+
+def get_lexical_index(generation):
+    """Índice BM25 da geração no ar, ou None (ainda não montado / de outra geração)."""
+    try:
+        index = lexical_index.load(LEXICAL_INDEX_FILE)
+    except Exception as e:
+        logger.error(f"Erro ao carregar índice lexical: {e}")
+        return None
+    if not index or index["generation"] != generation: return None
+    return index
+
+def reciprocal_rank_fusion(*rankings):
+    """Junta rankings de ids (vetorial, BM25): soma de 1/(RRF_K + posição)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])
+
+def merge_results(*doc_lists, k=10):
+    """Junta resultados de buscas diferentes (RRF), sem repetir produto/trecho."""
+    by_key = {}
+    rankings = []
+    for docs in doc_lists:
+        ranking = []
+        for doc in docs:
+            key = doc.metadata.get("product_id") or doc.page_content
+            by_key.setdefault(key, doc)
+            if key not in ranking: ranking.append(key)
+        rankings.append(ranking)
+    return [by_key[key] for key in reciprocal_rank_fusion(*rankings)[:k]]
+
+def lexical_fast_path(query, constraints=None, k=10):
+    """
+    Atalho para busca por nome (marca, modelo, título exato): responde só com o BM25,
+    sem rewrite e sem embedding. None se o acerto não for confiante.
+    """
+    vector_store, generation = _live_store()
+    index = get_lexical_index(generation)
+    if not index: return None
+    hits = lexical_index.confident_hits(index, query, k)
+    if not hits: return None
+    # O nome já diz o tipo; a categoria do feed às vezes discorda (NexGard cadastrado em "Ração")
+    constraints = {key: value for key, value in (constraints or {}).items() if key != "types"}
+    found = _get_documents(vector_store, hits, query_filters.build_where(constraints))
+    docs = [found[doc_id] for doc_id in hits if doc_id in found]
+    if docs: print(f"🔤 Atalho lexical '{query}': {len(docs)} documentos (sem embedding).")
+    return docs or None
+
+def retrieve(query, constraints=None, k=10, mode=None):
+    """
+    Busca vetorial com as restrições da pergunta (espécie, faixa de preço, estoque)
+    empurradas para o 'where' do Chroma. Filtro que sobra pouco cai para a busca aberta.
+    mode "mmr" (padrão, RETRIEVAL_MODE): busca k*MMR_FETCH_FACTOR candidatos e devolve k de
+    famílias diferentes; "similarity": top-k puro (pode vir o mesmo produto em 6 tamanhos).
+    """
+    mode = mode or RETRIEVAL_MODE
+    diverse = mode == "mmr"
+    fetch_k = k * MMR_FETCH_FACTOR if diverse else k
+    vector_store, generation = _live_store()
+    where = query_filters.build_where(constraints)
+
+    # Mesma pergunta, mesmo filtro, mesma geração do índice: reaproveita os ids (sem embedding, sem HNSW)
+    cache = get_retrieval_cache()
+    cache_key = json.dumps([normalize_query(query), k, where, generation, mode], ensure_ascii=False, sort_keys=True)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        # [(id, similaridade ou None)]; entradas antigas guardavam só os ids
+        cached = [(item, None) if isinstance(item, str) else item for item in cached]
+        docs = _documents_by_ids(vector_store, [doc_id for doc_id, relevance in cached]) if cached else []
+        if docs is not None:
+            for doc, (doc_id, relevance) in zip(docs, cached):
+                if relevance is not None: doc.metadata["relevance"] = relevance
+            return docs
+
+    embedding = get_embeddings().embed_query(query) # Um embedding só, mesmo com a busca de reserva
+    vectors = {} if diverse else None
+    if not where:
+        results = _search(vector_store, embedding, fetch_k, vectors=vectors)
+    else:
+        try:
+            results = _search(vector_store, embedding, fetch_k, where, vectors=vectors)
+        except Exception as e:
+            logger.error(f"Erro na busca filtrada: {e}")
+            results = []
+        print(f"🎯 Busca filtrada {constraints}: {len(results)} resultados.")
+        if len(results) < MIN_FILTERED_RESULTS:
+            seen = {doc_id for doc_id, doc in results}
+            results += [(doc_id, doc) for doc_id, doc in _search(vector_store, embedding, fetch_k, vectors=vectors) if doc_id not in seen]
+            results = results[:fetch_k]
+            where = None # O BM25 segue a mesma regra: filtro que sobra pouco vira busca aberta
+    if diverse:
+        results = _mmr(results, vectors, embedding, k)
+
+    # Híbrido: ranking BM25 (respeitando o mesmo filtro) fundido com o vetorial por RRF
+    docs_by_id = dict(results)
+    index = get_lexical_index(generation)
+    if index:
+        lexical_ids = [doc_id for doc_id, score in lexical_index.search(index, query, LEXICAL_CANDIDATES)]
+        lexical_docs = _get_documents(vector_store, [i for i in lexical_ids if i not in docs_by_id], where)
+        lexical_ids = [i for i in lexical_ids if i in docs_by_id or i in lexical_docs]
+        docs_by_id.update(lexical_docs)
+        ranked = reciprocal_rank_fusion([doc_id for doc_id, doc in results], lexical_ids)
+        # O BM25 traz as variações de volta ("simparic" casa com todos os tamanhos): uma por família
+        ranked = _one_per_family(ranked, docs_by_id, k) if diverse else ranked[:k]
+    else:
+        ranked = [doc_id for doc_id, doc in results]
+
+    # Só do BM25 (sem similaridade vetorial) ou entre os primeiros dele ("bravecto" pode ter similaridade
+    # baixa e ser o acerto certo) fica sem "relevance": o context_packer não o descarta
+    if index:
+        for doc_id in lexical_ids[:LEXICAL_TRUSTED]:
+            docs_by_id[doc_id].metadata.pop("relevance", None)
+    docs = [docs_by_id[doc_id] for doc_id in ranked]
+    cache.set(cache_key, [(doc_id, doc.metadata.get("relevance")) for doc_id, doc in zip(ranked, docs)])
+    return docs
+
+def get_retriever(mode=None):
+    """Retriever do LangChain; "mmr" (padrão) diversifica os 10 resultados entre os candidatos."""
+    vector_store = get_read_store()
+    if (mode or RETRIEVAL_MODE) == "mmr":
+        return vector_store.as_retriever(
+            search_type="mmr",
+            search_kwargs={"k": 10, "fetch_k": 10 * MMR_FETCH_FACTOR, "lambda_mult": MMR_LAMBDA}
+        )
     return vector_store.as_retriever(
         search_type="similarity", 
         search_kwargs={"k": 10}
@@ -50,17 +444,30 @@ def load_status():
     return {"docs": [], "last_update": "Nunca", "processing": False}
 
 def save_status(status_data):
-    """Grava o status garantindo que a pasta existe."""
+    """Grava o status garantindo que a pasta existe (tmp + os.replace: o dashboard nunca lê JSON pela metade)."""
     try:
         folder = os.path.dirname(STATUS_FILE)
         if not os.path.exists(folder):
             os.makedirs(folder)
             
-        with open(STATUS_FILE, 'w', encoding='utf-8') as f:
+        tmp_file = f"{STATUS_FILE}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
             json.dump(status_data, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_file, STATUS_FILE)
     except Exception as e:
         logger.error(f"Erro GRAVE ao salvar status em {STATUS_FILE}: {e}")
 
+def update_embedding_cache_status(run_stats):
+    """Grava no status.json os contadores do cache de embeddings (última rodada + acumulado)."""
+    data = load_status()
+    previous = data.get("embedding_cache", {})
+    data["embedding_cache"] = {
+        **run_stats,
+        "total_hits": previous.get("total_hits", 0) + run_stats["hits"],
+        "total_misses": previous.get("total_misses", 0) + run_stats["misses"],
+    }
+    save_status(data)
+
 def update_feed_status(status_code, message, count=0):
     """Atualiza o JSON que o Dashboard lê."""
     print(f"📝 Atualizando Status: {status_code} - {message}") 
@@ -92,9 +499,167 @@ def update_feed_status(status_code, message, count=0):
     
     save_status(data)
 
+# --- CATÁLOGO -> DOCUMENTOS ---
+
+def format_price(value, currency="BRL"):
+    if value is None: return "Consulte"
+    return f"{value:.2f} {currency or 'BRL'}"
+
+def product_to_document(record):
+    """
+    Registro da tabela products -> Document pronto para embedding (exatamente um por produto).
+    Texto compacto: título e atributos principais na frente, descrição limitada; link e imagem
+    ficam só nos metadados. Preço não entra no texto: mudança de preço não custa um embedding novo.
+    """
+    price = format_price(record["price"], record["currency"])
+    price_value = price_index.current_price(record)
+    pet = query_filters.product_species(record)
+    kind = query_filters.product_type(record)
+    attributes = [f"Pet: {pet}"]
+    if kind != query_filters.OTHER_TYPE: attributes.append(f"Tipo: {query_filters.PRODUCT_TYPES[kind][0]}")
+    if query_filters.category_leaf(record["category"]): attributes.append(f"Categoria: {query_filters.category_leaf(record['category'])}")
+    lines = [record["title"] or "Produto", " | ".join(attributes)]
+    if record["seller"]: lines.append(record["seller"])
+    if record["dimensions"]: lines.append(f"Medidas: {record['dimensions']}")
+    description = " ".join((record["description"] or "").split())
+    if len(description) > PRODUCT_DESCRIPTION_CHARS:
+        description = description[:PRODUCT_DESCRIPTION_CHARS].rsplit(" ", 1)[0] + "..."
+    if description: lines.append(description)
+    content = "\n".join(lines)
+    meta = {
+        "source": "catalogo",
+        "type": "product",
+        "product_id": record["id"],
+        "title": record["title"] or "Produto",
+        "price": price,
+        "availability": record["availability"] or "",
+        "in_stock": price_index.in_stock(record),
+        "pet": pet,
+        "product_type": kind,
+        "family_id": product_families.record_family(record),
+        "category": record["category"] or "",
+        "category_leaf": query_filters.category_leaf(record["category"]),
+        "image": record["image"] or "",
+        "link": record["link"] or "",
+    }
+    if price_value is not None: meta["price_value"] = float(price_value) # Filtros de faixa de preço
+    return Document(page_content=content, metadata=meta)
+
+def catalog_documents(progress=None):
+    """Um Document por produto do catálogo (tabela products)."""
+    progress = progress or no_progress
+    documents = []
+    progress("Lendo catálogo", 0, database.count_products())
+    for record in database.iter_products():
+        documents.append(product_to_document(record))
+        if len(documents) % 500 == 0: progress("Lendo catálogo", len(documents))
+    return documents
+
+def split_documents(documents):
+    """Produtos: um vetor cada (o documento já é compacto). PDF/DOCX/TXT: chunking por estrutura."""
+    products = [d for d in documents if d.metadata.get("type") == "product"]
+    others = [d for d in documents if d.metadata.get("type") != "product"]
+    return products + chunking.chunk_info_documents(others)
+
+# --- INDEXAÇÃO INCREMENTAL (DELTA POR g:id) ---
+
+def content_hash(doc):
+    """Hash do texto + metadados estáveis: muda quando o vetor precisa ser refeito."""
+    stable = {k: v for k, v in doc.metadata.items() if k not in VOLATILE_METADATA and k not in ("content_hash", "offer_hash")}
+    payload = json.dumps([doc.page_content, stable], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def offer_hash(doc):
+    """Hash só dos metadados voláteis (preço/estoque): mudou sozinho = atualização só de metadados."""
+    volatile = {k: doc.metadata.get(k) for k in VOLATILE_METADATA}
+    return hashlib.sha1(json.dumps(volatile, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+def assign_document_ids(chunks):
+    """
+    IDs estáveis para o Chroma: produtos usam o g:id do feed (prod:<g:id>),
+    o resto (PDF, DOCX, info) usa o hash do conteúdo.
+    Grava os hashes em metadata["content_hash"] / ["offer_hash"] para a comparação na próxima rodada.
+    """
+    ids = []
+    seen = {}
+    for chunk in chunks:
+        chunk.metadata.pop("content_hash", None)
+        chunk.metadata.pop("offer_hash", None)
+        digest = content_hash(chunk)
+        product_id = chunk.metadata.get("product_id")
+        if product_id:
+            base = f"prod:{product_id}"
+        else:
+            base = f"doc:{chunk.metadata.get('source', '')}:{digest[:16]}"
+
+        # Mesmo produto quebrado em mais de um chunk: prod:<id>, prod:<id>:1, ...
+        n = seen.get(base, 0)
+        seen[base] = n + 1
+        ids.append(base if n == 0 else f"{base}:{n}")
+        chunk.metadata["content_hash"] = digest
+        chunk.metadata["offer_hash"] = offer_hash(chunk)
+    return ids
+
+def sync_vector_store(vector_store, chunks, ids, progress=None):
+    """
+    Grava só o que é novo/alterado e remove só o que sumiu.
+    Se só preço/estoque mudou, atualiza os metadados sem refazer o embedding.
+    Retorna (upserts, atualizações de metadados, deletes).
+    """
+    indexed = vector_store.get(include=["metadatas"])
+    indexed_hashes = {
+        doc_id: ((meta or {}).get("content_hash"), (meta or {}).get("offer_hash"))
+        for doc_id, meta in zip(indexed.get("ids", []), indexed.get("metadatas", []))
+    }
+
+    changed_docs, changed_ids = [], []
+    offer_docs, offer_ids = [], []
+    for doc_id, chunk in zip(ids, chunks):
+        indexed_content, indexed_offer = indexed_hashes.get(doc_id, (None, None))
+        if indexed_content != chunk.metadata["content_hash"]:
+            changed_docs.append(chunk)
+            changed_ids.append(doc_id)
+        elif indexed_offer != chunk.metadata["offer_hash"]:
+            offer_docs.append(chunk)
+            offer_ids.append(doc_id)
+
+    current = set(ids)
+    removed_ids = [doc_id for doc_id in indexed_hashes if doc_id not in current]
+
+    if changed_docs:
+        print(f"Gravando {len(changed_docs)} vetores novos/alterados (lotes concorrentes)...")
+        on_batch = None
+        if progress:
+            progress("Gerando embeddings", 0, len(changed_docs))
+            on_batch = lambda written, total: progress("Gerando embeddings", written, total)
+        embed_and_store(vector_store, changed_docs, changed_ids, get_embeddings(), on_batch=on_batch)
+    if offer_ids:
+        print(f"Atualizando preço/estoque de {len(offer_ids)} vetores (sem novo embedding)...")
+        if progress: progress("Atualizando preços", 0, len(offer_ids))
+        for start in range(0, len(offer_ids), 500):
+            vector_store._collection.update(
+                ids=offer_ids[start:start + 500],
+                metadatas=[d.metadata for d in offer_docs[start:start + 500]],
+            )
+    if removed_ids:
+        print(f"Removendo {len(removed_ids)} vetores que saíram da base...")
+        if progress: progress("Removendo vetores antigos", 0, len(removed_ids))
+        vector_store.delete(ids=removed_ids)
+
+    return len(changed_ids), len(offer_ids), len(removed_ids)
+
 # --- PROCESSAMENTO PRINCIPAL ---
 
-def process_knowledge_base():
+def no_progress(stage, done=None, total=None):
+    pass
+
+def process_knowledge_base(full_rebuild=False, progress=None):
+    """
+    Lê a pasta knowledge_base e atualiza o ChromaDB.
+    Padrão: incremental (só embeda o que mudou). full_rebuild=True monta uma geração nova (blue/green).
+    progress(etapa, feitos, total) recebe o andamento (ver job_tracker).
+    """
+    progress = progress or no_progress
     print("--- INICIANDO PROCESSAMENTO (V26 PHOENIX) ---")
     update_feed_status("processing", "Iniciando leitura e indexação...", 0)
 
@@ -103,77 +668,51 @@ def process_knowledge_base():
         if not os.path.exists(KNOWLEDGE_BASE_DIR):
             os.makedirs(KNOWLEDGE_BASE_DIR)
 
+        # --- PRODUTOS: direto do catálogo estruturado (sem re-parse de texto) ---
+        documents = catalog_documents(progress)
+        total_products_detected = len(documents)
+        print(f" > Catálogo: {total_products_detected} produtos.")
+
         valid_extensions = ('.pdf', '.txt', '.docx')
-        files_to_process = [f for f in os.listdir(KNOWLEDGE_BASE_DIR) if f.lower().endswith(valid_extensions)]
+        files_to_process = [
+            f for f in os.listdir(KNOWLEDGE_BASE_DIR)
+            if f.lower().endswith(valid_extensions) and f != LEGACY_FEED_FILE
+        ]
         
-        if not files_to_process:
+        if not files_to_process and not documents:
             msg = "Nenhum arquivo compatível encontrado."
             update_feed_status("active", msg, 0)
             return False
 
-        documents = []
-        total_products_detected = 0 
-        
         print(f"Lendo arquivos: {files_to_process}")
         
+        # PDF/DOCX: só os novos/alterados são lidos (em paralelo); o resto vem do cache de texto
+        binary_paths = [
+            os.path.join(KNOWLEDGE_BASE_DIR, f) for f in files_to_process
+            if f.lower().endswith(('.pdf', '.docx'))
+        ]
+        loaded = document_loader.load_files(
+            binary_paths, FILE_CACHE_DIR,
+            on_file=lambda done, total: progress("Lendo arquivos", done, total),
+        )
+
         for file in files_to_process:
+            file_path = os.path.join(KNOWLEDGE_BASE_DIR, file)
             try:
-                file_path = os.path.join(KNOWLEDGE_BASE_DIR, file)
-                
-                # --- PROCESSAMENTO DE TXT (FEED) ---
+                # --- PROCESSAMENTO DE TXT (informações gerais) ---
                 if file.lower().endswith('.txt'):
                     with open(file_path, "r", encoding="utf-8") as f:
-                        full_text = f.read()
-                    
-                    product_blocks = full_text.split("---")
-                    count_txt = 0
-                    
-                    for block in product_blocks:
-                        content = block.strip()
-                        if content:
-                            lines = content.split('\n')
-                            title = next((l.split('Title: ')[1] for l in lines if 'Title: ' in l), "").strip()
-                            price = next((l.split('Price: ')[1] for l in lines if 'Price: ' in l), "").strip()
-                            image = next((l.split('Image: ')[1] for l in lines if 'Image: ' in l), "").strip()
-                            link = next((l.split('Link: ')[1] for l in lines if 'Link: ' in l), "").strip()
-                            
-                            if title and price:
-                                meta = {
-                                    "source": file,
-                                    "type": "product",
-                                    "title": title,
-                                    "price": price,
-                                    "image": image,
-                                    "link": link
-                                }
-                                count_txt += 1
-                            else:
-                                meta = {"source": file, "type": "info", "title": "Info Geral", "price": "", "image": "", "link": ""}
-                            
-                            doc = Document(page_content=content, metadata=meta)
-                            documents.append(doc)
-                    
-                    total_products_detected += count_txt
-                    print(f" > {file}: {count_txt} produtos reais identificados.")
-
-                # --- PROCESSAMENTO DE PDF ---
-                elif file.lower().endswith('.pdf'):
-                    loader = PyPDFLoader(file_path)
-                    docs_pdf = loader.load()
-                    for d in docs_pdf: 
-                        d.metadata["type"] = "info" 
-                    documents.extend(docs_pdf)
-                    print(f" > {file}: {len(docs_pdf)} páginas.")
-
-                # --- PROCESSAMENTO DE DOCX ---
-                elif file.lower().endswith('.docx'):
-                    loader = Docx2txtLoader(file_path)
-                    docs_docx = loader.load()
-                    for d in docs_docx:
-                        d.metadata["type"] = "info"
-                    documents.extend(docs_docx)
+                        full_text = f.read().strip()
+                    if full_text:
+                        meta = {"source": file, "type": "info", "title": "Info Geral", "price": "", "image": "", "link": ""}
+                        documents.append(Document(page_content=full_text, metadata=meta))
                     print(f" > {file}: Carregado.")
-                    
+
+                # --- PDF / DOCX (texto já extraído pelo document_loader) ---
+                else:
+                    for text, meta in loaded.get(file_path, []):
+                        documents.append(Document(page_content=text, metadata={**meta, "type": "info"}))
+
             except Exception as e:
                 print(f"Erro ao ler {file}: {e}")
                 
@@ -182,28 +721,55 @@ def process_knowledge_base():
             return False
 
         # Chunking
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=100)
-        chunks = text_splitter.split_documents(documents)
+        progress("Dividindo em chunks", 0, len(documents))
+        chunks = split_documents(documents)
         print(f"Chunking final: {len(chunks)} vetores gerados.")
         
-        # --- [CRÍTICO] MUDANÇA V26: SOFT WIPE + REINIT ---
-        print(f"Conectando ao ChromaDB para atualização...")
-        vector_store = get_vector_store()
+        ids = assign_document_ids(chunks)
+        get_embeddings().reset_stats()
         
-        try:
-            print("🧹 Resetando coleção via API (Soft Reset)...")
-            vector_store.delete_collection() 
-        except Exception as e:
-            print(f"ℹ️ Aviso na limpeza (coleção nova ou vazia): {e}")
+        print(f"Conectando ao ChromaDB para atualização...")
+        active = get_active_generation()
+
+        # Reconstrução completa (ou migração da coleção antiga): monta uma geração nova
+        # enquanto a atual continua respondendo, e só então vira o ponteiro.
+        blue_green = full_rebuild or active["collection"] == LEGACY_COLLECTION
+        if blue_green:
+            target = f"{COLLECTION_PREFIX}{active['generation'] + 1}"
+            print(f"🟦🟩 Construindo geração '{target}' ('{active['collection']}' segue no ar)...")
+            vector_store = get_vector_store(target)
+            try:
+                vector_store.delete_collection() # Sobra de uma tentativa anterior interrompida
+            except Exception as e:
+                print(f"ℹ️ Aviso na limpeza (coleção nova ou vazia): {e}")
+            vector_store = get_vector_store(target)
+        else:
+            vector_store = get_vector_store(active["collection"])
+
+        # Gravação no Banco (delta: upsert do que mudou, delete do que saiu)
+        progress("Comparando com o índice", 0, len(chunks))
+        upserted, repriced, removed = sync_vector_store(vector_store, chunks, ids, progress=progress)
+        print(f"Delta aplicado: {upserted} gravados, {repriced} só preço/estoque, {removed} removidos, {len(chunks) - upserted - repriced} intactos.")
 
-        # [CORREÇÃO V26] Recriar a instância força a criação de uma nova coleção vazia
-        # Isso resolve o erro "Collection not initialized" e permite gravar
-        print("🔄 Reinicializando Store V26 (Phoenix)...")
-        vector_store = get_vector_store() 
+        progress("Publicando geração")
+        changed = blue_green or upserted or repriced or removed
+        generation = active["generation"] + 1 if changed else active["generation"]
+        # Índice BM25 gravado antes do ponteiro: a geração nova já entra no ar com ele
+        if changed or not os.path.exists(LEXICAL_INDEX_FILE):
+            lexical = lexical_index.build(chunks, ids, target if blue_green else active["collection"], generation)
+            lexical_index.save(lexical, LEXICAL_INDEX_FILE)
+            print(f"🔤 Índice lexical: {len(ids)} documentos, {len(lexical['postings'])} termos.")
+        if blue_green:
+            set_active_generation(target, generation)
+            # A geração anterior fica para consultas que já estavam em andamento; a seguinte a remove
+            garbage_collect_generations(vector_store._client, keep={target, active["collection"]})
+        elif changed:
+            # Delta aplicado no lugar: nova geração lógica (invalida caches), mesma coleção
+            set_active_generation(active["collection"], generation)
 
-        # Gravação no Banco
-        print(f"Gravando novos dados no ChromaDB...")
-        vector_store.add_documents(chunks)
+        cache_stats = get_embeddings().stats()
+        print(f"Cache de embeddings: {cache_stats['hits']} hits / {cache_stats['misses']} chamadas à API.")
+        update_embedding_cache_status(cache_stats)
         
         # --- RELATÓRIO FINAL ---
         if total_products_detected > 0:
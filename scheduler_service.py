@@ -1,130 +1,283 @@
-# scheduler_service.py - VERSÃO V22 (DECIFRADOR ATOM / GOOGLE MERCHANT)
+# scheduler_service.py - VERSÃO V23 (MULTI-FEED: REGISTRO NO BANCO + DOWNLOADS PARALELOS)
 import os
+import json
+import hashlib
 import requests
 import shutil
 import logging
-import xml.etree.ElementTree as ET
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from apscheduler.schedulers.background import BackgroundScheduler
-from rag_manager import process_knowledge_base, update_feed_status
+from rag_manager import process_knowledge_base, update_feed_status, no_progress
+from feed_parser import iter_products, feed_digest
+import database
+import job_tracker
+import price_index
+import category_index
 
 # --- Configurações ---
-FEED_URL = "https://www.everpetzstore.com.br/api/v1/google-shopping"
+FEED_URL = "https://www.everpetzstore.com.br/api/v1/google-shopping" # Feed principal (semeado no registro)
 KNOWLEDGE_BASE_DIR = "knowledge_base"
-TARGET_FILE = os.path.join(KNOWLEDGE_BASE_DIR, "feed_produtos_everpetz.txt")
-TEMP_XML = os.path.join(KNOWLEDGE_BASE_DIR, "temp_google_shopping.xml")
+LOCAL_FEED_XML = "google-shopping.xml" # Cópia local montada pelo docker-compose
+# Estado do feed único da V22 (ETag/Last-Modified/digest); migrado para a tabela feeds
+FEED_STATE_FILE = os.path.join(KNOWLEDGE_BASE_DIR, "feed_state.json")
+FEED_MAX_WORKERS = int(os.environ.get("FEED_MAX_WORKERS", "4")) # Downloads simultâneos
+FEED_TICK_MINUTES = int(os.environ.get("FEED_TICK_MINUTES", "5")) # De quanto em quanto tempo procura feeds vencidos
+FEED_TIMEOUT = (10, 120) # (conexão, leitura): um fornecedor lento não segura o pool para sempre
+DOWNLOAD_CHUNK_SIZE = 64 * 1024 # Blocos do download em streaming (memória constante)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def clean_tag_name(tag):
-    """Remove o namespace chato (ex: {http://...}title -> title)"""
-    if '}' in tag:
-        return tag.split('}', 1)[1]
-    return tag
+# Downloads rodam em paralelo; a gravação no catálogo (SQLite, um escritor) é um feed por vez
+_catalog_lock = threading.Lock()
 
-def convert_xml_to_clean_txt(xml_path, txt_path):
+def load_feed_state():
+    """Lê ETag/Last-Modified/digest salvos pela V22 (feed único)."""
+    if os.path.exists(FEED_STATE_FILE):
+        try:
+            with open(FEED_STATE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Erro ao ler estado do feed: {e}")
+    return {}
+
+def temp_xml_path(feed):
+    return os.path.join(KNOWLEDGE_BASE_DIR, f"temp_feed_{feed['id']}.xml")
+
+def stream_to_file(response, path):
+    """
+    Grava o corpo da resposta em disco bloco a bloco (gzip/deflate já descomprimidos
+    pelo requests) e calcula o sha256 no caminho. Retorna (hash, bytes).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as f:
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            if not chunk: continue
+            f.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+def prefixed(records, prefix):
+    """Namespace do g:id por feed (sellers diferentes podem repetir ids)."""
+    for record in records:
+        if prefix: record["id"] = f"{prefix}{record['id']}"
+        yield record
+
+# --- REGISTRO DE FEEDS ---
+
+def seed_feed_registry():
+    """
+    Garante o feed principal no registro (migrando o estado da V22) e
+    cadastra a URL configurada no painel, se houver.
+    """
+    primary = database.get_feed_by_url(FEED_URL)
+    if not primary:
+        primary = database.add_feed("Everpetz (Google Shopping)", FEED_URL, interval_minutes=1440, primary=True)
+        legacy = load_feed_state()
+        if legacy:
+            database.update_feed_record(primary["id"], etag=legacy.get("etag", ""), last_modified=legacy.get("last_modified", ""), digest=legacy.get("digest", ""))
+        logger.info(f"📚 Feed principal registrado (id {primary['id']}).")
+
+    # Catálogo anterior ao registro pertence ao feed principal
+    orphans = database.assign_orphan_products(primary["id"])
+    if orphans: logger.info(f"📚 {orphans} produtos atribuídos ao feed principal.")
+
+    panel_url = database.get_setting("product_feed_url")
+    if panel_url and panel_url != FEED_URL:
+        database.add_feed("Feed configurado no painel", panel_url)
+    return primary
+
+def import_feed_to_catalog(xml_path, feed=None, progress=None):
     """
     V22: Suporte Total para formato ATOM (<entry>) e RSS (<item>).
+    Leitura em streaming direto para o catálogo (tabela products), sem TXT intermediário.
+    Com `feed`, só os produtos daquele feed são substituídos.
     """
+    progress = progress or no_progress
+    profile = feed["parser_profile"] if feed else "google_shopping"
     try:
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
-        
-        products_count = 0
-        
-        with open(txt_path, 'w', encoding='utf-8') as f:
-            # Tenta encontrar itens (RSS) ou entradas (ATOM)
-            # A busca é feita por qualquer tag que termine com 'item' ou 'entry'
-            all_elements = root.findall('.//*')
-            product_nodes = [
-                el for el in all_elements 
-                if clean_tag_name(el.tag).lower() in ['item', 'entry']
-            ]
-            
-            for node in product_nodes:
-                # Dicionário padrão
-                data = {
-                    "title": "Produto",
-                    "price": "Consulte",
-                    "image": "",
-                    "link": "",
-                    "description": ""
-                }
-                
-                # Varre os filhos do nó (Força Bruta Inteligente)
-                for child in node:
-                    tag = clean_tag_name(child.tag).lower()
-                    text = child.text.strip() if child.text else ""
-                    
-                    if 'title' in tag:
-                        data['title'] = text
-                    
-                    elif 'price' in tag:
-                        data['price'] = text
-                        
-                    elif 'image_link' in tag or 'image' in tag:
-                        data['image'] = text
-                        
-                    elif 'description' in tag or 'summary' in tag:
-                        clean_desc = text.replace('<div', '').replace('</div>', '').replace('>', '').replace('<', '')
-                        data['description'] = clean_desc[:600]
-                    
-                    elif tag == 'link':
-                        # Link pode ser texto (<g:link>...) ou atributo (<link href=...>)
-                        if text:
-                            data['link'] = text
-                        elif child.attrib.get('href'):
-                            data['link'] = child.attrib.get('href')
-
-                # Validação: Só grava se tiver Link válido
-                if data['link'] and "http" in data['link']:
-                    f.write(f"Title: {data['title']}\n")
-                    f.write(f"Price: {data['price']}\n")
-                    f.write(f"Image: {data['image']}\n")
-                    f.write(f"Link: {data['link']}\n")
-                    f.write(f"Description: {data['description']}\n")
-                    f.write("---\n") # Separador Padrão V17
-                    
-                    products_count += 1
-
+        progress("Importando catálogo")
+        with _catalog_lock:
+            products_count = database.save_catalog(
+                prefixed(iter_products(xml_path, profile), feed["id_prefix"] if feed else ""),
+                on_batch=lambda saved: progress("Importando catálogo", saved),
+                feed_id=feed["id"] if feed else None,
+            )
+            if products_count:
+                try:
+                    category_index.rebuild()
+                except Exception as e:
+                    logger.error(f"Erro ao montar a árvore de categorias: {e}")
+        price_index.invalidate()
+        if products_count == 0:
+            return False, "Erro na conversão V22: 0 produtos com link válido."
         return True, f"V22 Sucesso: {products_count} produtos extraídos do formato ATOM/RSS."
-        
+
     except Exception as e:
         return False, f"Erro na conversão V22: {str(e)}"
 
-def download_and_update_feed():
-    logger.info("🤖 Scheduler V22: Baixando feed Atom...")
-    update_feed_status("processing", "Baixando e decifrando Feed Atom...", 0)
+def refresh_feed(feed, force=False):
+    """
+    Atualiza UM feed: requisição condicional (ETag / Last-Modified), download em streaming
+    para o disco (hash dos bytes no caminho) e digest dos produtos.
+    Só grava no catálogo se algo mudou. Retorna (sucesso, mensagem, mudou, estado).
+    Não re-indexa: quem chama junta os feeds alterados numa indexação só. Por isso o estado
+    (digest, hash, ETag/Last-Modified) de um feed alterado NÃO é gravado aqui: volta em `estado`
+    e o run_feeds grava depois da indexação. Se ela falhar, o próximo ciclo não recebe
+    "Sem alterações" (304/hash/digest) e importa + indexa de novo.
+    """
+    name = feed["name"]
+    temp_xml = temp_xml_path(feed)
+    logger.info(f"🤖 Feed '{name}': baixando {feed['url']}...")
+    database.update_feed_record(feed["id"], last_status="processing", last_run_at=datetime.utcnow())
 
     try:
         if not os.path.exists(KNOWLEDGE_BASE_DIR): os.makedirs(KNOWLEDGE_BASE_DIR)
 
-        # 1. Download
-        headers = {'User-Agent': 'BobAgent/1.0'}
-        response = requests.get(FEED_URL, headers=headers, timeout=60)
-        if response.status_code != 200: raise Exception(f"Erro HTTP {response.status_code}")
+        # Feed sem produtos no catálogo: não dá para pular nada, baixa tudo de novo
+        if force or database.count_products(feed["id"]) == 0:
+            feed = {**feed, "etag": "", "last_modified": "", "digest": "", "content_hash": ""}
+
+        # 1. Download (condicional, comprimido, em streaming direto para o disco)
+        headers = {'User-Agent': 'BobAgent/1.0', 'Accept-Encoding': 'gzip, deflate'}
+        if feed["etag"]: headers['If-None-Match'] = feed["etag"]
+        if feed["last_modified"]: headers['If-Modified-Since'] = feed["last_modified"]
+
+        with requests.get(feed["url"], headers=headers, timeout=FEED_TIMEOUT, stream=True) as response:
+            if response.status_code == 304:
+                logger.info(f"✅ Feed '{name}' sem alterações (HTTP 304).")
+                database.update_feed_record(feed["id"], last_status="active", last_message="Sem alterações (HTTP 304).")
+                return True, "Sem alterações (HTTP 304).", False, None
+            if response.status_code != 200: raise Exception(f"Erro HTTP {response.status_code}")
 
-        with open(TEMP_XML, 'w', encoding='utf-8') as f:
-            f.write(response.text)
+            validators = {
+                "etag": response.headers.get("ETag", ""),
+                "last_modified": response.headers.get("Last-Modified", ""),
+            }
+            content_hash, size = stream_to_file(response, temp_xml)
+        logger.info(f"📥 Feed '{name}': {size / (1024 * 1024):.1f} MB baixados ({response.headers.get('Content-Encoding', 'sem compressão')}).")
 
-        # 2. Conversão
-        success, msg = convert_xml_to_clean_txt(TEMP_XML, TARGET_FILE)
+        # 2a. Mesmos bytes da última vez? Nem precisa parsear
+        if content_hash == feed["content_hash"]:
+            logger.info(f"✅ Feed '{name}': arquivo idêntico à última execução.")
+            database.update_feed_record(feed["id"], last_status="active", last_message="Sem alterações no arquivo.", **validators)
+            return True, "Sem alterações no arquivo.", False, None
+
+        # 2b. Mesmos produtos da última vez? Mantém o que está no catálogo
+        digest, count = feed_digest(temp_xml, feed["parser_profile"])
+        if digest == feed["digest"]:
+            logger.info(f"✅ Feed '{name}': produtos idênticos à última execução.")
+            database.update_feed_record(feed["id"], last_status="active", last_message="Sem alterações nos produtos.", content_hash=content_hash, **validators)
+            return True, "Sem alterações nos produtos.", False, None
+
+        # 3. Conversão direto para o catálogo (só os produtos deste feed)
+        success, msg = import_feed_to_catalog(temp_xml, feed)
         if not success: raise Exception(msg)
-            
-        logger.info(f"✅ {msg}")
+        logger.info(f"✅ Feed '{name}': {msg}")
 
-        # 3. Limpeza
-        if os.path.exists(TEMP_XML): os.remove(TEMP_XML)
+        summary = f"{count} produtos."
+        database.update_feed_record(feed["id"], last_message=f"{summary} Aguardando indexação.")
+        return True, summary, True, {"last_status": "active", "last_message": summary, "summary": summary, "digest": digest, "content_hash": content_hash, **validators}
 
-        # 4. Re-Indexação
-        process_knowledge_base()
-        
     except Exception as e:
-        logger.error(f"❌ Falha: {e}")
-        update_feed_status("error", f"Falha V22: {str(e)}", 0)
+        logger.error(f"❌ Feed '{name}': {e}")
+        database.update_feed_record(feed["id"], last_status="error", last_message=f"Falha: {str(e)}")
+        return False, f"Falha: {str(e)}", False, None
+
+    finally:
+        # 4. Limpeza
+        if os.path.exists(temp_xml): os.remove(temp_xml)
+
+def commit_feed_states(states, indexed):
+    """
+    Depois da indexação: grava digest/hash/validadores dos feeds que entraram nela.
+    Se falhou, nada disso é gravado e o feed volta a vencer no próximo tick (last_run_at vazio),
+    em vez de esperar o intervalo inteiro com SQLite e Chroma fora de sincronia.
+    """
+    for feed_id, state in states.items():
+        if indexed:
+            database.update_feed_record(feed_id, **state)
+        else:
+            database.update_feed_record(feed_id, last_status="error", last_run_at=None, last_message="Catálogo importado, mas a indexação falhou: tenta de novo no próximo ciclo.")
+
+def run_feeds(feeds, force=False, progress=None):
+    """
+    Atualiza vários feeds num pool limitado (FEED_MAX_WORKERS).
+    Assim que um feed muda, o catálogo é re-indexado sem esperar os mais lentos;
+    feeds que terminam durante uma indexação entram juntos na próxima.
+    Retorna (sucesso, mensagem) para o job_tracker.
+    """
+    progress = progress or no_progress
+    if not feeds: return True, "Nenhum feed para atualizar."
+
+    update_feed_status("processing", f"Atualizando {len(feeds)} feed(s)...", 0)
+    failures, changed = [], []
+    consumed = set()
+    pending_states = {} # feed id -> estado que só vale depois da indexação
+    reindex_ok = True
+
+    with ThreadPoolExecutor(max_workers=FEED_MAX_WORKERS) as pool:
+        futures = {pool.submit(refresh_feed, feed, force): feed for feed in feeds}
+        progress("Baixando feeds", 0, len(feeds))
+        for future in as_completed(futures):
+            consumed.add(future)
+            feed = futures[future]
+            success, msg, feed_changed, state = future.result()
+            if not success: failures.append(f"{feed['name']}: {msg}")
+            if feed_changed:
+                changed.append(feed["name"])
+                pending_states[feed["id"]] = state
+            progress("Baixando feeds", len(consumed), len(feeds))
+
+            # Outros feeds já terminaram? Junta todos numa indexação só
+            if any(f.done() and f not in consumed for f in futures):
+                continue
+            if pending_states:
+                # O pool continua baixando os feeds lentos enquanto isso
+                indexed = process_knowledge_base(progress=progress)
+                reindex_ok = indexed and reindex_ok
+                commit_feed_states(pending_states, indexed)
+                pending_states = {}
+
+    if not changed:
+        detail = "; ".join(failures) if failures else "Sem alterações nos feeds."
+        update_feed_status("error" if failures else "active", f"{database.count_products()} Produtos. {detail}", 0)
+    elif failures:
+        logger.warning(f"⚠️ Feeds com falha: {'; '.join(failures)}")
+
+    message = f"{len(feeds) - len(failures)}/{len(feeds)} feeds atualizados ({len(changed)} com mudanças)."
+    if failures: message += f" Falhas: {'; '.join(failures)}"
+    if not reindex_ok: message += " A indexação falhou (ver status)."
+    return reindex_ok and not failures, message
+
+def download_and_update_feed(force=False, progress=None):
+    """Atualiza todos os feeds habilitados (independente da agenda de cada um)."""
+    return run_feeds(database.get_feeds(enabled_only=True), force=force, progress=progress)
+
+def run_due_feeds():
+    """Tick do scheduler: roda, como job rastreado, só os feeds cujo intervalo venceu."""
+    due = database.get_due_feeds()
+    if not due: return
+    label = f"Atualização automática ({len(due)} feed(s))"
+    success, msg, job_id = job_tracker.run_job("feed", label, run_feeds, due)
+    logger.info(f"🕒 Job {job_id}: {msg}")
+
+def seed_catalog_if_empty():
+    """Primeira subida (ou migração do TXT antigo): carrega o catálogo a partir do XML local."""
+    if database.count_products() == 0 and os.path.exists(LOCAL_FEED_XML):
+        primary = database.get_feed_by_url(FEED_URL)
+        success, msg = import_feed_to_catalog(LOCAL_FEED_XML, primary)
+        logger.info(f"📦 Catálogo inicial a partir de {LOCAL_FEED_XML}: {msg}")
 
 def start_scheduler():
+    seed_feed_registry()
+    seed_catalog_if_empty()
     scheduler = BackgroundScheduler()
-    scheduler.add_job(download_and_update_feed, 'cron', hour=3, minute=0)
+    # Uma execução por vez: se a anterior ainda roda, o tick é pulado (os feeds continuam vencidos)
+    scheduler.add_job(run_due_feeds, 'interval', minutes=FEED_TICK_MINUTES, max_instances=1, coalesce=True)
     scheduler.start()
-    logger.info("🕒 Scheduler V22 iniciado.")
\ No newline at end of file
+    logger.info(f"🕒 Scheduler V23 iniciado ({len(database.get_feeds(enabled_only=True))} feeds, até {FEED_MAX_WORKERS} em paralelo).")
@@ -0,0 +1,12 @@
+# conftest.py - TESTES OFFLINE (sem OpenAI, sem o banco de produção)
+# Os módulos ficam na raiz do repositório; o database lê DATABASE_FILE na importação,
+# então o banco temporário precisa estar no ambiente antes de qualquer import.
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("DATABASE_FILE", os.path.join(tempfile.mkdtemp(prefix="bob_tests_"), "bob_test.sqlite"))
+os.environ.setdefault("OPENAI_API_KEY", "fake")
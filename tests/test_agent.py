@@ -0,0 +1,22 @@
+# test_agent.py - ORDEM DOS ATALHOS (SEM LLM)
+from langchain_core.documents import Document
+
+import agent
+import rag_manager
+
+def make_agent():
+    return agent.EverpetzAgent.__new__(agent.EverpetzAgent) # Sem chains: só os atalhos
+
+def test_lexical_hit_wins_over_browse(monkeypatch):
+    simparic = [Document(page_content="Simparic 10mg", metadata={"title": "Simparic 10mg"})]
+    monkeypatch.setattr(rag_manager, "lexical_fast_path", lambda query, constraints=None, k=10: simparic)
+    bob = make_agent()
+    monkeypatch.setattr(bob, "browse_docs", lambda query, has_history: [Document(page_content="Catálogo > Saúde")])
+    assert bob.shortcut_docs("simparic", []) is simparic
+
+def test_browse_when_no_lexical_hit(monkeypatch):
+    showcase = [Document(page_content="Catálogo > Brinquedos")]
+    monkeypatch.setattr(rag_manager, "lexical_fast_path", lambda query, constraints=None, k=10: None)
+    bob = make_agent()
+    monkeypatch.setattr(bob, "browse_docs", lambda query, has_history: showcase)
+    assert bob.shortcut_docs("brinquedos para gato", []) is showcase
@@ -0,0 +1,28 @@
+# test_category_index.py - O QUE CONTA COMO NAVEGAÇÃO NA VITRINE
+import category_index
+import query_filters
+
+def test_brand_name_is_not_a_browse_request():
+    assert category_index.browse_request("simparic") is None
+    assert category_index.browse_request("nexgard para cachorro") is None
+    assert category_index.browse_request("bravecto") is None
+
+def test_type_words_are_browse_requests():
+    species, kind, constraints = category_index.browse_request("antipulgas para cachorro")
+    assert (species, kind) == ("cachorro", "saude")
+    species, kind, constraints = category_index.browse_request("brinquedos para gato até R$50")
+    assert (species, kind, constraints["max_price"]) == ("gato", "brinquedo", 50.0)
+
+def test_brands_do_not_change_product_type():
+    # O tipo vem da categoria/título: tirar as marcas do vocabulário não muda a classificação
+    record = {"title": "Nexgard Combo Gatos 2,5kg à 7,5kg 1 pipeta 0,9ml", "category": "Animais > Suprimentos para gatos"}
+    assert query_filters.product_type(record) == "saude"
+    assert query_filters.detect_types("simparic") == set()
+
+def test_follow_up_without_species_goes_to_the_rewrite():
+    # Com histórico, "e brinquedos?" depende do pet da conversa: não é a vitrine de todas as espécies
+    assert category_index.browse_request("e brinquedos?", has_history=True) is None
+    assert category_index.browse_request("e para gatos?", has_history=True) is None
+    species, kind, constraints = category_index.browse_request("brinquedos para gato", has_history=True)
+    assert (species, kind) == ("gato", "brinquedo")
+    assert category_index.browse_request("e brinquedos?")[:2] == (None, "brinquedo") # Primeira pergunta: vitrine geral
@@ -0,0 +1,38 @@
+# test_context_packer.py - CONTEXTO DO PROMPT POR RELEVÂNCIA DENTRO DO ORÇAMENTO
+import json
+
+import pytest
+
+import context_packer
+
+@pytest.fixture(autouse=True)
+def offline_token_count(monkeypatch):
+    monkeypatch.setattr(context_packer, "_encoding", False) # Estimativa: sem baixar o vocabulário do tiktoken
+
+def product(name):
+    return {"tipo": "PRODUTO", "nome": name, "preco": "10.00 BRL", "link": f"https://loja.example.com/{name}"}
+
+def test_low_relevance_is_dropped_but_best_item_stays():
+    packed = json.loads(context_packer.pack([(product("a"), "coleira azul", 0.1), (product("b"), "bola", 0.05)]))
+    assert [item["nome"] for item in packed] == ["a"]
+    packed = json.loads(context_packer.pack([(product("a"), "coleira", 0.9), (product("b"), "bola", 0.05), (product("c"), "cama", None)]))
+    assert [item["nome"] for item in packed] == ["a", "c"] # None (atalho, BM25) não é filtrado
+
+def test_near_duplicates():
+    text = "Simparic antipulgas comprimido mastigável para cães proteção de 35 dias contra pulgas e carrapatos"
+    packed = json.loads(context_packer.pack([
+        (product("simparic-10"), text, 0.9),
+        (product("simparic-40"), text, 0.8),
+        ({"tipo": "INFO"}, "Trocas em até 7 dias", 0.7),
+        ({"tipo": "INFO"}, "Trocas em até 7 dias", 0.6),
+    ]))
+    assert [item.get("nome", item["tipo"]) for item in packed] == ["simparic-10", "simparic-40", "INFO"]
+    assert "descricao" in packed[0] and "descricao" not in packed[1] # Variação entra só com preço/link
+
+def test_budget_and_description_limit():
+    entries = [(product(f"p{i}"), f"descrição longa do produto {i} " * 50, 0.9) for i in range(20)]
+    packed_json = context_packer.pack(entries, budget=300)
+    assert context_packer.count_tokens(packed_json) <= 300
+    packed = json.loads(packed_json)
+    assert 0 < len(packed) < 20
+    assert context_packer.count_tokens(packed[0]["descricao"]) <= context_packer.PRODUCT_DESCRIPTION_TOKENS + 1
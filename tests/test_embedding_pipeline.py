@@ -0,0 +1,69 @@
+# test_embedding_pipeline.py - LIMITE ADAPTATIVO CONTRA O SERVIDOR FALSO (429 + Retry-After)
+import threading
+
+import pytest
+from langchain_openai import OpenAIEmbeddings
+
+import embedding_pipeline
+import fake_embedding_server
+from embedding_pipeline import AdaptiveLimiter
+
+DIM = 8
+
+@pytest.fixture
+def embeddings_server():
+    """Servidor falso que aceita 2 requisições por segundo e responde 429 acima disso."""
+    server = fake_embedding_server.serve(port=0, dim=DIM, max_rps=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/v1"
+    server.shutdown()
+    server.server_close()
+
+def make_embeddings(base_url):
+    # max_retries=0: quem trata o 429 é o embed_batch, como na indexação
+    return OpenAIEmbeddings(model="fake", base_url=base_url, api_key="fake", check_embedding_ctx_length=False, max_retries=0)
+
+def test_limiter_halves_on_429_and_recovers():
+    limiter = AdaptiveLimiter(8)
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(throttled=True)
+    assert limiter.limit == 1.0
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert limiter.limit == 1.0 # Nunca abaixo de um lote em voo
+
+    for _ in range(50):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.limit == 8.0 # Sucessos devolvem a concorrência até o máximo
+
+def test_embed_batch_backs_off_on_429(embeddings_server, monkeypatch):
+    waits = []
+    monkeypatch.setattr(embedding_pipeline, "retry_after_seconds", lambda error, attempt: waits.append(error) or 0.6)
+    embeddings = make_embeddings(embeddings_server)
+    limiter = AdaptiveLimiter(4)
+
+    texts = ["ração para gato", "coleira"]
+    results = [embedding_pipeline.embed_batch(embeddings, texts, limiter) for _ in range(4)]
+
+    assert waits, "o servidor devia ter respondido 429"
+    assert all(embedding_pipeline.is_rate_limited(error) for error in waits)
+    assert limiter.limit < 4 # Cada 429 cortou o limite
+    assert limiter.in_flight == 0
+    expected = [fake_embedding_server.fake_vector(text, DIM) for text in texts]
+    for vectors in results:
+        assert [[round(v, 6) for v in vector] for vector in vectors] == expected
+
+def test_embed_batch_gives_up_after_max_retries(embeddings_server, monkeypatch):
+    monkeypatch.setattr(embedding_pipeline, "EMBED_MAX_RETRIES", 1)
+    monkeypatch.setattr(embedding_pipeline, "retry_after_seconds", lambda error, attempt: 0)
+    embeddings = make_embeddings(embeddings_server)
+    limiter = AdaptiveLimiter(4)
+
+    with pytest.raises(Exception) as raised:
+        for _ in range(10):
+            embedding_pipeline.embed_batch(embeddings, ["x"], limiter)
+    assert embedding_pipeline.is_rate_limited(raised.value)
+    assert limiter.in_flight == 0
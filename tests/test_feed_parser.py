@@ -0,0 +1,40 @@
+# test_feed_parser.py - XML (ATOM/RSS) -> REGISTROS DO CATÁLOGO, EM STREAMING
+import io
+
+import feed_parser
+
+ATOM = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:g="http://base.google.com/ns/1.0">
+<entry><g:id>1</g:id><g:title>Bola Azul G</g:title><g:description>&lt;div&gt;Brinquedo  &amp;amp; divers\xc3\xa3o&lt;/div&gt;</g:description>
+<g:link>https://loja.example.com/p/1</g:link><g:price>1.234,56 BRL</g:price><g:sale_price>19.90 BRL</g:sale_price>
+<g:custom_label_0>Seller X</g:custom_label_0><g:product_length>10 cm</g:product_length><g:product_width>5 cm</g:product_width><g:product_weight>0.2 kg</g:product_weight></entry>
+<entry><g:id>2</g:id><g:title>Sem link</g:title></entry>
+</feed>"""
+
+RSS = b"""<?xml version="1.0"?><rss xmlns:g="http://base.google.com/ns/1.0"><channel>
+<item><title>Coleira</title><link>https://loja.example.com/p/3</link><g:price>30 BRL</g:price></item>
+</channel></rss>"""
+
+def test_atom_entry_is_normalized():
+    records = list(feed_parser.iter_products(io.BytesIO(ATOM)))
+    assert len(records) == 1 # Item sem link válido fica de fora
+    record = records[0]
+    assert (record["id"], record["title"], record["seller"]) == ("1", "Bola Azul G", "Seller X")
+    assert (record["price"], record["currency"], record["sale_price"]) == (1234.56, "BRL", 19.9)
+    assert record["description"] == "Brinquedo & diversão"
+    assert record["dimensions"] == "10 cm x 5 cm, 0.2 kg"
+
+def test_rss_item_without_id_gets_id_from_link():
+    record = next(feed_parser.iter_products(io.BytesIO(RSS)))
+    assert record["title"] == "Coleira" and record["price"] == 30.0
+    assert len(record["id"]) == 16
+
+def test_digest_ignores_xml_formatting():
+    reformatted = ATOM.replace(b"><g:", b">\n    <g:")
+    assert feed_parser.feed_digest(io.BytesIO(ATOM)) == feed_parser.feed_digest(io.BytesIO(reformatted))
+    changed = ATOM.replace(b"19.90 BRL", b"17.90 BRL")
+    assert feed_parser.feed_digest(io.BytesIO(ATOM))[0] != feed_parser.feed_digest(io.BytesIO(changed))[0]
+
+def test_parse_price_formats():
+    assert feed_parser.parse_price("11.20 BRL") == (11.2, "BRL")
+    assert feed_parser.parse_price("") == (None, "")
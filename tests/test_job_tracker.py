@@ -0,0 +1,51 @@
+# test_job_tracker.py - UM JOB DE INDEXAÇÃO POR VEZ, MESMO COM CLIQUES SIMULTÂNEOS
+import threading
+import time
+
+import diskcache
+import pytest
+
+import job_tracker
+
+@pytest.fixture(autouse=True)
+def job_cache(tmp_path, monkeypatch):
+    cache = diskcache.Cache(str(tmp_path / "job_cache"))
+    monkeypatch.setattr(job_tracker, "_cache", cache)
+    yield cache
+    cache.close()
+
+def test_racing_run_jobs_only_one_runs(monkeypatch):
+    # Alarga a janela entre a verificação e o início: sem a transação, os dois passariam
+    is_busy = job_tracker.is_busy
+    def slow_is_busy():
+        busy = is_busy()
+        time.sleep(0.2)
+        return busy
+    monkeypatch.setattr(job_tracker, "is_busy", slow_is_busy)
+
+    runs = []
+    def index(progress):
+        runs.append(threading.get_ident())
+        time.sleep(0.3)
+        return True, "ok"
+
+    barrier = threading.Barrier(2)
+    results = []
+    def click():
+        barrier.wait()
+        results.append(job_tracker.run_job("index", "Indexação", index))
+    threads = [threading.Thread(target=click) for _ in range(2)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+
+    assert len(runs) == 1
+    assert sorted(success for success, message, job_id in results) == [False, True]
+    refused = next(message for success, message, job_id in results if not success)
+    assert "Já existe um job em andamento" in refused
+
+def test_next_job_runs_after_the_first_finishes():
+    assert job_tracker.run_job("index", "Primeira", lambda progress: True)[0]
+    success, message, job_id = job_tracker.run_job("index", "Segunda", lambda progress: (True, "feito"))
+    assert success and message == "feito"
+    assert job_tracker.get_job(job_id)["status"] == "done"
+    assert not job_tracker.is_busy()
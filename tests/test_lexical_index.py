@@ -0,0 +1,45 @@
+# test_lexical_index.py - ATALHO LEXICAL (BUSCA POR NOME) COM O CATÁLOGO DE EXEMPLO
+import os
+
+import pytest
+from langchain_core.documents import Document
+
+import feed_parser
+import lexical_index
+import query_filters
+
+FIXTURE_FEED = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "google-shopping.xml")
+
+@pytest.fixture(scope="module")
+def index():
+    records = list(feed_parser.iter_products(FIXTURE_FEED))
+    chunks = [Document(page_content=f"{r['title']}\n{r['description'] or ''}", metadata={"title": r["title"]}) for r in records]
+    titles = {r["id"]: r["title"] for r in records}
+    built = lexical_index.build(chunks, [r["id"] for r in records], "teste", 1)
+    built["_titles"] = titles
+    return built
+
+def hit_titles(index, query):
+    hits = lexical_index.confident_hits(index, query)
+    return None if hits is None else [index["_titles"][doc_id] for doc_id in hits]
+
+def test_brand_names_take_the_shortcut(index):
+    for query in ("simparic", "nexgard", "simparic para gato"):
+        titles = hit_titles(index, query)
+        assert titles and all(query.split()[0] in query_filters.fold(title) for title in titles)
+    titles = hit_titles(index, "bravecto 10-20kg")
+    assert titles and "Bravecto 10 a 20kg" in titles[0]
+
+def test_price_and_numbers_are_not_product_names(index):
+    assert hit_titles(index, "ração para gato até R$50") is None
+    assert hit_titles(index, "brinquedo até 50 reais") is None
+    assert hit_titles(index, "50") is None
+
+def test_browse_and_generic_questions_skip_the_shortcut(index):
+    for query in ("antipulgas para cachorro", "ração para cachorro filhote", "qual a política de troca?"):
+        assert hit_titles(index, query) is None
+
+def test_strip_price_keeps_the_rest_of_the_question():
+    assert query_filters.strip_price("Ração para gato até R$50").split() == ["racao", "para", "gato"]
+    assert query_filters.strip_price("Bravecto 10-20kg") == "bravecto 10-20kg" # Peso não é preço
+    assert query_filters.parse_price_range("ração até R$50") == (None, 50.0)
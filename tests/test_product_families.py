@@ -0,0 +1,31 @@
+# test_product_families.py - VARIAÇÕES (TAMANHO, COR, PESO) NA MESMA FAMÍLIA
+from langchain_core.documents import Document
+
+import product_families
+import rag_manager
+
+def family(title, seller="Loja"):
+    return product_families.family_id({"id": title, "title": title, "seller": seller})
+
+def test_title_stem_drops_measures_colors_and_sizes():
+    assert product_families.title_stem("Simparic 10mg 2,6 a 5kg   1 unidade") == "simparic"
+    assert product_families.title_stem("Bola Azul G") == "bola"
+
+def test_variants_share_a_family_per_seller():
+    assert family("Simparic 10mg 2,6 a 5kg 1 unidade") == family("Simparic 80mg 20,1 a 40kg 1 unidade")
+    assert family("Bola Azul G") == family("Bola Vermelha P")
+    assert family("Bola Azul G") != family("Bola Azul G", seller="Outro seller")
+    assert family("Bola Azul G") != family("Corda Azul G")
+    assert product_families.family_id({"id": "x", "title": "10kg"}) == "p:x" # Sem nome: o produto é a família
+
+def test_mmr_returns_one_variant_per_family_first():
+    docs = [(doc_id, Document(page_content=doc_id, metadata={"family_id": family_key})) for doc_id, family_key in
+            (("s10", "simparic"), ("s40", "simparic"), ("s80", "simparic"), ("bravecto", "bravecto"))]
+    vectors = {"s10": [1.0, 0.0], "s40": [0.99, 0.1], "s80": [0.98, 0.2], "bravecto": [0.6, 0.8]}
+    picked = [doc_id for doc_id, doc in rag_manager._mmr(docs, vectors, [1.0, 0.0], 3)]
+    assert picked[:2] == ["s10", "bravecto"]
+    assert picked[2] == "s40" # Poucas famílias: completa com a variação mais relevante
+
+def test_one_per_family_after_fusion():
+    docs = {doc_id: Document(page_content=doc_id, metadata={"family_id": fam}) for doc_id, fam in (("a", "f"), ("b", "f"), ("c", "g"))}
+    assert rag_manager._one_per_family(["a", "b", "c"], docs, 2) == ["a", "c"]
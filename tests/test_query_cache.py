@@ -0,0 +1,40 @@
+# test_query_cache.py - SINGLE-FLIGHT: PERGUNTAS IGUAIS AO MESMO TEMPO, UMA CHAMADA SÓ
+import threading
+import time
+
+import pytest
+
+from query_cache import SingleFlight
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def slow_answer():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "resposta"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("pergunta", slow_answer))) for _ in range(10)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]: thread.start()
+    for thread in threads: thread.join()
+
+    assert len(calls) == 1
+    assert results == ["resposta"] * 10
+    assert flight.coalesced == 9
+
+def test_error_reaches_every_waiter_and_next_call_runs_again():
+    flight = SingleFlight()
+    call, leader = flight.begin("k")
+    follower, is_leader = flight.begin("k")
+    assert leader and not is_leader and follower is call
+
+    flight.finish("k", call, error=RuntimeError("falhou"))
+    with pytest.raises(RuntimeError):
+        flight.wait(follower)
+    assert flight.do("k", lambda: 42) == 42 # A falha não fica guardada
@@ -0,0 +1,39 @@
+# test_query_filters.py - PERGUNTA -> RESTRIÇÕES -> "where" DO CHROMA
+import query_filters
+
+def test_constraints_from_question():
+    assert query_filters.parse_constraints("ração para gato até R$50") == {"species": {"gato"}, "types": {"racao"}, "max_price": 50.0}
+    assert query_filters.parse_constraints("brinquedo entre 20 e 40 reais")["min_price"] == 20.0
+    assert query_filters.parse_constraints("coleira acima de R$ 30") == {"types": {"passeio"}, "min_price": 30.0}
+
+def test_weights_and_ages_are_not_prices():
+    assert query_filters.parse_price_range("ração até 15kg") == (None, None)
+    assert query_filters.parse_price_range("filhote até 3 meses") == (None, None)
+
+def test_where_keeps_generic_products_and_stock():
+    where = query_filters.build_where({"species": {"gato"}, "max_price": 50.0})
+    assert where == {"$and": [
+        {"type": "product"}, {"in_stock": True},
+        {"pet": {"$in": ["gato", query_filters.ALL_PETS]}},
+        {"price_value": {"$lte": 50.0}},
+    ]}
+    assert query_filters.build_where({}) is None
+
+def test_rewrite_adds_species_and_type_but_never_price():
+    merged = query_filters.merge_constraints({"max_price": 50.0}, {"species": {"gato"}, "min_price": 10.0})
+    assert merged == {"max_price": 50.0, "species": {"gato"}}
+
+def test_price_keywords_inside_words_are_not_prices():
+    for question in ("patê 3 sabores para gato", "ração gato sabor tomate 2", "petisco sabor chocolate 50"):
+        assert "max_price" not in query_filters.parse_constraints(question), question
+        assert "min_price" not in query_filters.parse_constraints(question), question
+
+def test_thousands_separator():
+    assert query_filters.parse_constraints("acima de 1.000 reais")["min_price"] == 1000.0
+    assert query_filters.parse_price_range("de R$ 1.234,56 a 2.000") == (1234.56, 2000.0)
+    assert query_filters.parse_price_range("até 49,90") == (None, 49.9)
+
+def test_range_without_currency_on_first_amount():
+    assert query_filters.parse_price_range("ração de 100 a 200 reais") == (100.0, 200.0)
+    assert query_filters.parse_price_range("ração de 100 a R$200") == (100.0, 200.0)
+    assert query_filters.parse_price_range("simparic de 2,6 a 5kg") == (None, None) # Peso, não preço
@@ -0,0 +1,93 @@
+# test_scheduler_service.py - ESTADO DO FEED SÓ É GRAVADO DEPOIS DE INDEXAR
+# Se a indexação falha, o próximo ciclo não pode receber "Sem alterações" (304/hash/digest):
+# tem que importar e indexar de novo, senão SQLite e Chroma ficam fora de sincronia.
+import pytest
+
+import category_index
+import database
+import scheduler_service
+
+FEED_URL = "https://seller.example.com/feed.xml"
+ETAG = '"v1"'
+FEED_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:g="http://base.google.com/ns/1.0">
+<entry><g:id>1</g:id><g:title>Simparic 10mg 2,6 a 5kg 1 unidade</g:title><g:description>Antipulgas</g:description>
+<g:link>https://seller.example.com/p/1</g:link><g:price>87.80 BRL</g:price><g:availability>in stock</g:availability></entry>
+<entry><g:id>2</g:id><g:title>Bola Azul G</g:title><g:description>Brinquedo</g:description>
+<g:link>https://seller.example.com/p/2</g:link><g:price>19.90 BRL</g:price><g:availability>in stock</g:availability></entry>
+</feed>"""
+
+class FakeResponse:
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+def fake_get(url, headers=None, **kwargs):
+    """Servidor do feed: responde 304 quando o cliente manda o ETag atual."""
+    if (headers or {}).get("If-None-Match") == ETAG:
+        return FakeResponse(304)
+    return FakeResponse(200, FEED_XML, {"ETag": ETAG})
+
+@pytest.fixture
+def feed(tmp_path, monkeypatch):
+    database.init_db()
+    monkeypatch.setattr(scheduler_service, "KNOWLEDGE_BASE_DIR", str(tmp_path / "knowledge_base"))
+    monkeypatch.setattr(category_index, "CATEGORY_INDEX_FILE", str(tmp_path / "category_index.json"))
+    monkeypatch.setattr(scheduler_service, "update_feed_status", lambda *args, **kwargs: None)
+    monkeypatch.setattr(scheduler_service.requests, "get", fake_get)
+    record = database.add_feed("Seller de teste", FEED_URL, interval_minutes=1440)
+    yield record
+    database.delete_feed(record["id"])
+
+def install_reindex(monkeypatch, results):
+    """process_knowledge_base falso: devolve os resultados em ordem e conta as chamadas."""
+    calls = []
+    def reindex(progress=None):
+        calls.append(True)
+        return results[len(calls) - 1]
+    monkeypatch.setattr(scheduler_service, "process_knowledge_base", reindex)
+    return calls
+
+def test_failed_reindex_is_retried_on_next_run(feed, monkeypatch):
+    calls = install_reindex(monkeypatch, [False, True])
+
+    success, msg = scheduler_service.run_feeds([database.get_feed(feed["id"])])
+    assert not success
+    assert len(calls) == 1
+    state = database.get_feed(feed["id"])
+    # Nada que faria o próximo ciclo pular o feed foi gravado
+    assert (state["etag"], state["digest"], state["content_hash"]) == ("", "", "")
+    assert state["last_status"] == "error"
+    assert feed["id"] in {f["id"] for f in database.get_due_feeds()} # Vence já no próximo tick
+    assert database.count_products(feed["id"]) == 2
+
+    success, msg = scheduler_service.run_feeds([database.get_feed(feed["id"])])
+    assert success
+    assert len(calls) == 2 # Importou e indexou de novo
+    state = database.get_feed(feed["id"])
+    assert state["etag"] == ETAG
+    assert state["digest"] and state["content_hash"]
+    assert state["last_status"] == "active"
+
+def test_unchanged_feed_skips_reindex_after_success(feed, monkeypatch):
+    calls = install_reindex(monkeypatch, [True])
+
+    assert scheduler_service.run_feeds([database.get_feed(feed["id"])])[0]
+    assert len(calls) == 1
+
+    # Agora sim o ETag vale: 304 e nenhuma indexação
+    success, msg = scheduler_service.run_feeds([database.get_feed(feed["id"])])
+    assert success
+    assert len(calls) == 1
+    assert database.get_feed(feed["id"])["last_message"] == "Sem alterações (HTTP 304)."